@@ -0,0 +1,214 @@
+"""Timing, result files and baseline comparison for the benchmark suite."""
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src")
+SIM_DIR = os.path.join(REPO_DIR, "simulations")
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+for _path in (SRC_DIR, SIM_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# name -> factory returning a zero-argument callable to time
+_REGISTRY: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    """Register a micro-benchmark factory under `name`."""
+    def wrap(factory):
+        _REGISTRY[name] = factory
+        return factory
+    return wrap
+
+
+def registered() -> Dict[str, Callable[[], Callable[[], object]]]:
+    return dict(_REGISTRY)
+
+
+def summarize(samples: List[float], unit: str = "s", **extra) -> Dict:
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "unit": unit,
+        "n": n,
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "min": samples[0],
+        "p90": samples[min(n - 1, int(0.9 * n))],
+        "stdev": statistics.pstdev(samples) if n > 1 else 0.0,
+        **extra,
+    }
+
+
+def time_callable(fn: Callable[[], object], min_time: float = 0.05, repeats: int = 15) -> Dict:
+    """Per-call seconds: calibrate a loop count worth ~min_time, then time `repeats` loops."""
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return summarize(samples, loops=loops)
+
+
+def environment() -> Dict:
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "host": socket.gethostname(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    try:
+        import numpy
+        import cv2
+        env["numpy"] = numpy.__version__
+        env["opencv"] = cv2.__version__
+    except ImportError:
+        pass
+    try:
+        env["commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return env
+
+
+def save_results(path: str, results: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def compare(base: Dict[str, Dict], new: Dict[str, Dict], threshold: float = 0.10) -> List[Dict]:
+    """Compare medians; a benchmark regresses when new > base * (1 + threshold).
+
+    Results with unit "1/s" (throughput) are higher-is-better and compared inversely.
+    """
+    rows = []
+    for name in sorted(set(base) | set(new)):
+        b, n = base.get(name), new.get(name)
+        if b is None or n is None:
+            rows.append({"name": name, "status": "new" if b is None else "missing"})
+            continue
+        bm, nm = b["median"], n["median"]
+        if n.get("unit") == "1/s":
+            bm, nm = nm, bm
+        ratio = nm / bm if bm > 0 else float("inf")
+        if ratio > 1 + threshold:
+            status = "REGRESSION"
+        elif ratio < 1 - threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append({"name": name, "status": status, "base": b["median"], "new": n["median"],
+                     "unit": n.get("unit", "s"), "ratio": ratio})
+    return rows
+
+
+def format_value(value: float, unit: str) -> str:
+    if unit != "s":
+        return f"{value:.4g} {unit}"
+    for scale, suffix in ((1.0, "s"), (1e-3, "ms"), (1e-6, "us")):
+        if value >= scale:
+            return f"{value / scale:.3f} {suffix}"
+    return f"{value / 1e-9:.1f} ns"
+
+
+class TcpSink:
+    """Local TCP server that accepts and drains connections, standing in for the ESP32."""
+
+    def __init__(self):
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        self.received = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with conn:
+                while True:
+                    data = conn.recv(4096)
+                    if not data:
+                        break
+                    self.received += len(data)
+
+    def close(self):
+        self._server.close()
+
+
+class NullSerial:
+    """pyserial-like sink that accepts writes, standing in for the ESP32 serial port."""
+
+    def __init__(self):
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        return len(data)
+
+
+class FakeBox:
+    """Mimics one ultralytics box (xyxy/conf/cls as 1-row arrays)."""
+
+    __slots__ = ("xyxy", "conf", "cls")
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+
+class FakeResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def fake_results(dets, cls_id: int = 2) -> List[FakeResult]:
+    """Wrap an (N,5) detection array as a YOLO result list ("car" by default)."""
+    import numpy as np
+    boxes = [FakeBox(np.asarray(d[:4], dtype=np.float32)[None, :], np.asarray([d[4]], dtype=np.float32),
+                     np.asarray([cls_id], dtype=np.float32)) for d in dets]
+    return [FakeResult(boxes)]
+
+
+def default_baseline_path(suffix: Optional[str] = None) -> str:
+    name = suffix or socket.gethostname()
+    return os.path.join(BASELINE_DIR, f"{name}.json")
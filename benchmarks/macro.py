@@ -0,0 +1,241 @@
+"""Macro benchmark: the main.py frame loop on synthetic frames.
+
+Masking, inference, extraction, tracking and density go through
+src/frame_analysis.py, the same FrameAnalyzer calls main.py makes, and the
+overlay through draw_overlay. Decode is a stand-in for main.py's capture.
+Density is published to a DensityBoard, and ControlLoop.tick() runs inline at
+its 10 Hz rate on simulated time; its ESP32 sends go out on the loop's sender
+threads, as in main.py. Each stage is timed
+separately, so a regression can be traced to its stage. Inference is stubbed
+by default: each frame's synthetic detections are returned as YOLO results,
+so the numbers measure everything around the model. Pass a weights path to
+run the real model.
+"""
+import itertools
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from harness import NullSerial, TcpSink, fake_results, summarize
+from micro import _sort
+from synthetic import FRAME_SIZE, POLYGON, render_frames, synthetic_mask, vehicle_stream
+
+
+class _StageTimes:
+    """Collects raw per-stage durations (exact, unlike the bucketed runtime histograms).
+
+    Passed to FrameAnalyzer in place of the runtime metrics.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.recording = False
+        self._name = ""
+        self._start = 0.0
+
+    def stage(self, name: str):
+        self._name = name
+        return self
+
+    def set_gauge(self, name: str, value: float):
+        pass
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.recording:
+            self.samples[self._name].append(time.perf_counter() - self._start)
+        return False
+
+
+class _ReplayModel:
+    """Stand-in detector: returns the next frame's synthetic detections as YOLO results.
+
+    With `prebuilt`, every frame's result objects are built up front, so they
+    do not count as loop allocations.
+    """
+
+    def __init__(self, stream: List[np.ndarray], prebuilt: bool = False):
+        self.stream = stream
+        self.results = [fake_results(d) for d in stream] if prebuilt else None
+        self.frame = 0
+
+    def __call__(self, img, imgsz=640, **kwargs):
+        i = self.frame
+        self.frame += 1
+        return self.results[i] if self.results is not None else fake_results(self.stream[i])
+
+
+def run_frame_loop(frames: int = 300, warmup: int = 30, n_vehicles: int = 20, model_path: Optional[str] = None,
+                   render: bool = True, fps: int = 30, trace_alloc: bool = False) -> Dict[str, Dict]:
+    """Time the loop per stage; with trace_alloc, measure Python/numpy allocations instead.
+
+    Allocation mode reports, after warm-up, the largest tracemalloc peak of a
+    single frame above the memory held before it (`alloc_peak`), and how far
+    the memory held at the end exceeds the most held at any point in the first
+    half of the run (`alloc_growth`), both in bytes. The track count moves up
+    and down from frame to frame, so a steady state scores about 0 growth,
+    while a per-frame leak still shows. Stage timings are not reported in this
+    mode since tracing slows every call.
+    """
+    Sort = _sort().Sort
+    import esp32
+    from control_loop import ControlLoop, DensityBoard
+    from controller import DynamicTimingController
+    from frame_analysis import FrameAnalyzer
+    from overlay import draw_overlay
+    from scene import build_scene
+    from scheduler import DensityWindow
+
+    stream = vehicle_stream(frames + warmup, n_vehicles=n_vehicles, seed=11)
+    images = render_frames(stream, count=min(32, len(stream)))
+    scene = build_scene(synthetic_mask(), POLYGON, FRAME_SIZE)
+    if model_path:
+        from ultralytics import YOLO
+        yolo = YOLO(model_path)
+        model = lambda img, imgsz: yolo(img, imgsz=imgsz, verbose=False)  # noqa: E731
+    else:
+        model = _ReplayModel(stream, prebuilt=trace_alloc)
+
+    stages = _StageTimes()
+    height, width = images[0].shape[:2]
+    analyzer = FrameAnalyzer(scene, (height, width, 3), DensityWindow(fps * 5),
+                             lambda: Sort(max_age=20, min_hits=3, iou_threshold=0.3), metrics=stages)
+    sim_now = [0.0]
+    controller = DynamicTimingController(clock=lambda: sim_now[0])
+    ser = NullSerial()
+    sink = TcpSink()
+    board = DensityBoard()
+    control_loop = ControlLoop(
+        controller, board,
+        send_status=lambda green_s, red_s, yellow_s, saved_s: esp32.send_status(ser, green_s, red_s, yellow_s,
+                                                                                saved_s, verbose=False),
+        send_command=lambda command: esp32.send_command("127.0.0.1", sink.port, command))
+    next_tick = 0.0
+    frame_buf = np.empty((height, width, 3), dtype=np.uint8)
+    overlay = {}
+    image_cycle = itertools.cycle(images)
+    frame_times = np.zeros(frames)
+    # Preallocated so the measurements themselves are not counted as growth
+    frame_peaks = np.zeros(frames if trace_alloc else 0, dtype=np.int64)
+    frame_held = np.zeros(frames if trace_alloc else 0, dtype=np.int64)
+
+    try:
+        for i in range(len(stream)):
+            stages.recording = i >= warmup and not trace_alloc
+            if trace_alloc and i == warmup:
+                tracemalloc.start()
+            if trace_alloc and i >= warmup:
+                tracemalloc.reset_peak()
+                frame_held[i - warmup] = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            sim_now[0] += 1.0 / fps
+            with stages.stage("decode"):
+                img = frame_buf
+                np.copyto(img, next(image_cycle))
+            detections = analyzer.detect(model, img, 640)
+            avg_density = analyzer.track(detections, i)
+            board.publish(i, analyzer.density, avg_density, analyzer.vehicles_in_polygon)
+            if sim_now[0] >= next_tick:
+                with stages.stage("controller"):
+                    control_loop.tick()
+                next_tick += control_loop.period_s
+            if render:
+                with stages.stage("render"):
+                    # Same overlay inputs main.py fills every frame
+                    overlay["polygon"] = scene.polygon
+                    overlay["tracked_boxes"] = analyzer.tracked_boxes
+                    overlay["vehicles_in_polygon"] = analyzer.vehicles_in_polygon
+                    overlay["density"] = analyzer.density
+                    overlay["avg_density"] = avg_density
+                    status = control_loop.status
+                    overlay["phase"] = status.phase
+                    overlay["seconds_left"] = status.seconds_left
+                    overlay["total_saved"] = status.total_saved
+                    draw_overlay(img, **overlay)
+            if i >= warmup:
+                frame_times[i - warmup] = time.perf_counter() - start
+                if trace_alloc:
+                    frame_peaks[i - warmup] = tracemalloc.get_traced_memory()[1] - frame_held[i - warmup]
+    finally:
+        control_loop.stop()
+        sink.close()
+        if tracemalloc.is_tracing():
+            held_end = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+    label = "yolo" if model_path else "stub"
+    if trace_alloc:
+        growth = max(0, held_end - max(frame_held[:max(1, len(frame_held) // 2)]))
+        return {f"frame_loop[{label}].alloc_peak": summarize([float(max(frame_peaks))], unit="B",
+                                                            median_frame=float(np.median(frame_peaks))),
+                f"frame_loop[{label}].alloc_growth": summarize([float(growth)], unit="B", frames=len(frame_peaks))}
+    results = {f"frame_loop[{label}]": summarize(frame_times.tolist(), frames=len(frame_times)),
+               f"frame_loop[{label}].fps": summarize([1.0 / float(np.median(frame_times))], unit="1/s")}
+    for name, samples in stages.samples.items():
+        results[f"frame_loop[{label}].{name}"] = summarize(samples)
+    return results
+
+
+class _SpinModel:
+    """Stand-in detector that burns a fixed amount of CPU time (holding the GIL) per frame.
+
+    The spin is measured on this thread's CPU clock, not wall time, so workers
+    sharing a core take turns instead of all finishing together.
+    """
+
+    def __init__(self, infer_ms: float):
+        self.infer_s = infer_ms / 1000.0
+
+    def __call__(self, img, stream=True, imgsz=640, **kwargs):
+        end = time.thread_time() + self.infer_s
+        while time.thread_time() < end:
+            pass
+        return []
+
+
+def run_pipeline_scaling(worker_counts=(1, 2, 4), frames: int = 300, infer_ms: float = 30.0,
+                         model_path: Optional[str] = None) -> Dict[str, Dict]:
+    """Frames per second of src/mp_pipeline.py per inference worker count, on a synthetic video."""
+    import functools
+    import os
+    import tempfile
+    from mp_pipeline import FramePipeline, load_yolo
+
+    Sort = _sort().Sort
+    stream = vehicle_stream(frames, seed=11)
+    images = render_frames(stream, count=min(32, len(stream)))
+    mask = synthetic_mask()
+    factory = functools.partial(load_yolo, model_path) if model_path else functools.partial(_SpinModel, infer_ms)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        video = os.path.join(tmp, "synthetic.avi")
+        writer = cv2.VideoWriter(video, cv2.VideoWriter_fourcc(*"MJPG"), 30, FRAME_SIZE)
+        for i in range(frames):
+            writer.write(images[i % len(images)])
+        writer.release()
+
+        for workers in worker_counts:
+            pipeline = FramePipeline(video, images[0].shape, mask, factory, workers=workers)
+            tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
+            pipeline.start()
+            try:
+                # The first frame also covers process start and model loading
+                first = pipeline.next(timeout=120.0)
+                start = time.perf_counter()
+                count = 0
+                while first is not None:
+                    tracker.update(stream[first[0]])
+                    count += 1
+                    first = pipeline.next()
+                wall = time.perf_counter() - start
+            finally:
+                pipeline.close()
+            results[f"pipeline[workers={workers}].fps"] = summarize([(count - 1) / wall], unit="1/s")
+    return results
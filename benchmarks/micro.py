@@ -0,0 +1,178 @@
+"""Micro-benchmarks of the per-frame building blocks.
+
+Each factory does its setup once and returns the callable that is timed.
+"""
+import functools
+import itertools
+
+import numpy as np
+
+from harness import NullSerial, TcpSink, benchmark, fake_results
+from synthetic import FRAME_SIZE, POLYGON, synthetic_mask, vehicle_stream
+
+
+def _sort():
+    # sort.py selects the TkAgg backend at import; benchmarks never draw
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import sort
+    return sort
+
+
+def _boxes(n: int, seed: int) -> np.ndarray:
+    return vehicle_stream(1, n_vehicles=n, seed=seed)[0][:n]
+
+
+@benchmark("sort.iou_batch[20x20]")
+def bench_iou_batch_small():
+    iou_batch = _sort().iou_batch
+    a, b = _boxes(20, 1), _boxes(20, 2)
+    return lambda: iou_batch(a, b)
+
+
+@benchmark("sort.iou_batch[100x100]")
+def bench_iou_batch_large():
+    iou_batch = _sort().iou_batch
+    a, b = _boxes(100, 1), _boxes(100, 2)
+    return lambda: iou_batch(a, b)
+
+
+@benchmark("sort.associate[20x20]")
+def bench_associate():
+    associate = _sort().associate_detections_to_trackers
+    stream = vehicle_stream(2, n_vehicles=20, seed=3)
+    dets, trks = stream[1], stream[0]
+    return lambda: associate(dets, trks, 0.3)
+
+
+@benchmark("sort.update[20 vehicles]")
+def bench_sort_update():
+    sort = _sort()
+    stream = vehicle_stream(600, n_vehicles=20, seed=4)
+    tracker = sort.Sort(max_age=20, min_hits=3, iou_threshold=0.3)
+    # Warm the tracker up so every timed call sees a steady-state track set
+    for dets in stream[:100]:
+        tracker.update(dets)
+    frames = itertools.cycle(stream[100:])
+    return lambda: tracker.update(next(frames))
+
+
+@benchmark("detection.extract[20 boxes]")
+def bench_extract():
+    from detection import extract_vehicle_detections
+    results = fake_results(vehicle_stream(1, n_vehicles=20, seed=5)[0])
+    return lambda: extract_vehicle_detections(results)
+
+
+@benchmark("scene.intersection_reference[1 box]")
+def bench_intersection_reference():
+    from scene import calculate_bbox_polygon_intersection_area
+    polygon = np.array(POLYGON, np.int32)
+    shape = (FRAME_SIZE[1], FRAME_SIZE[0])
+    return lambda: calculate_bbox_polygon_intersection_area((600, 300, 760, 420), polygon, shape)
+
+
+@benchmark("scene.bbox_area_in_polygon[20 boxes]")
+def bench_bbox_area():
+    from scene import build_scene
+    scene = build_scene(synthetic_mask(), POLYGON, FRAME_SIZE)
+    boxes = _boxes(20, 6).astype(int)[:, :4].tolist()
+
+    def run():
+        for x1, y1, x2, y2 in boxes:
+            scene.bbox_area_in_polygon(x1, y1, x2, y2)
+    return run
+
+
+@benchmark("scene.build[1280x720]")
+def bench_build_scene():
+    from scene import build_scene
+    mask = synthetic_mask()
+    return lambda: build_scene(mask, POLYGON, FRAME_SIZE)
+
+
+@benchmark("controller.tick")
+def bench_controller_tick():
+    from controller import DynamicTimingController
+    now = [0.0]
+    controller = DynamicTimingController(clock=lambda: now[0])
+    densities = itertools.cycle(np.random.default_rng(7).uniform(0.0, 0.9, 997).tolist())
+
+    def tick():
+        # One frame at 30 FPS, as in the main loop
+        now[0] += 1 / 30
+        if controller.phase == 'GREEN':
+            controller.maybe_apply_rules(next(densities))
+        controller.advance_phase_if_due()
+        return controller.get_phase_and_times()
+    return tick
+
+
+@benchmark("esp32.send_status[serial stub]")
+def bench_send_status():
+    import esp32
+    ser = NullSerial()
+    return lambda: esp32.send_status(ser, 42, 60, 5, 12, verbose=False)
+
+
+@benchmark("esp32.send_command[tcp localhost]")
+def bench_send_command():
+    import esp32
+    sink = TcpSink()
+    return lambda: esp32.send_command("127.0.0.1", sink.port, "C42")
+
+
+@benchmark("sim.vehicle_engine.step[4000 vehicles]")
+def bench_vehicle_engine():
+    from vehicle_engine import VehicleEngine
+    size, lane = 800, 35
+    top, bottom, left, right = size // 2 - lane * 2, size // 2 + lane * 2, size // 2 - lane * 2, size // 2 + lane * 2
+    lanes = {'E': [top + lane * 0.5, top + lane * 1.5], 'W': [bottom - lane * 0.5, bottom - lane * 1.5],
+             'S': [left + lane * 0.5, left + lane * 1.5], 'N': [right - lane * 0.5, right - lane * 1.5]}
+    stops = {'E': left, 'W': right, 'S': top, 'N': bottom}
+    engine = VehicleEngine(1000, lanes, stops, (size, size), spawn_range=(150.0, 60000.0), seed=1)
+    phases = itertools.cycle(['N'] * 300 + ['E'] * 300 + ['S'] * 300 + ['W'] * 300)
+    return lambda: engine.step(next(phases), False)
+
+
+def _static_sim():
+    import importlib.util
+    import os
+    from harness import SIM_DIR
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    spec = importlib.util.spec_from_file_location("traffic_simulation_static",
+                                                  os.path.join(SIM_DIR, "traffic_simulation(static).py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _static_updates(n_vehicles: int, all_pairs: bool):
+    """100 Vehicle.update calls of the static simulation among n_vehicles.
+
+    Vehicles are spread along their lanes over the whole world, so a full tick
+    costs n_vehicles / 100 times the reported time.
+    """
+    import random
+    sim = _static_sim()
+    random.seed(n_vehicles)
+    vehicles = [sim.Vehicle(d) for d in ['N', 'E', 'S', 'W'] for _ in range(n_vehicles // 4)]
+    lo, hi = -sim.RESET_BUFFER + 1, sim.WIDTH + sim.RESET_BUFFER - 1
+    for v in vehicles:
+        if v.direction in ('E', 'W'):
+            v.x = random.uniform(lo, hi)
+        else:
+            v.y = random.uniform(lo, hi)
+    index = None if all_pairs else sim.build_index(vehicles)
+    order = itertools.cycle(vehicles)
+
+    def run():
+        for _ in range(100):
+            next(order).update(vehicles, index)
+    return run
+
+
+for _n in (100, 1000, 10000):
+    for _mode in ("all-pairs", "spatial-hash"):
+        benchmark(f"sim.static.update[{_mode}, {_n} vehicles, 100 updates]")(
+            functools.partial(_static_updates, _n, _mode == "all-pairs"))
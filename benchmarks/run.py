@@ -0,0 +1,142 @@
+"""Run the benchmark suite, save JSON baselines and compare runs.
+
+Usage:
+  python benchmarks/run.py run                         # all benchmarks, print table
+  python benchmarks/run.py run --save                  # ... and write baselines/<host>.json
+  python benchmarks/run.py run -k sort --out new.json  # only names containing "sort"
+  python benchmarks/run.py run --compare benchmarks/baselines/<host>.json
+  python benchmarks/run.py compare base.json new.json --threshold 0.1
+  python benchmarks/run.py list
+  python benchmarks/run.py pipeline --workers 1,2,4,8  # multiprocess pipeline scaling
+  python benchmarks/run.py alloc                       # per-frame allocation bound of the frame loop
+
+`compare` (and `run --compare`) exits with status 1 when any benchmark's
+median is slower than the baseline by more than the threshold. `alloc`
+exits with status 1 when a frame allocates more than --max-peak-kb after
+warm-up, or memory grows by more than --max-growth-kb over the run.
+"""
+import argparse
+import sys
+
+import harness
+import micro  # noqa: F401  (registers micro-benchmarks)
+from macro import run_frame_loop, run_pipeline_scaling
+
+
+def run(args) -> dict:
+    results = {}
+    for name, factory in harness.registered().items():
+        if args.k and args.k not in name:
+            continue
+        try:
+            fn = factory()
+        except ImportError as e:
+            print(f"skip  {name}: {e}")
+            continue
+        results[name] = stats = harness.time_callable(fn, min_time=args.min_time, repeats=args.repeats)
+        print(f"{name:<45} {harness.format_value(stats['median'], 's'):>12}  (p90 {harness.format_value(stats['p90'], 's')})")
+
+    if not args.no_macro and (not args.k or args.k in "frame_loop" or args.k.startswith("frame_loop")):
+        macro = run_frame_loop(frames=args.frames, model_path=args.model, render=not args.no_render)
+        for name, stats in macro.items():
+            print(f"{name:<45} {harness.format_value(stats['median'], stats['unit']):>12}")
+        results.update(macro)
+    return results
+
+
+def print_comparison(rows, threshold: float) -> bool:
+    regressed = False
+    for row in rows:
+        if "ratio" not in row:
+            print(f"{row['status']:<10} {row['name']}")
+            continue
+        regressed |= row["status"] == "REGRESSION"
+        print(f"{row['status']:<10} {row['name']:<45} {harness.format_value(row['base'], row['unit']):>12} -> "
+              f"{harness.format_value(row['new'], row['unit']):>12}  ({(row['ratio'] - 1) * 100:+.1f}%)")
+    print(f"\n{'Regressions' if regressed else 'No regressions'} beyond {threshold * 100:.0f}%")
+    return regressed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Traffic analyzer benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run benchmarks")
+    p_run.add_argument("-k", help="Only run benchmarks whose name contains this string")
+    p_run.add_argument("--save", nargs="?", const="", help="Save results as a baseline (default baselines/<host>.json)")
+    p_run.add_argument("--out", help="Write results to this JSON file")
+    p_run.add_argument("--compare", help="Compare against this baseline after running")
+    p_run.add_argument("--threshold", type=float, default=0.10, help="Regression threshold as a fraction [0.10]")
+    p_run.add_argument("--min-time", type=float, default=0.05, help="Seconds per timed micro-benchmark sample")
+    p_run.add_argument("--repeats", type=int, default=15, help="Samples per micro-benchmark")
+    p_run.add_argument("--frames", type=int, default=300, help="Measured frames in the frame-loop benchmark")
+    p_run.add_argument("--model", help="YOLO weights for the frame-loop benchmark (default: stubbed inference)")
+    p_run.add_argument("--no-render", action="store_true", help="Skip drawing in the frame-loop benchmark")
+    p_run.add_argument("--no-macro", action="store_true", help="Skip the frame-loop benchmark")
+
+    p_cmp = sub.add_parser("compare", help="Compare two result files")
+    p_cmp.add_argument("base")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+
+    p_pipe = sub.add_parser("pipeline", help="Frames per second of the multiprocess pipeline per worker count")
+    p_pipe.add_argument("--workers", default="1,2,4", help="Comma-separated inference worker counts [1,2,4]")
+    p_pipe.add_argument("--frames", type=int, default=300, help="Frames in the synthetic video")
+    p_pipe.add_argument("--infer-ms", type=float, default=30.0, help="CPU time of the stub detector per frame")
+    p_pipe.add_argument("--model", help="YOLO weights (default: stub detector)")
+    p_pipe.add_argument("--out", help="Write results to this JSON file")
+
+    p_alloc = sub.add_parser("alloc", help="Check the frame loop's steady-state allocations with tracemalloc")
+    p_alloc.add_argument("--frames", type=int, default=300, help="Measured frames after warm-up")
+    p_alloc.add_argument("--warmup", type=int, default=60, help="Frames before tracing starts")
+    p_alloc.add_argument("--max-peak-kb", type=float, default=256.0, help="Largest allowed per-frame allocation peak")
+    p_alloc.add_argument("--max-growth-kb", type=float, default=64.0, help="Largest allowed net growth over the run")
+    p_alloc.add_argument("--no-render", action="store_true", help="Skip drawing")
+
+    sub.add_parser("list", help="List micro-benchmarks")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "list":
+        for name in harness.registered():
+            print(name)
+        print("frame_loop[stub|yolo] (macro)")
+        sys.exit(0)
+
+    if args.command == "compare":
+        rows = harness.compare(harness.load_results(args.base), harness.load_results(args.new), args.threshold)
+        sys.exit(1 if print_comparison(rows, args.threshold) else 0)
+
+    if args.command == "pipeline":
+        counts = [int(n) for n in args.workers.split(",") if n.strip()]
+        results = run_pipeline_scaling(counts, frames=args.frames, infer_ms=args.infer_ms, model_path=args.model)
+        for name, stats in results.items():
+            print(f"{name:<45} {harness.format_value(stats['median'], stats['unit']):>12}")
+        if args.out:
+            harness.save_results(args.out, results)
+        sys.exit(0)
+
+    if args.command == "alloc":
+        results = run_frame_loop(frames=args.frames, warmup=args.warmup, render=not args.no_render, trace_alloc=True)
+        failed = False
+        for name, limit_kb in ((".alloc_peak", args.max_peak_kb), (".alloc_growth", args.max_growth_kb)):
+            stats = results["frame_loop[stub]" + name]
+            over = stats["median"] > limit_kb * 1024
+            failed |= over
+            print(f"{'OVER' if over else 'ok':<10} frame_loop[stub]{name:<20} "
+                  f"{stats['median'] / 1024:>10.1f} KiB  (limit {limit_kb:g} KiB)")
+        sys.exit(1 if failed else 0)
+
+    results = run(args)
+    if args.save is not None:
+        path = args.save or harness.default_baseline_path()
+        harness.save_results(path, results)
+        print(f"Baseline saved to {path}")
+    if args.out:
+        harness.save_results(args.out, results)
+    if args.compare:
+        rows = harness.compare(harness.load_results(args.compare), results, args.threshold)
+        print()
+        sys.exit(1 if print_comparison(rows, args.threshold) else 0)
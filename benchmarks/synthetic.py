@@ -0,0 +1,63 @@
+"""Deterministic synthetic traffic: moving vehicle boxes and matching frames."""
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+FRAME_SIZE = (1280, 720)
+# Same default ROI as src/main.py
+POLYGON = [(589, 206), (417, 539), (1275, 539), (874, 209)]
+
+
+def vehicle_stream(n_frames: int, n_vehicles: int = 20, frame_size: Tuple[int, int] = FRAME_SIZE,
+                   seed: int = 0) -> List[np.ndarray]:
+    """Per-frame (N,5) [x1,y1,x2,y2,conf] detections of vehicles driving down the frame.
+
+    Vehicles keep their identity across frames (so SORT sees realistic
+    matches), wrap around at the bottom edge, and occasionally drop out for a
+    frame like a missed detection.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = frame_size
+    x = rng.uniform(0, width - 120, n_vehicles)
+    y = rng.uniform(0, height, n_vehicles)
+    w = rng.uniform(60, 160, n_vehicles)
+    h = w * rng.uniform(0.6, 0.9, n_vehicles)
+    vy = rng.uniform(2.0, 8.0, n_vehicles)
+    frames = []
+    for _ in range(n_frames):
+        # Wrap from 100 px below the frame back to 100 px above it
+        y = (y + 100 + vy) % (height + 200) - 100
+        jitter = rng.normal(0, 1.5, (n_vehicles, 4))
+        boxes = np.stack([x, y, x + w, y + h], axis=1) + jitter
+        conf = rng.uniform(0.35, 0.95, n_vehicles)
+        keep = rng.random(n_vehicles) > 0.05
+        dets = np.concatenate([boxes, conf[:, None]], axis=1)[keep]
+        dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, width - 1)
+        dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, height - 1)
+        dets = dets[(dets[:, 2] - dets[:, 0] > 4) & (dets[:, 3] - dets[:, 1] > 4)]
+        dets[:, :4] = np.round(dets[:, :4])
+        frames.append(dets)
+    return frames
+
+
+def render_frames(stream: List[np.ndarray], frame_size: Tuple[int, int] = FRAME_SIZE, count: int = 32) -> List[np.ndarray]:
+    """Draw the first `count` frames of a stream (cycled by callers as a stand-in for decode)."""
+    width, height = frame_size
+    base = np.full((height, width, 3), 90, np.uint8)
+    cv2.rectangle(base, (0, height // 3), (width, height), (70, 70, 70), -1)
+    frames = []
+    for dets in stream[:count]:
+        img = base.copy()
+        for x1, y1, x2, y2, _ in dets.astype(int):
+            cv2.rectangle(img, (x1, y1), (x2, y2), (40, 40, 200), -1)
+        frames.append(img)
+    return frames
+
+
+def synthetic_mask(frame_size: Tuple[int, int] = FRAME_SIZE) -> np.ndarray:
+    """White road region below the horizon, like assets/mask.png."""
+    width, height = frame_size
+    mask = np.zeros((height, width, 3), np.uint8)
+    cv2.rectangle(mask, (0, height // 4), (width, height), (255, 255, 255), -1)
+    return mask
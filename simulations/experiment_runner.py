@@ -0,0 +1,263 @@
+"""Monte Carlo comparison of fixed-time and dynamic signal control.
+
+Every episode is one headless run of the vectorised intersection. Traffic is
+the same for both controllers: Poisson arrivals per approach at a given rate
+and a vehicle mix over the static simulation's car/truck/bike/ambulance
+types. The controller is either the static script's TrafficLightManager or
+the dynamic script's DynamicTrafficController with a set of rule parameters.
+Both scripts are loaded as modules, so their interactive code is untouched.
+
+Replicate r of every scenario uses the same seed, derived from (--seed, r),
+so controllers are compared on identical arrival streams. Episodes are
+independent and spread over a process pool.
+
+Usage:
+  python simulations/experiment_runner.py --episodes 20 --duration 3600 \\
+      --arrival-rate 0.05,0.1,0.2 --mix uniform --mix heavy=car:5,truck:4,bike:1 \\
+      --param low_density=0.2,0.3 --workers 8 --out results.csv
+"""
+import argparse
+import csv
+import importlib.util
+import itertools
+import math
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from headless import FRAME_DT, SimClock
+from vehicle_engine import DIRECTIONS, VehicleEngine
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    "dynamic": "traffic_simulation(Dynamic).py",
+    "static": "traffic_simulation(static).py",
+}
+# DynamicTrafficController keyword arguments that can be varied
+PARAM_NAMES = ["static_duration", "best_case", "worst_case", "stable_period", "decision_interval",
+               "low_density", "low_density_hold", "low_reduction", "medium_reduction"]
+# Seconds of arrivals the vehicle pool must hold (queueing through a full red included)
+POOL_SECONDS = 600.0
+
+_modules: Dict[str, Any] = {}
+
+
+def load_script(name: str):
+    """Import one of the simulation scripts as a module (cached per process)."""
+    if name not in _modules:
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        path = os.path.join(SIM_DIR, SCRIPTS[name])
+        spec = importlib.util.spec_from_file_location(f"traffic_simulation_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[name] = module
+    return _modules[name]
+
+
+class FixedTimeController:
+    """The static script's TrafficLightManager behind the dynamic controller's interface."""
+
+    def __init__(self, manager, cycle_seconds: float):
+        self.manager = manager
+        self.static_duration = cycle_seconds
+
+    @property
+    def history(self):
+        return self.manager.history
+
+    def update(self, densities):
+        self.manager.update()
+
+    def get_active_direction(self):
+        return self.manager.get_active_direction()
+
+    def is_yellow(self):
+        return self.manager.is_yellow()
+
+
+def episode_seed(base_seed: int, replicate: int) -> int:
+    return int(np.random.SeedSequence([base_seed, replicate]).generate_state(1)[0])
+
+
+def run_episode(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one episode and return its row of the results table."""
+    dynamic, static = load_script("dynamic"), load_script("static")
+    rate = spec["arrival_rate"]
+    step_frames = spec["step_frames"]
+    sim_clock = SimClock(FRAME_DT * step_frames)
+    types = {name: (t["width"], t["height"]) for name, t in static.vehicle_types.items()}
+    vehicles = VehicleEngine(max(10, math.ceil(rate * POOL_SECONDS)), dynamic.lanes, dynamic.stop_lines,
+                             (dynamic.WIDTH, dynamic.HEIGHT), seed=spec["seed"], vehicle_types=types,
+                             mix=spec["mix"], arrival_rate=rate)
+    if spec["controller"] == "static":
+        detector = None
+        controller = FixedTimeController(static.TrafficLightManager(clock=sim_clock.now),
+                                         static.CYCLE_PER_DIRECTION_SECONDS)
+    else:
+        detector = dynamic.OpenCVDensityDetector("geometry")
+        controller = dynamic.DynamicTrafficController(detector, clock=sim_clock.now, verbose=False, **spec["params"])
+
+    wall_start = time.perf_counter()
+    if spec["warmup"] > 0:
+        dynamic.simulate(controller, detector, vehicles, sim_clock, spec["warmup"], step_frames)
+    vehicles.reset_stats()
+    first_signal = len(controller.history)
+    measured_from = sim_clock.elapsed
+    dynamic.simulate(controller, detector, vehicles, sim_clock, spec["duration"], step_frames)
+    sim_s = sim_clock.elapsed - measured_from
+
+    waits = np.concatenate(vehicles.completed_waits) if vehicles.completed_waits else np.zeros(0)
+    signals = controller.history[first_signal:]
+    hours = sim_s / 3600.0
+    row = {
+        "scenario": spec["scenario"],
+        "controller": spec["controller"],
+        "arrival_rate": rate,
+        "mix": spec["mix_name"],
+        **{name: spec["params"].get(name, "") for name in spec["param_names"]},
+        "replicate": spec["replicate"],
+        "seed": spec["seed"],
+        "sim_s": round(sim_s, 3),
+        "vehicles": int(len(waits)),
+        "mean_wait_s": float(waits.mean()) if len(waits) else 0.0,
+        "p95_wait_s": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+        "max_wait_s": float(waits.max()) if len(waits) else 0.0,
+        # Vehicles stopped over all four approaches together
+        "mean_queue_total": float(vehicles.stopped_frames.sum() * FRAME_DT / sim_s) if sim_s else 0.0,
+        "max_queue_total": vehicles.max_total_queue,
+        "throughput_vph": float(vehicles.exits.sum() / hours) if hours else 0.0,
+        "signals": len(signals),
+        "mean_signal_s": float(np.mean([d for _, d in signals])) if signals else 0.0,
+        "green_saved_s": float(sum(max(0.0, controller.static_duration - d) for _, d in signals)),
+        "wall_s": round(time.perf_counter() - wall_start, 3),
+    }
+    for d, n in zip(DIRECTIONS, vehicles.exits.tolist()):
+        row[f"throughput_{d}_vph"] = n / hours if hours else 0.0
+    return row
+
+
+def parse_mix(text: str, type_names: Sequence[str]) -> Dict[str, float]:
+    """'car:5,truck:3' -> weights; 'uniform' is the static script's equal choice."""
+    if text == "uniform":
+        return {name: 1.0 for name in type_names}
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition(":")
+        name = name.strip()
+        if name not in type_names:
+            raise ValueError(f"Unknown vehicle type '{name}' (expected one of {', '.join(type_names)})")
+        mix[name] = float(weight) if weight.strip() else 1.0
+    return mix
+
+
+def build_specs(arrival_rates: Sequence[float], mixes: Dict[str, Dict[str, float]],
+                grid: Dict[str, Sequence[float]], episodes: int, duration: float, warmup: float,
+                step_frames: int, seed: int, include_static: bool = True) -> List[Dict[str, Any]]:
+    """One spec per (arrival rate, mix, controller, replicate)."""
+    for name in grid:
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Unknown parameter '{name}' (expected one of {', '.join(PARAM_NAMES)})")
+    names = list(grid)
+    controllers = [("static", {})] if include_static else []
+    controllers += [("dynamic", dict(zip(names, combo)))
+                    for combo in itertools.product(*(grid[n] for n in names))]
+    specs = []
+    for rate, (mix_name, mix), (kind, params) in itertools.product(arrival_rates, mixes.items(), controllers):
+        label = kind + "".join(f" {k}={v:g}" for k, v in params.items())
+        for replicate in range(episodes):
+            specs.append({
+                "scenario": f"{label} | rate={rate:g} | mix={mix_name}",
+                "controller": kind, "params": params, "param_names": names,
+                "arrival_rate": rate, "mix": mix, "mix_name": mix_name,
+                "replicate": replicate, "seed": episode_seed(seed, replicate),
+                "duration": duration, "warmup": warmup, "step_frames": step_frames,
+            })
+    return specs
+
+
+def run_experiments(specs: Sequence[Dict[str, Any]], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    if workers == 1 or len(specs) == 1:
+        return [run_episode(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_episode, specs))
+
+
+def summarize(rows: Sequence[Dict[str, Any]],
+              metrics: Sequence[str] = ("mean_wait_s", "p95_wait_s", "mean_queue_total", "max_queue_total",
+                                        "throughput_vph", "green_saved_s")) -> List[Dict[str, Any]]:
+    """Mean and standard deviation of each metric per scenario, in first-seen order."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(row["scenario"], []).append(row)
+    summary = []
+    for scenario, group in groups.items():
+        entry: Dict[str, Any] = {"scenario": scenario, "episodes": len(group)}
+        for m in metrics:
+            values = [float(r[m]) for r in group]
+            entry[m] = statistics.fmean(values)
+            entry[f"{m}_sd"] = statistics.stdev(values) if len(values) > 1 else 0.0
+        summary.append(entry)
+    return summary
+
+
+def _parse_values(text: str) -> List[float]:
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monte Carlo comparison of static vs dynamic signal control")
+    parser.add_argument("--episodes", type=int, default=10, help="Replicates per scenario")
+    parser.add_argument("--duration", type=float, default=3600.0, help="Measured simulated seconds per episode")
+    parser.add_argument("--warmup", type=float, default=300.0, help="Simulated seconds run before measuring")
+    parser.add_argument("--arrival-rate", default="0.05,0.1,0.15",
+                        help="Comma-separated arrival rates, vehicles per second per approach")
+    parser.add_argument("--mix", action="append", default=[],
+                        help="[name=]type:weight,... over car/truck/bike/ambulance, or 'uniform' (repeatable)")
+    parser.add_argument("--param", action="append", default=[],
+                        help="name=v1,v2,... dynamic controller parameter grid (repeatable); names: "
+                             + ", ".join(PARAM_NAMES))
+    parser.add_argument("--no-static", action="store_true", help="Only run the dynamic controller")
+    parser.add_argument("--step-frames", type=int, default=2,
+                        help="Frames per step; larger steps run faster but coarsen car following")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed; episode seeds derive from it")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size [cpu count]")
+    parser.add_argument("--out", help="Write the per-episode table to this CSV file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    type_names = list(load_script("static").vehicle_types)
+    mixes = {}
+    for item in args.mix or ["uniform"]:
+        name, sep, text = item.partition("=")
+        mixes[name if sep else item] = parse_mix(text if sep else item, type_names)
+    grid = {}
+    for item in args.param:
+        name, _, values = item.partition("=")
+        grid[name.strip()] = _parse_values(values)
+    specs = build_specs(_parse_values(args.arrival_rate), mixes, grid, args.episodes, args.duration,
+                        args.warmup, args.step_frames, args.seed, include_static=not args.no_static)
+
+    print(f"{len(specs)} episodes of {args.duration:g}s (+{args.warmup:g}s warmup)")
+    start = time.perf_counter()
+    rows = run_experiments(specs, workers=args.workers)
+    wall = time.perf_counter() - start
+    simulated = sum(r["sim_s"] for r in rows) + args.warmup * len(rows)
+    print(f"Done in {wall:.1f}s wall ({simulated / wall:.0f} simulated s per wall s)\n")
+
+    for entry in summarize(rows):
+        print(entry["scenario"])
+        print(f"  wait {entry['mean_wait_s']:.1f}s (sd {entry['mean_wait_s_sd']:.1f}), "
+              f"p95 {entry['p95_wait_s']:.1f}s, queue {entry['mean_queue_total']:.1f} (max {entry['max_queue_total']:.0f}), "
+              f"throughput {entry['throughput_vph']:.0f} veh/h, green saved {entry['green_saved_s']:.0f}s")
+    if args.out and rows:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Results written to {args.out}")
@@ -0,0 +1,78 @@
+"""Uniform-grid spatial hash for neighbour queries between simulated vehicles.
+
+Items are bucketed by the grid cell of their centre. Moving an item only
+touches the index when it crosses a cell boundary, so keeping the index
+current costs O(1) per vehicle per tick instead of a full rebuild. Queries
+return every item in the cells overlapping a box: a superset of the items
+within that box, which callers then filter with their exact test.
+"""
+import math
+from typing import Any, Dict, Iterator, Tuple
+
+Cell = Tuple[int, int]
+
+
+class SpatialHash:
+    """Grid of `cell_size` squares mapping cells to the items whose centre is inside."""
+
+    def __init__(self, cell_size: float = 64.0):
+        self.cell_size = float(cell_size)
+        # Per-cell dicts keep insertion order, so iteration is deterministic
+        self.cells: Dict[Cell, Dict[int, Any]] = {}
+        self._cell_of: Dict[int, Cell] = {}
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def _cell(self, x: float, y: float) -> Cell:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, item: Any, x: float, y: float):
+        cell = self._cell(x, y)
+        self.cells.setdefault(cell, {})[id(item)] = item
+        self._cell_of[id(item)] = cell
+
+    def remove(self, item: Any):
+        cell = self._cell_of.pop(id(item))
+        bucket = self.cells[cell]
+        del bucket[id(item)]
+        if not bucket:
+            del self.cells[cell]
+
+    def move(self, item: Any, x: float, y: float) -> bool:
+        """Update an item's position; returns True if it changed cell."""
+        cell = self._cell(x, y)
+        old = self._cell_of.get(id(item))
+        if old == cell:
+            return False
+        if old is not None:
+            self.remove(item)
+        self.cells.setdefault(cell, {})[id(item)] = item
+        self._cell_of[id(item)] = cell
+        return True
+
+    def query_rect(self, x0: float, y0: float, x1: float, y1: float) -> Iterator[Any]:
+        """Items in every cell overlapping the box [x0, x1] x [y0, y1].
+
+        Do not move items while iterating over the result.
+        """
+        if x1 < x0 or y1 < y0:
+            return
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        cells = self.cells
+        # Large boxes over a sparse grid: walk the occupied cells instead
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            for (cx, cy), bucket in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    yield from bucket.values()
+            return
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    yield from bucket.values()
+
+    def query(self, x: float, y: float, radius: float) -> Iterator[Any]:
+        """Items that may lie within `radius` of (x, y)."""
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
@@ -1,18 +1,27 @@
 import pygame
 import cv2
 import numpy as np
-import math
-import random
+import argparse
 import time
 
+from headless import FRAME_DT, SimClock, print_summary
+from vehicle_engine import DIRECTIONS, VehicleEngine
+
 # --- Pygame Setup ---
-pygame.init()
 WIDTH, HEIGHT = 800, 800
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Dynamic Traffic Simulation")
-clock = pygame.time.Clock()
-font = pygame.font.SysFont('Arial', 24, bold=True)
-small_font = pygame.font.SysFont('Arial', 18)
+font = None
+small_font = None
+
+
+def init_display():
+    """Open the window; headless runs never call this."""
+    global font, small_font
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Dynamic Traffic Simulation")
+    font = pygame.font.SysFont('Arial', 24, bold=True)
+    small_font = pygame.font.SysFont('Arial', 18)
+    return screen, pygame.time.Clock()
 
 # --- Colors ---
 ASPHALT = '#4a5568'
@@ -47,127 +56,84 @@ lanes = {
     'N': [v_road_right - LANE_WIDTH * 0.5, v_road_right - LANE_WIDTH * 1.5]
 }
 
-# --- Vehicle Class ---
-class Vehicle:
-    """Represents a single vehicle that moves straight."""
-    def __init__(self, direction):
-        self.original_direction = direction
-        self.base_speed = random.uniform(1.2, 1.8)
-        self.speed = self.base_speed
-        self.is_stopped = False
-        self.reset(direction)
-
-    def reset(self, direction):
-        """Resets the vehicle's state and position."""
-        self.direction = direction
-        self.width, self.height = 32, 16
-        self.color = pygame.Color(random.randint(60, 200), random.randint(120, 220), 255)
-
-        spawn_offset = 150 + random.uniform(0, 400)
-        if direction == 'E': self.x, self.y, self.angle = -spawn_offset, random.choice(lanes['E']), 0
-        elif direction == 'W': self.x, self.y, self.angle = WIDTH + spawn_offset, random.choice(lanes['W']), 180
-        elif direction == 'S': self.x, self.y, self.angle = random.choice(lanes['S']), -spawn_offset, 270
-        elif direction == 'N': self.x, self.y, self.angle = random.choice(lanes['N']), HEIGHT + spawn_offset, 90
-
-    def update(self, all_vehicles, traffic_manager):
-        """Updates the vehicle's position and state."""
-        stopped_by_light = self.check_traffic_light(traffic_manager)
-        stopped_by_traffic = self.check_collision(all_vehicles)
-        
-        self.is_stopped = stopped_by_light or stopped_by_traffic
-        self.speed = 0 if self.is_stopped else self.base_speed
-
-        if not self.is_stopped:
-            rad = math.radians(self.angle)
-            self.x += math.cos(rad) * self.speed
-            self.y -= math.sin(rad) * self.speed 
-
-        if not (-250 < self.x < WIDTH + 250 and -250 < self.y < HEIGHT + 250):
-            self.reset(self.original_direction)
-
-    def check_traffic_light(self, traffic_manager):
-        """Checks if the vehicle needs to stop for a traffic light."""
-        active_dir = traffic_manager.get_active_direction()
-        is_yellow = traffic_manager.is_yellow()
-        is_red = not (self.direction == active_dir and not is_yellow)
-        
-        stop_distance = 70
-        approaching = False
-        if self.direction == 'E' and v_road_left - stop_distance < self.x < v_road_left: approaching = True
-        elif self.direction == 'W' and v_road_right < self.x < v_road_right + stop_distance: approaching = True
-        elif self.direction == 'S' and h_road_top - stop_distance < self.y < h_road_top: approaching = True
-        elif self.direction == 'N' and h_road_bottom < self.y < h_road_bottom + stop_distance: approaching = True
-            
-        return approaching and is_red
+# Stop line each approach waits at, on its travel axis
+stop_lines = {'E': v_road_left, 'W': v_road_right, 'S': h_road_top, 'N': h_road_bottom}
 
-    def check_collision(self, all_vehicles):
-        """Checks for collisions with other vehicles."""
-        safe_distance = 45
-        for other in all_vehicles:
-            if other is self or other.direction != self.direction: continue
-            
-            distance = math.hypot(self.x - other.x, self.y - other.y)
-            if distance < safe_distance:
-                is_in_front = ((self.direction == 'E' and other.x > self.x) or
-                               (self.direction == 'W' and other.x < self.x) or
-                               (self.direction == 'S' and other.y > self.y) or
-                               (self.direction == 'N' and other.y < self.y))
-                if is_in_front: return True
-        return False
-
-    def draw(self, surface):
-        """Draws the vehicle on the screen with an improved shape."""
-        half_w, half_h = self.width / 2, self.height / 2
-        body_points = [(-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h)]
-        
-        cabin_w, cabin_h, cabin_offset = half_w * 0.8, half_h * 0.9, half_w * 0.1
-        cabin_points = [(-cabin_w + cabin_offset, -cabin_h), (cabin_w + cabin_offset, -cabin_h),
-                        (cabin_w*0.8 + cabin_offset, cabin_h), (-cabin_w*0.8 + cabin_offset, cabin_h)]
-
-        rad = math.radians(-self.angle)
-        cos_a, sin_a = math.cos(rad), math.sin(rad)
-        
-        def rotate_point(p):
-            x, y = p
-            return ((x * cos_a - y * sin_a) + self.x, (x * sin_a + y * cos_a) + self.y)
+# --- OpenCV Detector and Controller ---
+# Direction -> approach region (x1, y1, x2, y2) that its density is measured over
+approach_regions = {
+    'N': (v_road_left, h_road_bottom, v_road_right, HEIGHT),
+    'S': (v_road_left, 0, v_road_right, h_road_top),
+    'E': (0, h_road_top, v_road_left, h_road_bottom),
+    'W': (v_road_right, h_road_top, WIDTH, h_road_bottom),
+}
 
-        rotated_body = [rotate_point(p) for p in body_points]
-        rotated_cabin = [rotate_point(p) for p in cabin_points]
-        
-        pygame.draw.polygon(surface, self.color, rotated_body)
-        pygame.draw.polygon(surface, WINDSHIELD_COLOR, rotated_cabin)
-        pygame.draw.polygon(surface, self.color.lerp(BLACK, 0.4), rotated_body, 2)
+def surface_to_bgr(surface):
+    """Copy a pygame surface into an OpenCV BGR frame."""
+    # tobytes is row-major already, unlike surfarray's (x, y) layout
+    rgb = np.frombuffer(pygame.image.tobytes(surface, 'RGB'), np.uint8).reshape(surface.get_height(),
+                                                                              surface.get_width(), 3)
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
 
-# --- OpenCV Detector and Controller ---
 class OpenCVDensityDetector:
-    """Handles vehicle detection using the vision-based 'percent concept'."""
-    def __init__(self):
+    """Measures per-approach density with the 'percent concept'.
+
+    The default 'geometry' backend intersects the vehicle rectangles with the
+    approach regions directly. The 'pixel' backend thresholds a rendered
+    frame, as a camera would, and is kept for testing the vision path; note
+    that it also counts the white lane markings inside each region.
+    """
+    def __init__(self, backend='geometry'):
+        if backend not in ('geometry', 'pixel'):
+            raise ValueError(f"Unknown density backend: {backend}")
+        self.backend = backend
+        self.directions = list(approach_regions)
+        self.regions = np.array([approach_regions[d] for d in self.directions], dtype=float)
+        self.region_areas = (self.regions[:, 2] - self.regions[:, 0]) * (self.regions[:, 3] - self.regions[:, 1])
         self.masks = self._create_road_masks()
+        # One label image instead of a mask per direction: 0 = outside, i + 1 = self.directions[i]
+        self.labels = np.zeros((HEIGHT, WIDTH), dtype=np.intp)
+        for i, direction in enumerate(self.directions):
+            self.labels[self.masks[direction] > 0] = i + 1
+        self.labels = self.labels.ravel()
+        self.mask_areas = np.bincount(self.labels, minlength=len(self.directions) + 1)[1:]
         self.density_history = {'N': [], 'S': [], 'E': [], 'W': []}
         
     def _create_road_masks(self):
         """Creates masks for each direction to focus detection."""
         masks = {}
         mask_canvas = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
-        masks['N'] = cv2.rectangle(mask_canvas.copy(), (v_road_left, h_road_bottom), (v_road_right, HEIGHT), 255, -1)
-        masks['S'] = cv2.rectangle(mask_canvas.copy(), (v_road_left, 0), (v_road_right, h_road_top), 255, -1)
-        masks['E'] = cv2.rectangle(mask_canvas.copy(), (0, h_road_top), (v_road_left, h_road_bottom), 255, -1)
-        masks['W'] = cv2.rectangle(mask_canvas.copy(), (v_road_right, h_road_top), (WIDTH, h_road_bottom), 255, -1)
+        for direction, (x1, y1, x2, y2) in approach_regions.items():
+            masks[direction] = cv2.rectangle(mask_canvas.copy(), (x1, y1), (x2, y2), 255, -1)
         return masks
 
+    def sample(self, vehicles, surface=None):
+        """Measure densities with the configured backend; `surface` is only read by 'pixel'."""
+        if self.backend == 'pixel':
+            return self.calculate_all_densities(surface_to_bgr(surface))
+        return self.calculate_from_vehicles(vehicles)
+
+    def calculate_from_vehicles(self, vehicles):
+        """Calculates density for all directions from the vehicle rectangles."""
+        boxes = vehicles.bounding_boxes()
+        regions = self.regions
+        overlap_w = np.minimum(boxes[:, None, 2], regions[None, :, 2]) - np.maximum(boxes[:, None, 0], regions[None, :, 0])
+        overlap_h = np.minimum(boxes[:, None, 3], regions[None, :, 3]) - np.maximum(boxes[:, None, 1], regions[None, :, 1])
+        # Vehicles in a lane keep a safe distance, so their rectangles do not overlap
+        vehicle_area = (np.clip(overlap_w, 0, None) * np.clip(overlap_h, 0, None)).sum(axis=0)
+        return self._record(vehicle_area / self.region_areas)
+
     def calculate_all_densities(self, frame):
         """Calculates density for all directions from a given frame using pixel analysis."""
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Threshold to isolate vehicles from the dark road
-        _, vehicle_binary = cv2.threshold(gray, 60, 255, cv2.THRESH_BINARY)
-        
+        # Threshold to isolate vehicles from the dark road, then count per label in one pass
+        vehicle_pixels = gray.ravel() > 60
+        vehicle_area = np.bincount(self.labels, weights=vehicle_pixels, minlength=len(self.directions) + 1)[1:]
+        return self._record(vehicle_area / np.maximum(self.mask_areas, 1))
+
+    def _record(self, fractions):
         densities = {}
-        for direction, mask in self.masks.items():
-            total_mask_area = np.sum(mask > 0)
-            # Count pixels that are both vehicles (white) and within the mask
-            vehicle_area = np.sum(cv2.bitwise_and(vehicle_binary, vehicle_binary, mask=mask) > 0)
-            
-            density = (vehicle_area / total_mask_area) if total_mask_area > 0 else 0.0
+        for direction, density in zip(self.directions, fractions.tolist()):
             densities[direction] = min(density * 4, 1.0) # Scaling factor for sensitivity
             
             self.density_history[direction].append(densities[direction])
@@ -183,29 +149,46 @@ class OpenCVDensityDetector:
         return np.mean(history[-actual_window:])
 
 class DynamicTrafficController:
-    """Implements the N-E-S-W clockwise traffic logic with dynamic timing."""
-    def __init__(self, detector):
+    """Implements the N-E-S-W clockwise traffic logic with dynamic timing.
+
+    The density rules are constructor parameters so they can be swept; the
+    defaults are the original values. `clock` defaults to wall time; headless
+    runs pass a simulated clock.
+    """
+    def __init__(self, detector, static_duration=90, best_case=30, worst_case=90,
+                 stable_period=10, decision_interval=5, low_density=0.3, low_density_hold=5,
+                 low_reduction=0.40, medium_density=(0.4, 0.6), medium_reduction=0.25,
+                 clock=time.time, verbose=True):
         self.detector = detector
         self.directions = ['N', 'E', 'S', 'W']
         self.current_index = 0
+        self.clock = clock
+        self.verbose = verbose
+        # (direction, green duration) of every completed signal
+        self.history = []
         
-        self.signal_start_time = time.time()
+        self.signal_start_time = self.clock()
         self.current_duration = 90.0
         self.is_in_yellow = False
         self.yellow_start_time = 0
         
         # Parameters from your logic
-        self.static_duration = 90
-        self.best_case = 30
-        self.worst_case = 90
-        self.stable_period = 10
-        self.decision_interval = 5
+        self.static_duration = static_duration
+        self.best_case = best_case
+        self.worst_case = worst_case
+        self.stable_period = stable_period
+        self.decision_interval = decision_interval
+        self.low_density = low_density
+        self.low_density_hold = low_density_hold
+        self.low_reduction = low_reduction
+        self.medium_density = medium_density
+        self.medium_reduction = medium_reduction
         self.last_decision_time = 0
         self.low_density_start_time = None
 
     def update(self, densities):
         """Main update loop for the controller."""
-        current_time = time.time()
+        current_time = self.clock()
         elapsed_since_switch = current_time - self.signal_start_time
 
         if self.is_in_yellow:
@@ -229,59 +212,67 @@ class DynamicTrafficController:
         active_dir = self.get_active_direction()
         current_density = self.detector.get_sliding_average(active_dir, 5)
         
-        print(f"\n--- Decision Check at {elapsed_time:.1f}s for {active_dir} (Density: {current_density:.3f}) ---")
+        log = print if self.verbose else (lambda *args: None)
+        log(f"\n--- Decision Check at {elapsed_time:.1f}s for {active_dir} (Density: {current_density:.3f}) ---")
         
         old_duration = self.current_duration
         new_duration = old_duration
 
         # --- YOUR DYNAMIC LOGIC, CORRECTLY IMPLEMENTED ---
-        if current_density < 0.3:
+        if current_density < self.low_density:
             if self.low_density_start_time is None:
                 self.low_density_start_time = elapsed_time
-                print("Low density detected. Starting 5s timer.")
+                log(f"Low density detected. Starting {self.low_density_hold}s timer.")
             
             # Rule 6: If density < 0.3 for more than 5 seconds
-            if elapsed_time - self.low_density_start_time >= 5:
+            if elapsed_time - self.low_density_start_time >= self.low_density_hold:
                 time_left = old_duration - elapsed_time
-                reduction = time_left * 0.40
+                reduction = time_left * self.low_reduction
                 new_duration = old_duration - reduction
-                print(f"Rule 6: Low density for >5s -> Reducing total duration by {reduction:.1f}s")
+                log(f"Rule 6: Low density for >{self.low_density_hold}s -> Reducing total duration by {reduction:.1f}s")
                 self.low_density_start_time = None # Reset timer after it fires
         else:
             self.low_density_start_time = None # Reset timer if density goes up
             # Rule 7: If density is between 0.4 and 0.6
-            if 0.4 <= current_density <= 0.6:
+            if self.medium_density[0] <= current_density <= self.medium_density[1]:
                 time_left = old_duration - elapsed_time
-                reduction = time_left * 0.25
+                reduction = time_left * self.medium_reduction
                 new_duration = old_duration - reduction
-                print(f"Rule 7: Medium density -> Reducing total duration by {reduction:.1f}s")
+                log(f"Rule 7: Medium density -> Reducing total duration by {reduction:.1f}s")
             else: # Rule 7 (cont.): Density >= 0.7
-                print("Rule 7: High density -> No change.")
+                log("Rule 7: High density -> No change.")
             
         # Enforce best/worst case bounds
         self.current_duration = max(self.best_case, min(new_duration, self.worst_case))
         
         if old_duration != self.current_duration:
-            print(f"Duration adjusted: {old_duration:.1f}s -> {self.current_duration:.1f}s")
+            log(f"Duration adjusted: {old_duration:.1f}s -> {self.current_duration:.1f}s")
 
     def _switch_to_next_direction(self):
         """Switches the signal to the next direction in the clockwise sequence."""
         old_dir = self.get_active_direction()
+        self.history.append((old_dir, self.current_duration))
         self.current_index = (self.current_index + 1) % len(self.directions)
         new_dir = self.get_active_direction()
 
         # Reset state for the new signal
-        self.signal_start_time = time.time()
+        self.signal_start_time = self.clock()
         self.is_in_yellow = False
         self.last_decision_time = self.signal_start_time
         self.current_duration = self.static_duration # Reset to 90s
         self.low_density_start_time = None
 
+        if not self.verbose:
+            return
         print(f"\n{'='*15} SIGNAL SWITCH {'='*15}")
         print(f"From: {old_dir} -> To: {new_dir}")
         print(f"Resetting duration to: {self.current_duration}s")
         print(f"{'='*47}\n")
 
+    def next_decision_time(self):
+        """Earliest clock time at which update() may read the density history."""
+        return max(self.signal_start_time + self.stable_period, self.last_decision_time + self.decision_interval)
+
     def get_active_direction(self):
         return self.directions[self.current_index]
 
@@ -290,8 +281,8 @@ class DynamicTrafficController:
 
     def get_remaining_time(self):
         if self.is_in_yellow:
-            return max(0, YELLOW_LIGHT_DURATION - (time.time() - self.yellow_start_time))
-        return max(0, self.current_duration - (time.time() - self.signal_start_time))
+            return max(0, YELLOW_LIGHT_DURATION - (self.clock() - self.yellow_start_time))
+        return max(0, self.current_duration - (self.clock() - self.signal_start_time))
 
 # --- Drawing Functions ---
 def draw_road_and_crossings(surface):
@@ -376,13 +367,14 @@ def draw_info_panel(surface, traffic_manager, densities):
         surface.blit(text_surface, (10, 10 + i * 22))
 
 # --- Main Simulation Loop ---
-def main():
+def main(per_direction=VEHICLE_COUNT_PER_DIRECTION, spawn_range=(150.0, 550.0), density_backend='geometry'):
     print("--- DYNAMIC TRAFFIC SIMULATION (USER LOGIC IMPLEMENTED) ---")
     
-    detector = OpenCVDensityDetector()
+    screen, clock = init_display()
+    detector = OpenCVDensityDetector(density_backend)
     traffic_controller = DynamicTrafficController(detector)
     
-    vehicles = [Vehicle(d) for d in ['N', 'E', 'S', 'W'] for _ in range(VEHICLE_COUNT_PER_DIRECTION)]
+    vehicles = VehicleEngine(per_direction, lanes, stop_lines, (WIDTH, HEIGHT), spawn_range=spawn_range)
     
     running = True
     frame_count = 0
@@ -393,23 +385,17 @@ def main():
             if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
                 running = False
         
-        # OpenCV processing happens every few frames for performance
+        # Density is sampled every few frames, as a camera pipeline would
         if frame_count % 3 == 0:
-            pygame_array = pygame.surfarray.array3d(screen)
-            frame = np.transpose(pygame_array, (1, 0, 2))
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            
-            densities = detector.calculate_all_densities(frame)
+            densities = detector.sample(vehicles, screen)
         
         # Update controller and vehicles every frame
         traffic_controller.update(densities)
-        for vehicle in vehicles:
-            vehicle.update(vehicles, traffic_controller)
+        vehicles.step(traffic_controller.get_active_direction(), traffic_controller.is_yellow())
         
         # Drawing
         draw_road_and_crossings(screen)
-        for vehicle in vehicles:
-            vehicle.draw(screen)
+        vehicles.draw(screen, WINDSHIELD_COLOR, BLACK)
         draw_traffic_lights(screen, traffic_controller)
         draw_info_panel(screen, traffic_controller, densities)
         
@@ -420,5 +406,72 @@ def main():
     pygame.quit()
     print("Simulation ended.")
 
+def simulate(traffic_controller, detector, vehicles, sim_clock, duration_s, step_frames=1):
+    """Step controller and vehicles on `sim_clock` for duration_s simulated seconds.
+
+    Density is only sampled for the readings the controller's next decision
+    will average; controllers without next_decision_time() never sample.
+    The 'pixel' backend renders those samples to an offscreen surface; all
+    other steps are pure array updates.
+    """
+    surface = background = None
+    if detector is not None and detector.backend == 'pixel':
+        surface = pygame.Surface((WIDTH, HEIGHT))
+        background = pygame.Surface((WIDTH, HEIGHT))
+        draw_road_and_crossings(background)
+
+    # The interactive loop samples every 3 frames; decisions average the last 5 samples
+    sample_every = max(1, round(3 / step_frames))
+    lookahead = 5 * sample_every * sim_clock.dt
+    next_decision = getattr(traffic_controller, 'next_decision_time', None)
+    densities = {}
+    steps = int(round(duration_s / sim_clock.dt))
+
+    for step in range(steps):
+        if next_decision is not None and step % sample_every == 0 and \
+           sim_clock.now() >= next_decision() - lookahead:
+            if surface is not None:
+                surface.blit(background, (0, 0))
+                vehicles.draw(surface, WINDSHIELD_COLOR, BLACK)
+            densities = detector.sample(vehicles, surface)
+
+        traffic_controller.update(densities)
+        vehicles.step(traffic_controller.get_active_direction(), traffic_controller.is_yellow(), step_frames)
+        sim_clock.advance()
+
+def run_headless(duration_s, per_direction=VEHICLE_COUNT_PER_DIRECTION, spawn_range=(150.0, 550.0),
+                 step_frames=1, seed=None, verbose=False, density_backend='geometry'):
+    """Run without a window on a simulated clock and print summary metrics."""
+    sim_clock = SimClock(FRAME_DT * step_frames)
+    detector = OpenCVDensityDetector(density_backend)
+    traffic_controller = DynamicTrafficController(detector, clock=sim_clock.now, verbose=verbose)
+    vehicles = VehicleEngine(per_direction, lanes, stop_lines, (WIDTH, HEIGHT), spawn_range=spawn_range, seed=seed)
+
+    wall_start = time.perf_counter()
+    simulate(traffic_controller, detector, vehicles, sim_clock, duration_s, step_frames)
+    print_summary("DYNAMIC", sim_clock.elapsed, time.perf_counter() - wall_start, traffic_controller.history,
+                  traffic_controller.static_duration, dict(zip(DIRECTIONS, vehicles.exits.tolist())),
+                  dict(zip(DIRECTIONS, (vehicles.stopped_frames * FRAME_DT).tolist())),
+                  dict(zip(DIRECTIONS, vehicles.max_queue.tolist())))
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Dynamic traffic simulation")
+    parser.add_argument("--per-direction", type=int, default=VEHICLE_COUNT_PER_DIRECTION,
+                        help="Vehicles per approach")
+    parser.add_argument("--spawn-range", type=float, nargs=2, default=(150.0, 550.0), metavar=("MIN", "MAX"),
+                        help="Spawn distance before the screen edge; widen it for large vehicle counts")
+    parser.add_argument("--headless", action="store_true",
+                        help="No window: run on a simulated clock as fast as possible and print a summary")
+    parser.add_argument("--duration", type=float, default=3600.0, help="Simulated seconds for --headless")
+    parser.add_argument("--step-frames", type=int, default=1,
+                        help="Frames per headless step; larger steps run faster but coarsen car following")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --headless")
+    parser.add_argument("--verbose", action="store_true", help="Print controller decisions in --headless")
+    parser.add_argument("--density", choices=["geometry", "pixel"], default="geometry",
+                        help="Density from vehicle rectangles, or from thresholded rendered frames (vision path)")
+    args = parser.parse_args()
+    if args.headless:
+        run_headless(args.duration, args.per_direction, tuple(args.spawn_range), args.step_frames, args.seed,
+                     args.verbose, args.density)
+    else:
+        main(args.per_direction, tuple(args.spawn_range), args.density)
@@ -0,0 +1,253 @@
+"""Struct-of-arrays vehicle engine for the intersection simulations.
+
+All vehicles live in flat NumPy arrays instead of one Python object each.
+Every vehicle drives straight along one lane, so its state is a progress
+coordinate `p` (growing in the travel direction) plus a fixed cross-lane
+coordinate. A tick is a handful of array operations:
+
+- leader gaps: vehicles are sorted by (lane, p), and the leader of each
+  vehicle is the next one in its lane;
+- stop lines: a mask of vehicles inside the stop zone of a red approach;
+- movement and respawn: masked adds and a vectorised reset.
+
+Vehicle types (length, width) are drawn per vehicle from a weighted mix.
+With `arrival_rate` set, respawned vehicles are placed upstream so that
+they reach the screen edge as a Poisson stream per approach, instead of
+after a uniform spawn offset.
+
+This replaces the O(N^2) per-vehicle collision scan, so thousands of
+vehicles per intersection step in well under a millisecond.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DIRECTIONS = ('E', 'W', 'S', 'N')
+DIR_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+# Travel axis per direction: (uses x?, sign of the axis along travel)
+_AXIS_X = np.array([True, True, False, False])
+_SIGN = np.array([1.0, -1.0, 1.0, -1.0])
+# Heading in screen degrees, as the original Vehicle.angle
+_ANGLE = {'E': 0, 'W': 180, 'S': 270, 'N': 90}
+
+
+def _car_outline(width: float, height: float, angle: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Body and cabin polygons (relative to the centre) for one heading."""
+    half_w, half_h = width / 2, height / 2
+    body = [(-half_w, -half_h), (half_w, -half_h), (half_w, half_h), (-half_w, half_h)]
+    cabin_w, cabin_h, cabin_offset = half_w * 0.8, half_h * 0.9, half_w * 0.1
+    cabin = [(-cabin_w + cabin_offset, -cabin_h), (cabin_w + cabin_offset, -cabin_h),
+             (cabin_w * 0.8 + cabin_offset, cabin_h), (-cabin_w * 0.8 + cabin_offset, cabin_h)]
+    rad = math.radians(-angle)
+    rot = np.array([[math.cos(rad), -math.sin(rad)], [math.sin(rad), math.cos(rad)]])
+    return np.array(body) @ rot.T, np.array(cabin) @ rot.T
+
+
+class VehicleEngine:
+    """Straight-driving vehicles on a four-way intersection, stepped as arrays."""
+
+    def __init__(self, count_per_direction: int, lanes: Dict[str, Sequence[float]], stop_lines: Dict[str, float],
+                 size: Tuple[int, int], speed_range: Tuple[float, float] = (1.2, 1.8),
+                 spawn_range: Tuple[float, float] = (150.0, 550.0), stop_distance: float = 70.0,
+                 safe_distance: float = 45.0, vehicle_size: Tuple[int, int] = (32, 16), margin: float = 250.0,
+                 seed: Optional[int] = None, vehicle_types: Optional[Dict[str, Tuple[int, int]]] = None,
+                 mix: Optional[Dict[str, float]] = None, arrival_rate: Optional[float] = None, fps: float = 60.0):
+        self.width, self.height = size
+        self.stop_distance = stop_distance
+        # Centre-to-centre gap for two vehicles of vehicle_size length; other
+        # lengths keep the same bumper-to-bumper gap
+        self.safe_distance = safe_distance
+        self.spawn_range = spawn_range
+        self.margin = margin
+        self.vehicle_size = vehicle_size
+        self.arrival_rate = arrival_rate
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+
+        vehicle_types = vehicle_types or {'car': vehicle_size}
+        mix = mix or {name: 1.0 for name in vehicle_types}
+        self.type_names = list(vehicle_types)
+        self.type_length = np.array([vehicle_types[t][0] for t in self.type_names], dtype=float)
+        self.type_width = np.array([vehicle_types[t][1] for t in self.type_names], dtype=float)
+        weights = np.array([mix.get(t, 0.0) for t in self.type_names], dtype=float)
+        if weights.sum() <= 0:
+            raise ValueError("Vehicle mix needs a positive weight for at least one type")
+        self.type_p = weights / weights.sum()
+
+        # Lane table: lane id -> direction, cross coordinate
+        lane_dir: List[int] = []
+        lane_cross: List[float] = []
+        self._lanes_of: List[np.ndarray] = []
+        for d in DIRECTIONS:
+            ids = []
+            for c in lanes[d]:
+                ids.append(len(lane_dir))
+                lane_dir.append(DIR_INDEX[d])
+                lane_cross.append(float(c))
+            self._lanes_of.append(np.array(ids))
+        self.lane_cross = np.array(lane_cross)
+        # Stop line in progress coordinates, and where a vehicle enters the screen
+        self.stop_p = np.array([_SIGN[DIR_INDEX[d]] * stop_lines[d] for d in DIRECTIONS])
+        self.entry_p = np.array([0.0, -float(self.width), 0.0, -float(self.height)])
+        # A vehicle is done once it is `margin` past the far edge
+        self.exit_p = np.array([self.width + margin, margin, self.height + margin, margin])
+
+        n = count_per_direction * len(DIRECTIONS)
+        self.direction = np.repeat(np.arange(len(DIRECTIONS)), count_per_direction).astype(np.int8)
+        self.lane = np.zeros(n, dtype=np.int32)
+        self.p = np.zeros(n)
+        self.base_speed = self.rng.uniform(speed_range[0], speed_range[1], n)
+        self.speed = self.base_speed.copy()
+        self.stopped = np.zeros(n, dtype=bool)
+        self.vtype = np.zeros(n, dtype=np.int8)
+        self.color = np.zeros((n, 3), dtype=np.uint8)
+        # Frames stopped since the vehicle last spawned
+        self.wait = np.zeros(n)
+        self.frame = 0.0
+        self.next_arrival = np.zeros(len(DIRECTIONS))
+        self._respawn(np.arange(n))
+        # Per-direction statistics for headless runs
+        self.exits = np.zeros(len(DIRECTIONS), dtype=np.int64)
+        self.stopped_frames = np.zeros(len(DIRECTIONS))
+        self.max_queue = np.zeros(len(DIRECTIONS), dtype=np.int64)
+        # Largest number stopped at once over all approaches together
+        self.max_total_queue = 0
+        self.completed_waits: List[np.ndarray] = []
+
+        self._outlines = [[_car_outline(length, width, _ANGLE[d]) for d in DIRECTIONS]
+                          for length, width in zip(self.type_length, self.type_width)]
+
+    def reset_stats(self):
+        """Zero the headless statistics, e.g. after a warmup period."""
+        self.exits[:] = 0
+        self.stopped_frames[:] = 0.0
+        self.max_queue[:] = 0
+        self.max_total_queue = 0
+        self.completed_waits = []
+
+    def __len__(self) -> int:
+        return len(self.p)
+
+    def _respawn(self, idx: np.ndarray):
+        if len(idx) == 0:
+            return
+        dirs = self.direction[idx]
+        for d in range(len(DIRECTIONS)):
+            sel = idx[dirs == d]
+            if len(sel):
+                self.lane[sel] = self.rng.choice(self._lanes_of[d], len(sel))
+        self.vtype[idx] = self.rng.choice(len(self.type_names), len(idx), p=self.type_p)
+        self.wait[idx] = 0.0
+        if self.arrival_rate:
+            offset = np.empty(len(idx))
+            for d in range(len(DIRECTIONS)):
+                sel = np.flatnonzero(dirs == d)
+                if len(sel) == 0:
+                    continue
+                # Exponential headways continue the approach's arrival stream;
+                # a backlog (pool too small) enters as soon as possible
+                headways = self.rng.exponential(self.fps / self.arrival_rate, len(sel))
+                arrivals = np.maximum(self.next_arrival[d] + np.cumsum(headways), self.frame)
+                self.next_arrival[d] = arrivals[-1]
+                offset[sel] = (arrivals - self.frame) * self.base_speed[idx[sel]]
+            offset = np.maximum(offset, self.type_length[self.vtype[idx]])
+        else:
+            offset = self.rng.uniform(self.spawn_range[0], self.spawn_range[1], len(idx))
+        self.p[idx] = self.entry_p[dirs] - offset
+        self.color[idx, 0] = self.rng.integers(60, 201, len(idx))
+        self.color[idx, 1] = self.rng.integers(120, 221, len(idx))
+        self.color[idx, 2] = 255
+
+    @property
+    def x(self) -> np.ndarray:
+        cross = self.lane_cross[self.lane]
+        return np.where(_AXIS_X[self.direction], _SIGN[self.direction] * self.p, cross)
+
+    @property
+    def y(self) -> np.ndarray:
+        cross = self.lane_cross[self.lane]
+        return np.where(_AXIS_X[self.direction], cross, _SIGN[self.direction] * self.p)
+
+    @property
+    def length(self) -> np.ndarray:
+        return self.type_length[self.vtype]
+
+    def leader_gaps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Distance to the next vehicle ahead in the same lane (inf for lane leaders), and its length."""
+        order = np.lexsort((self.p, self.lane))
+        lane_sorted = self.lane[order]
+        p_sorted = self.p[order]
+        length_sorted = self.length[order]
+        gaps_sorted = np.full(len(order), np.inf)
+        leader_length_sorted = np.zeros(len(order))
+        same_lane = lane_sorted[1:] == lane_sorted[:-1]
+        gaps_sorted[:-1][same_lane] = (p_sorted[1:] - p_sorted[:-1])[same_lane]
+        leader_length_sorted[:-1][same_lane] = length_sorted[1:][same_lane]
+        gaps = np.empty_like(gaps_sorted)
+        gaps[order] = gaps_sorted
+        leader_length = np.empty_like(leader_length_sorted)
+        leader_length[order] = leader_length_sorted
+        return gaps, leader_length
+
+    def step(self, active_direction: str, is_yellow: bool, frames: float = 1.0):
+        """Advance every vehicle by `frames` frames (speeds are per 60 FPS frame)."""
+        red = np.ones(len(DIRECTIONS), dtype=bool)
+        if not is_yellow:
+            red[DIR_INDEX[active_direction]] = False
+        to_stop = self.stop_p[self.direction] - self.p
+        stopped_by_light = red[self.direction] & (to_stop > 0) & (to_stop < self.stop_distance)
+        # A vehicle exactly level with another (gap 0) is not "in front", as before
+        gaps, leader_length = self.leader_gaps()
+        safe = self.safe_distance + (self.length + leader_length) / 2 - self.vehicle_size[0]
+        stopped_by_traffic = (gaps > 0) & (gaps < safe)
+
+        np.logical_or(stopped_by_light, stopped_by_traffic, out=self.stopped)
+        np.copyto(self.speed, self.base_speed)
+        self.speed[self.stopped] = 0.0
+        self.p += self.speed * frames
+        self.wait[self.stopped] += frames
+        self.frame += frames
+
+        queue = np.bincount(self.direction[self.stopped], minlength=len(DIRECTIONS))
+        self.stopped_frames += queue * frames
+        np.maximum(self.max_queue, queue, out=self.max_queue)
+        self.max_total_queue = max(self.max_total_queue, int(queue.sum()))
+
+        gone = np.flatnonzero(self.p > self.exit_p[self.direction])
+        if len(gone):
+            self.exits += np.bincount(self.direction[gone], minlength=len(DIRECTIONS))
+            self.completed_waits.append(self.wait[gone] / self.fps)
+            self._respawn(gone)
+
+    def bounding_boxes(self) -> np.ndarray:
+        """(n, 4) x1, y1, x2, y2 of every vehicle body (vehicles never rotate)."""
+        length, width = self.length, self.type_width[self.vtype]
+        half_x = np.where(_AXIS_X[self.direction], length / 2, width / 2)
+        half_y = np.where(_AXIS_X[self.direction], width / 2, length / 2)
+        x, y = self.x, self.y
+        return np.stack([x - half_x, y - half_y, x + half_x, y + half_y], axis=1)
+
+    def visible(self, pad: float = 40.0) -> np.ndarray:
+        x, y = self.x, self.y
+        return np.flatnonzero((x > -pad) & (x < self.width + pad) & (y > -pad) & (y < self.height + pad))
+
+    def draw(self, surface, windshield_color='#a7e4f2', outline_color='#000000'):
+        """Draw on-screen vehicles with pygame (same look as the original Vehicle.draw)."""
+        import pygame
+        outline = pygame.Color(outline_color)
+        idx = self.visible()
+        if len(idx) == 0:
+            return
+        centers = np.stack([self.x[idx], self.y[idx]], axis=1)
+        groups = self.vtype[idx].astype(np.int64) * len(DIRECTIONS) + self.direction[idx]
+        for group in np.unique(groups).tolist():
+            sel = np.flatnonzero(groups == group)
+            body, cabin = self._outlines[group // len(DIRECTIONS)][group % len(DIRECTIONS)]
+            bodies = (body[None, :, :] + centers[sel, None, :]).tolist()
+            cabins = (cabin[None, :, :] + centers[sel, None, :]).tolist()
+            for k, i in enumerate(idx[sel]):
+                color = pygame.Color(*self.color[i].tolist())
+                pygame.draw.polygon(surface, color, bodies[k])
+                pygame.draw.polygon(surface, windshield_color, cabins[k])
+                pygame.draw.polygon(surface, color.lerp(outline, 0.4), bodies[k], 2)
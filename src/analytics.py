@@ -0,0 +1,236 @@
+"""Historical traffic analytics over rotated telemetry files.
+
+Raw telemetry (see telemetry.py) is scanned lazily with polars: only the
+day partitions inside the requested range are opened, and only the columns
+a query needs are read. Every complete day is reduced once to a small
+15-minute summary file (per camera), so repeated queries over weeks of
+data read a few KB per day instead of rescanning the raw frames.
+
+Usage:
+  python src/analytics.py saved-per-hour --days 30 --tz Asia/Kolkata
+  python src/analytics.py peak-density --days 30
+  python src/analytics.py worst-case --days 7
+  python src/analytics.py summarize --days 90
+"""
+import argparse
+import glob
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+import polars as pl
+
+from telemetry import PHASE_CODES
+
+BUCKET = "15m"
+_SUMMARY_DIR = "summaries"
+
+
+def _day_files(root: str, table: str, day: date) -> List[str]:
+    return sorted(glob.glob(os.path.join(root, table, f"date={day:%Y-%m-%d}", "*.parquet")))
+
+
+def available_days(root: str, table: str = "frames") -> List[date]:
+    days = []
+    for path in glob.glob(os.path.join(root, table, "date=*")):
+        try:
+            days.append(datetime.strptime(os.path.basename(path)[5:], "%Y-%m-%d").date())
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+def _with_time(lf: pl.LazyFrame) -> pl.LazyFrame:
+    return lf.with_columns(pl.from_epoch((pl.col("ts") * 1e6).cast(pl.Int64), time_unit="us").alias("time"))
+
+
+def scan(root: str, table: str, start: date, end: date, columns: Optional[List[str]] = None) -> Optional[pl.LazyFrame]:
+    """Lazy scan of one table over [start, end] (UTC days), or None if no files.
+
+    Day partitions outside the range are never opened; `columns` and any
+    filters applied to the result are pushed down into the Parquet reader.
+    """
+    files = []
+    day = start
+    while day <= end:
+        files.extend(_day_files(root, table, day))
+        day += timedelta(days=1)
+    if not files:
+        return None
+    lf = pl.scan_parquet(files)
+    if columns is not None:
+        lf = lf.select(columns)
+    return lf
+
+
+def summarize_day(root: str, day: date) -> Optional[pl.DataFrame]:
+    """Reduce one day of raw telemetry to 15-minute buckets per camera."""
+    frames = scan(root, "frames", day, day, ["ts", "camera", "density", "avg_density", "vehicles_in_polygon"])
+    phases = scan(root, "phases", day, day, ["ts", "camera", "phase", "green_total", "worst_case"])
+    if frames is None and phases is None:
+        return None
+
+    parts = []
+    if frames is not None:
+        parts.append(
+            _with_time(frames)
+            .group_by(pl.col("time").dt.truncate(BUCKET).alias("bucket"), pl.col("camera").cast(pl.Utf8))
+            .agg(
+                pl.len().alias("frames"),
+                pl.col("density").mean().alias("mean_density"),
+                pl.col("density").max().alias("max_density"),
+                pl.col("avg_density").max().alias("max_avg_density"),
+                pl.col("vehicles_in_polygon").mean().alias("mean_vehicles"),
+                pl.col("vehicles_in_polygon").max().alias("max_vehicles"),
+            )
+        )
+    if phases is not None:
+        # Entering YELLOW closes a green phase; green_total is then final
+        parts.append(
+            _with_time(phases)
+            .filter(pl.col("phase") == PHASE_CODES['YELLOW'])
+            .group_by(pl.col("time").dt.truncate(BUCKET).alias("bucket"), pl.col("camera").cast(pl.Utf8))
+            .agg(
+                pl.len().alias("cycles"),
+                (pl.col("worst_case") - pl.col("green_total")).clip(lower_bound=0).sum().alias("saved_s"),
+                (pl.col("green_total") >= pl.col("worst_case") - 0.5).sum().alias("worst_case_cycles"),
+                pl.col("green_total").sum().alias("green_s"),
+            )
+        )
+    if len(parts) == 1:
+        out = parts[0].collect()
+    else:
+        out = parts[0].join(parts[1], on=["bucket", "camera"], how="full", coalesce=True).collect()
+    for name, dtype in (("frames", pl.UInt32), ("cycles", pl.UInt32), ("worst_case_cycles", pl.UInt32)):
+        if name not in out.columns:
+            out = out.with_columns(pl.lit(0, dtype=dtype).alias(name))
+    for name in ("mean_density", "max_density", "max_avg_density", "mean_vehicles", "max_vehicles",
+                 "saved_s", "green_s"):
+        if name not in out.columns:
+            out = out.with_columns(pl.lit(None, dtype=pl.Float64).alias(name))
+    return out.with_columns(pl.col(["frames", "cycles", "worst_case_cycles"]).fill_null(0),
+                            pl.col(["saved_s", "green_s"]).fill_null(0.0)).sort("bucket", "camera")
+
+
+def _raw_mtime(root: str, day: date) -> float:
+    files = _day_files(root, "frames", day) + _day_files(root, "phases", day)
+    return max((os.path.getmtime(f) for f in files), default=0.0)
+
+
+def load_summaries(root: str, start: date, end: date, refresh: bool = False) -> pl.DataFrame:
+    """15-minute summaries for [start, end], building missing or stale day files.
+
+    Past days are cached under <root>/summaries/; the current UTC day is
+    always computed from raw data and never cached, since it is still growing.
+    """
+    today = datetime.now(timezone.utc).date()
+    os.makedirs(os.path.join(root, _SUMMARY_DIR), exist_ok=True)
+    days = sorted(set(available_days(root, "frames")) | set(available_days(root, "phases")))
+    parts = []
+    for day in days:
+        if day < start or day > end:
+            continue
+        path = os.path.join(root, _SUMMARY_DIR, f"date={day:%Y-%m-%d}.parquet")
+        cached = os.path.exists(path) and os.path.getmtime(path) >= _raw_mtime(root, day)
+        if cached and not refresh and day < today:
+            df = pl.read_parquet(path)
+        else:
+            df = summarize_day(root, day)
+            if df is None:
+                continue
+            if day < today:
+                df.write_parquet(path + ".tmp")
+                os.replace(path + ".tmp", path)
+        parts.append(df)
+    if not parts:
+        return pl.DataFrame()
+    return pl.concat(parts, how="diagonal_relaxed").sort("bucket", "camera")
+
+
+def _localize(df: pl.DataFrame, tz: Optional[str]) -> pl.DataFrame:
+    col = pl.col("bucket").dt.replace_time_zone("UTC")
+    if tz:
+        col = col.dt.convert_time_zone(tz)
+    return df.with_columns(col.alias("bucket"))
+
+
+def green_saved_per_hour(summaries: pl.DataFrame, tz: Optional[str] = None) -> pl.DataFrame:
+    """Average green time saved per hour of day, per camera."""
+    hourly = (
+        _localize(summaries, tz)
+        .group_by(pl.col("bucket").dt.truncate("1h").alias("hour"), "camera")
+        .agg(pl.col("saved_s").sum(), pl.col("cycles").sum())
+    )
+    return (
+        hourly.group_by(pl.col("hour").dt.hour().alias("hour_of_day"), "camera")
+        .agg(
+            pl.col("saved_s").mean().alias("avg_saved_s"),
+            pl.col("cycles").mean().alias("avg_cycles"),
+            pl.len().alias("hours"),
+        )
+        .sort("camera", "hour_of_day")
+    )
+
+
+def peak_density_by_weekday(summaries: pl.DataFrame, tz: Optional[str] = None) -> pl.DataFrame:
+    """Peak and mean density per weekday (1 = Monday), per camera."""
+    return (
+        _localize(summaries, tz)
+        .group_by(pl.col("bucket").dt.weekday().alias("weekday"), "camera")
+        .agg(
+            pl.col("max_density").max().alias("peak_density"),
+            pl.col("max_avg_density").max().alias("peak_avg_density"),
+            ((pl.col("mean_density") * pl.col("frames")).sum() / pl.col("frames").sum()).alias("mean_density"),
+        )
+        .sort("camera", "weekday")
+    )
+
+
+def worst_case_cycles(root: str, start: date, end: date, tz: Optional[str] = None) -> pl.DataFrame:
+    """Individual cycles whose green ran to the worst-case bound."""
+    phases = scan(root, "phases", start, end, ["ts", "camera", "phase", "green_total", "worst_case", "total_saved"])
+    if phases is None:
+        return pl.DataFrame()
+    df = (
+        _with_time(phases)
+        .filter((pl.col("phase") == PHASE_CODES['YELLOW']) & (pl.col("green_total") >= pl.col("worst_case") - 0.5))
+        .select("time", "camera", "green_total", "total_saved")
+        .sort("time")
+        .collect()
+    )
+    if tz:
+        df = df.with_columns(pl.col("time").dt.replace_time_zone("UTC").dt.convert_time_zone(tz))
+    return df
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Traffic analytics over telemetry logs")
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("query", choices=["saved-per-hour", "peak-density", "worst-case", "summarize"])
+    parser.add_argument("--root", default=os.path.join(base_dir, "logs", "telemetry"), help="Telemetry directory")
+    parser.add_argument("--days", type=int, default=30, help="Look back this many days (inclusive of today)")
+    parser.add_argument("--start", help="First UTC day YYYY-MM-DD (overrides --days)")
+    parser.add_argument("--end", help="Last UTC day YYYY-MM-DD [today]")
+    parser.add_argument("--tz", help="Time zone for hour/weekday grouping, e.g. Asia/Kolkata [UTC]")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild day summaries from raw data")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    end = datetime.strptime(args.end, "%Y-%m-%d").date() if args.end else datetime.now(timezone.utc).date()
+    start = datetime.strptime(args.start, "%Y-%m-%d").date() if args.start else end - timedelta(days=args.days - 1)
+    pl.Config.set_tbl_rows(100)
+
+    if args.query == "worst-case":
+        print(worst_case_cycles(args.root, start, end, args.tz))
+    else:
+        summaries = load_summaries(args.root, start, end, refresh=args.refresh)
+        if summaries.is_empty():
+            print(f"No telemetry between {start} and {end} under {args.root}")
+        elif args.query == "saved-per-hour":
+            print(green_saved_per_hour(summaries, args.tz))
+        elif args.query == "peak-density":
+            print(peak_density_by_weekday(summaries, args.tz))
+        else:
+            print(f"{summaries['bucket'].dt.date().n_unique()} day(s) summarised, {len(summaries)} buckets")
@@ -0,0 +1,149 @@
+"""Cheap per-frame density from background subtraction, calibrated against YOLO.
+
+Between calibrations no DNN runs. The engine crops the ROI's bounding box,
+downscales it by `scale` and feeds it to an OpenCV background subtractor
+(MOG2 or KNN). Occupancy is the fraction of polygon pixels marked as
+foreground. Shadows are not counted.
+
+Occupancy and box density are not the same quantity. Silhouettes are
+smaller than boxes, boxes overlap, and shadows and perspective differ per
+camera. So every `calibrate_every_s` of video, the caller runs the normal
+YOLO + SORT path on one frame. It passes the resulting box density to
+calibrate(). The engine fits density = a * occupancy + b by least squares
+over the last `calib_points` pairs. With fewer than 3 pairs, or
+occupancies that barely differ, it fits a line through the origin instead.
+
+Error estimate: before a new pair is added to the fit, the current mapping
+predicts it. The absolute difference is an out-of-sample error, and its
+moving average is `error`, in density units. While the background model is
+still learning (`warmup_s`) every frame goes through YOLO, and none of them
+are used for calibration.
+"""
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+SUBTRACTORS = ("mog2", "knn")
+# MOG2/KNN mark foreground 255 and shadows 127
+FOREGROUND_MIN = 200
+
+
+class BackgroundDensityEngine:
+    """Per-frame occupancy of the ROI, mapped to box density by periodic calibration."""
+
+    def __init__(self, scene, source_fps: float = 30.0, method: str = "mog2", scale: float = 0.25,
+                 history: int = 500, var_threshold: float = 16.0, calibrate_every_s: float = 5.0,
+                 calib_points: int = 24, warmup_s: float = 3.0, error_alpha: float = 0.3):
+        if method not in SUBTRACTORS:
+            raise ValueError(f"method must be one of {', '.join(SUBTRACTORS)}")
+        self.method = method
+        self.scale = float(scale)
+        self.history = int(history)
+        self.var_threshold = float(var_threshold)
+        self.calibrate_every = max(1, int(round(float(calibrate_every_s) * source_fps)))
+        self.warmup = int(round(float(warmup_s) * source_fps))
+        self.error_alpha = float(error_alpha)
+        self._pairs: "deque[Tuple[float, float]]" = deque(maxlen=max(2, int(calib_points)))
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.calibrations = 0
+        self.frames = 0
+        self.set_scene(scene)
+
+    def set_scene(self, scene):
+        """(Re)build the ROI buffers and background model; the calibration starts over."""
+        x, y, w, h = scene.crop_rect
+        self._crop = (slice(y, y + h), slice(x, x + w))
+        sw, sh = max(1, int(round(w * self.scale))), max(1, int(round(h * self.scale)))
+        self._small_size = (sw, sh)
+        roi = cv2.resize(scene.polygon_raster[self._crop], (sw, sh), interpolation=cv2.INTER_NEAREST)
+        self._roi = (roi > 0).astype(np.uint8) * 255
+        self._roi_pixels = max(1, cv2.countNonZero(self._roi))
+        self._small = np.empty((sh, sw, 3), dtype=np.uint8)
+        self._fg = np.empty((sh, sw), dtype=np.uint8)
+        self._subtractor = (cv2.createBackgroundSubtractorMOG2(self.history, self.var_threshold, True)
+                            if self.method == "mog2" else
+                            cv2.createBackgroundSubtractorKNN(self.history, 400.0, True))
+        self._pairs.clear()
+        self.a, self.b = 0.0, 0.0
+        self.error: Optional[float] = None
+        self.occupancy = 0.0
+        self._start: Optional[int] = None
+        self._last_calibrated: Optional[int] = None
+
+    @property
+    def calibrated(self) -> bool:
+        return bool(self._pairs)
+
+    def _warming(self, position: int) -> bool:
+        if self._start is None:
+            self._start = position
+        return position - self._start < self.warmup
+
+    def due(self, position: int) -> bool:
+        """Whether the frame at source position `position` should run YOLO."""
+        if self._warming(position) or not self._pairs:
+            return True
+        return position - self._last_calibrated >= self.calibrate_every
+
+    def update(self, frame: np.ndarray) -> float:
+        """Feed one frame to the background model; returns the estimated density."""
+        cv2.resize(frame[self._crop], self._small_size, dst=self._small, interpolation=cv2.INTER_AREA)
+        self._subtractor.apply(self._small, self._fg)
+        cv2.threshold(self._fg, FOREGROUND_MIN - 1, 255, cv2.THRESH_BINARY, dst=self._fg)
+        cv2.morphologyEx(self._fg, cv2.MORPH_OPEN, self._kernel, dst=self._fg)
+        cv2.bitwise_and(self._fg, self._roi, dst=self._fg)
+        self.occupancy = cv2.countNonZero(self._fg) / self._roi_pixels
+        self.frames += 1
+        return self.estimate(self.occupancy)
+
+    def estimate(self, occupancy: float) -> float:
+        return min(1.0, max(0.0, self.a * occupancy + self.b))
+
+    def calibrate(self, position: int, box_density: float):
+        """Pair the last update()'s occupancy with the DNN box density of the same frame."""
+        if self._warming(position):
+            return  # background model still learning; occupancy is not meaningful yet
+        if self._pairs:
+            miss = abs(self.estimate(self.occupancy) - box_density)
+            self.error = miss if self.error is None else self.error + self.error_alpha * (miss - self.error)
+        self._pairs.append((self.occupancy, float(box_density)))
+        self._fit()
+        self._last_calibrated = position
+        self.calibrations += 1
+
+    def _fit(self):
+        occ = np.array([p[0] for p in self._pairs])
+        dens = np.array([p[1] for p in self._pairs])
+        if len(occ) >= 3 and occ.std() > 0.01:
+            a, b = np.polyfit(occ, dens, 1)
+            if a > 0:
+                self.a, self.b = float(a), float(b)
+                return
+        # Through the origin: empty road reads zero density
+        ss = float((occ * occ).sum())
+        self.a = float((occ * dens).sum() / ss) if ss > 0 else 0.0
+        self.b = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"occupancy": self.occupancy, "a": self.a, "b": self.b,
+                "error": -1.0 if self.error is None else self.error, "calibrations": self.calibrations}
+
+
+def create_density_engine(cfg: Optional[Dict], scene, source_fps: float) -> Optional[BackgroundDensityEngine]:
+    """Build the engine from the "density_engine" config section (None unless engine is "bgsub")."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if cfg.get("engine", "dnn") != "bgsub":
+        return None
+    return BackgroundDensityEngine(
+        scene,
+        source_fps=source_fps,
+        method=str(cfg.get("method", "mog2")),
+        scale=float(cfg.get("scale", 0.25)),
+        history=int(cfg.get("history", 500)),
+        var_threshold=float(cfg.get("var_threshold", 16.0)),
+        calibrate_every_s=float(cfg.get("calibrate_every_s", 5.0)),
+        calib_points=int(cfg.get("calib_points", 24)),
+        warmup_s=float(cfg.get("warmup_s", 3.0)),
+    )
@@ -0,0 +1,204 @@
+"""Frame sources that decode at the analysis resolution and skip unanalysed frames.
+
+YOLO letterboxes every frame down to `inference.imgsz`, so decoding a 4K
+stream at full resolution mostly produces pixels that are thrown away. A
+source returns frames already at `frame_size`, plus:
+
+  stride   only every Nth frame is returned; the frames in between are passed
+           over with `cap.grab()` (OpenCV) or dropped inside ffmpeg before
+           scaling, so they are never converted to BGR or copied into Python
+  skip()   pass over the next analysed frame. OpenCV grabs it without
+           converting; ffmpeg has already scaled and converted it, so it is
+           read from the pipe into a scratch buffer and discarded
+
+Backends:
+
+  opencv   cv2.VideoCapture; frames are resized with INTER_AREA after decode
+  ffmpeg   an `ffmpeg` subprocess decodes, drops and scales, and writes raw
+           BGR frames into a pipe that is read straight into the caller's
+           buffer. Decoding runs in parallel with the frame loop.
+
+Polygon coordinates in config.json stay in native video pixels; callers
+rescale them with scale_points(points, source.native_size, source.frame_size).
+"""
+import shutil
+import subprocess
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def scale_points(points: Sequence[Tuple[int, int]], from_size: Tuple[int, int],
+                 to_size: Tuple[int, int]) -> List[Tuple[int, int]]:
+    """Map (x, y) points between two (width, height) frame sizes."""
+    if tuple(from_size) == tuple(to_size):
+        return [(int(x), int(y)) for x, y in points]
+    sx = to_size[0] / from_size[0]
+    sy = to_size[1] / from_size[1]
+    return [(int(round(x * sx)), int(round(y * sy))) for x, y in points]
+
+
+def target_size(native_size: Tuple[int, int], width: int = 0, height: int = 0,
+                scale: float = 0.0) -> Tuple[int, int]:
+    """Output (width, height) from explicit dimensions or a scale factor, keeping the aspect ratio.
+
+    Sizes are rounded to even numbers, which ffmpeg's scaler and most codecs expect.
+    """
+    nw, nh = native_size
+    if width and height:
+        w, h = width, height
+    elif width:
+        w, h = width, width * nh / nw
+    elif height:
+        w, h = height * nw / nh, height
+    elif scale and scale != 1.0:
+        w, h = nw * scale, nh * scale
+    else:
+        return nw, nh
+    return max(2, int(round(w / 2)) * 2), max(2, int(round(h / 2)) * 2)
+
+
+def probe(video_path: str) -> Tuple[Tuple[int, int], float]:
+    """Native (width, height) and fps of a video, read from the container by OpenCV."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        fps = float(cap.get(cv2.CAP_PROP_FPS) or 0.0)
+    finally:
+        cap.release()
+    return size, fps
+
+
+class OpenCVSource:
+    """cv2.VideoCapture with grab-only skipping and optional downscaling."""
+
+    backend = "opencv"
+
+    def __init__(self, video_path: str, native_size: Tuple[int, int], frame_size: Tuple[int, int],
+                 fps: float = 0.0, stride: int = 1):
+        self.cap = cv2.VideoCapture(video_path)
+        self.native_size = tuple(native_size)
+        self.frame_size = tuple(frame_size)
+        self.fps = fps
+        self.stride = max(1, int(stride))
+        self._native: Optional[np.ndarray] = None
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def _grab(self, n: int) -> bool:
+        for _ in range(n):
+            if not self.cap.grab():
+                return False
+        return True
+
+    def skip(self) -> bool:
+        """Pass over the next analysed frame without decoding it to BGR."""
+        return self._grab(self.stride)
+
+    def read(self, dst: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """Next analysed frame, written into `dst` when given (H, W, 3 uint8 at frame_size)."""
+        if not self._grab(self.stride - 1):
+            return False, None
+        if self.frame_size == self.native_size:
+            ok, img = self.cap.read(dst)
+            if ok and dst is not None and img is not dst:
+                dst[...] = img
+                img = dst
+            return ok, img
+        ok, self._native = self.cap.read(self._native)
+        if not ok:
+            return False, None
+        return True, cv2.resize(self._native, self.frame_size, dst=dst, interpolation=cv2.INTER_AREA)
+
+    def release(self):
+        self.cap.release()
+
+
+class FFmpegSource:
+    """Raw BGR frames from an ffmpeg subprocess that drops and scales before output."""
+
+    backend = "ffmpeg"
+
+    def __init__(self, video_path: str, native_size: Tuple[int, int], frame_size: Tuple[int, int],
+                 fps: float = 0.0, stride: int = 1, threads: int = 0, hwaccel: Optional[str] = None):
+        self.native_size = tuple(native_size)
+        self.frame_size = tuple(frame_size)
+        self.fps = fps
+        self.stride = max(1, int(stride))
+        self.frame_bytes = self.frame_size[0] * self.frame_size[1] * 3
+        self._scratch = np.empty((self.frame_size[1], self.frame_size[0], 3), dtype=np.uint8)
+
+        filters = []
+        if self.stride > 1:
+            # Frames that are not analysed are discarded right after decoding
+            filters.append(f"select='not(mod(n\\,{self.stride}))'")
+        if self.frame_size != self.native_size:
+            filters.append(f"scale={self.frame_size[0]}:{self.frame_size[1]}:flags=area")
+        cmd = ["ffmpeg", "-loglevel", "error", "-nostdin"]
+        if hwaccel:
+            cmd += ["-hwaccel", hwaccel]
+        cmd += ["-threads", str(int(threads)), "-i", video_path]
+        if filters:
+            cmd += ["-vf", ",".join(filters)]
+        cmd += ["-vsync", "0", "-an", "-sn", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=self.frame_bytes * 2)
+
+    def isOpened(self) -> bool:
+        return self.proc.poll() is None or self.proc.returncode == 0
+
+    def _read_into(self, buf: np.ndarray) -> bool:
+        view = memoryview(buf).cast("B")
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def skip(self) -> bool:
+        """Drain the next frame from the pipe; ffmpeg cannot be told to drop it on demand."""
+        return self._read_into(self._scratch)
+
+    def read(self, dst: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if dst is None:
+            dst = np.empty_like(self._scratch)
+        if not self._read_into(dst):
+            return False, None
+        return True, dst
+
+    def release(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+
+def open_capture(video_path: str, cfg: Optional[Dict[str, Any]] = None):
+    """Open a frame source from the "capture" config section.
+
+    Without a section this is plain cv2.VideoCapture at native resolution.
+    """
+    cfg = cfg if isinstance(cfg, dict) else {}
+    native_size, fps = probe(video_path)
+    if native_size[0] <= 0 or native_size[1] <= 0:
+        # Unknown until the first frame (some live streams); no rescaling possible
+        return OpenCVSource(video_path, native_size, native_size, fps)
+    frame_size = target_size(native_size, int(cfg.get("width", 0)), int(cfg.get("height", 0)),
+                             float(cfg.get("scale", 0.0)))
+    stride = int(cfg.get("stride", 1))
+    backend = str(cfg.get("backend", "opencv"))
+    if backend == "ffmpeg":
+        if shutil.which("ffmpeg") is None:
+            print("ffmpeg not found on PATH; decoding with OpenCV instead.")
+        else:
+            return FFmpegSource(video_path, native_size, frame_size, fps, stride,
+                                threads=int(cfg.get("ffmpeg_threads", 0)), hwaccel=cfg.get("hwaccel"))
+    return OpenCVSource(video_path, native_size, frame_size, fps, stride)
+
+
+def capture_settings(source) -> Dict[str, Any]:
+    """What the source does to frames; part of the detection cache key."""
+    return {"backend": source.backend, "frame_size": list(source.frame_size), "stride": source.stride}
@@ -0,0 +1,214 @@
+"""Fixed-rate signal control, decoupled from the vision loop.
+
+The vision loop publishes a DensitySnapshot per processed frame; the control
+thread wakes every 1 / `tick_hz` seconds on a monotonic schedule, reads the
+latest snapshot, applies the density rules, advances phases and sends the
+ESP32 status lines and per-second countdowns. Phase changes therefore happen
+on time no matter how long inference takes, and the signal keeps cycling if
+the stream stalls.
+
+The sends themselves run on two esp32.LatestSender threads (serial status,
+TCP countdown), so an unreachable ESP32 never holds up a tick; if the
+display falls behind, only its newest line is kept. A failed countdown is
+not retried, the next second replaces it.
+
+Publishing is lock-free: a snapshot is an immutable tuple and publishing is
+a single attribute assignment, which is atomic under the GIL, so the reader
+always sees either the previous snapshot or the new one, never a mix.
+
+Stale density fallback: when the newest snapshot is older than
+`stale_after_s` (stream stalled, camera gone, inference hung) the rules
+stop reading density, since a frozen value would keep cutting green on
+traffic that is no longer measured. Phases keep advancing on time and
+`stale_policy` decides the green in progress:
+
+  hold   keep the green already decided; no further reductions (default)
+  fixed  restore the full `worst_case` green, i.e. run the fixed-time plan
+
+Normal operation resumes with the first fresh snapshot. Entering and leaving
+the fallback is printed and exported as the `density_stale` gauge.
+"""
+import queue
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+from esp32 import LatestSender
+
+STALE_POLICIES = ("hold", "fixed")
+
+
+class DensitySnapshot(NamedTuple):
+    ts: float               # time.monotonic() when published
+    frame_idx: int
+    density: float
+    avg_density: float
+    vehicles: int
+
+
+class DensityBoard:
+    """Single-writer, many-reader holder of the latest density snapshot."""
+
+    def __init__(self):
+        self._latest: Optional[DensitySnapshot] = None
+
+    def publish(self, frame_idx: int, density: float, avg_density: float, vehicles: int):
+        self._latest = DensitySnapshot(time.monotonic(), frame_idx, density, avg_density, vehicles)
+
+    def latest(self) -> Optional[DensitySnapshot]:
+        return self._latest
+
+
+class ControlStatus(NamedTuple):
+    """What the display and telemetry show: published by the control thread each tick."""
+    phase: str
+    seconds_left: int
+    total_saved: float
+    stale: bool
+    green_total: float
+    remaining_green: float
+
+
+class ControlLoop:
+    """Runs the timing controller and ESP32 senders on a fixed-rate thread."""
+
+    def __init__(self, controller, board: DensityBoard, send_status: Callable[[int, int, int, int], None],
+                 send_command: Callable[[str], bool], tick_hz: float = 10.0, stale_after_s: float = 2.0,
+                 stale_policy: str = "hold", on_phase: Optional[Callable[[object], None]] = None,
+                 metrics=None):
+        if stale_policy not in STALE_POLICIES:
+            raise ValueError(f"stale_policy must be one of {', '.join(STALE_POLICIES)}")
+        self.controller = controller
+        self.board = board
+        self._status_sender = LatestSender(send_status, name="esp32-status")
+        self._command_sender = LatestSender(send_command, name="esp32-command")
+        self.send_status = self._status_sender.submit
+        self.period_s = 1.0 / float(tick_hz)
+        self.stale_after_s = float(stale_after_s)
+        self.stale_policy = stale_policy
+        self.on_phase = on_phase
+        self.metrics = metrics
+        self.stale = True  # nothing published yet
+        self.ticks = 0
+        self.late_ticks = 0
+        self.status = ControlStatus(controller.phase, 0, controller.total_saved, True,
+                                    controller.green_total, controller.get_remaining_green())
+        self._calls: "queue.SimpleQueue[Callable[[], None]]" = queue.SimpleQueue()
+        self._last_sent_phase = None
+        self._last_sent_second = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="control-loop", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def call_soon(self, fn: Callable[[], None]):
+        """Run fn on the control thread before the next tick (e.g. swapping controller rules)."""
+        self._calls.put(fn)
+
+    def _send_current_durations(self):
+        c = self.controller
+        if c.phase == 'GREEN':
+            # New cycle begins; include accumulated saved time
+            self.send_status(int(round(c.green_total)), int(round(c.red_total)),
+                             int(round(c.yellow_total)), int(round(c.total_saved)))
+        elif c.phase == 'YELLOW':
+            self.send_status(int(round(c.get_remaining_green())), int(round(c.red_total)),
+                             int(round(c.yellow_total)), int(round(c.total_saved)))
+        elif c.phase == 'RED':
+            self.send_status(0, int(round(c.red_total)), 0, int(round(c.total_saved)))
+
+    def _update_staleness(self, snapshot: Optional[DensitySnapshot], now: float) -> bool:
+        stale = snapshot is None or now - snapshot.ts > self.stale_after_s
+        if stale != self.stale:
+            self.stale = stale
+            if stale:
+                print(f"Density stale (> {self.stale_after_s:g}s old); rules suspended, policy '{self.stale_policy}'")
+                c = self.controller
+                if self.stale_policy == "fixed" and c.phase == 'GREEN' and c.green_total < c.worst_case:
+                    c.green_total = float(c.worst_case)
+                    self._send_current_durations()
+            else:
+                print("Density fresh again; rules resumed")
+        if self.metrics is not None:
+            self.metrics.set_gauge("density_stale", 1 if stale else 0)
+            if snapshot is not None:
+                self.metrics.set_gauge("density_age_s", now - snapshot.ts)
+        return stale
+
+    def tick(self):
+        """One control step; called by the thread, or directly by tests and replays."""
+        while True:
+            try:
+                self._calls.get_nowait()()
+            except queue.Empty:
+                break
+        c = self.controller
+        snapshot = self.board.latest()
+        stale = self._update_staleness(snapshot, time.monotonic())
+
+        # Apply rules only during GREEN phase and only on fresh density
+        if c.phase == 'GREEN' and not stale and c.maybe_apply_rules(snapshot.avg_density):
+            # Send updated remaining durations to ESP32 so it can adjust countdown
+            self.send_status(int(round(c.get_remaining_green())), int(round(c.red_total)),
+                             int(round(c.yellow_total)), int(round(c.total_saved)))
+
+        # Advance phases as time elapses
+        prev_phase = c.phase
+        c.advance_phase_if_due()
+        if c.phase != prev_phase:
+            if self.on_phase is not None:
+                self.on_phase(c)
+            # On phase changes, notify ESP32 of the upcoming durations and
+            # force the next countdown send
+            self._send_current_durations()
+            self._last_sent_phase = None
+            self._last_sent_second = None
+
+        # Per-second display updates over Wi-Fi (A/C/B format)
+        code, seconds_left = self._countdown()
+        if code is not None and (c.phase != self._last_sent_phase or seconds_left != self._last_sent_second):
+            self._command_sender.submit(f"{code}{seconds_left}")
+            self._last_sent_phase = c.phase
+            self._last_sent_second = seconds_left
+        self.status = ControlStatus(c.phase, max(0, seconds_left), c.total_saved, stale,
+                                    c.green_total, c.get_remaining_green())
+        self.ticks += 1
+
+    def _countdown(self):
+        c = self.controller
+        if c.phase == 'GREEN':
+            return 'C', int(round(c.get_remaining_green()))
+        elapsed = c.clock() - c.phase_start_time
+        if c.phase == 'YELLOW':
+            return 'B', int(round(max(0.0, c.yellow_total - elapsed)))
+        if c.phase == 'RED':
+            return 'A', int(round(max(0.0, c.red_total - elapsed)))
+        return None, 0
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self.metrics is not None:
+                    with self.metrics.stage("controller"):
+                        self.tick()
+                else:
+                    self.tick()
+            except Exception as e:
+                print(f"Control loop error: {e}")
+            next_tick += self.period_s
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # A slow send overran the tick; skip the missed ones instead of bursting
+                self.late_ticks += 1
+                next_tick = time.monotonic()
+                continue
+            self._stop.wait(delay)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._status_sender.close()
+        self._command_sender.close()
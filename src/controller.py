@@ -0,0 +1,171 @@
+import time
+from dataclasses import dataclass, fields, replace
+from typing import Any, Callable, Dict, Optional
+
+
+@dataclass(frozen=True)
+class TimingRules:
+    """Density rules applied by DynamicTimingController.
+
+    Defaults reproduce the original hard-coded behaviour.
+    """
+    worst_case: float = 90.0          # max (and initial) green, seconds
+    best_case: float = 30.0           # min green, seconds
+    warmup_s: float = 10.0            # no changes during the first seconds of green
+    rule_interval_s: float = 5.0      # seconds between rule evaluations
+    low_density: float = 0.3          # d < low_density -> low_reduction
+    low_reduction: float = 0.40
+    medium_density_min: float = 0.4   # medium_min <= d <= medium_max -> medium_reduction
+    medium_density_max: float = 0.6
+    medium_reduction: float = 0.25
+    high_density: float = 0.7         # d >= high_density -> high_reduction
+    high_reduction: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "TimingRules":
+        """Build rules from a (possibly partial) config dict, ignoring unknown keys."""
+        rules = cls()
+        if not isinstance(data, dict):
+            return rules
+        known = {f.name for f in fields(cls)}
+        updates = {}
+        for key, value in data.items():
+            if key in known and isinstance(value, (int, float)):
+                updates[key] = float(value)
+        return replace(rules, **updates)
+
+    def reduction_for(self, density: float) -> float:
+        """Fraction of the remaining green to cut for a given average density."""
+        if density < self.low_density:
+            return self.low_reduction
+        elif self.medium_density_min <= density <= self.medium_density_max:
+            return self.medium_reduction
+        elif density >= self.high_density:
+            return self.high_reduction
+        return 0.0
+
+
+class DynamicTimingController:
+    """Controls green/yellow/red durations based on ROI density.
+
+    Rules (defaults, see TimingRules):
+    - Start with green = 90s
+    - First 10s: no change
+    - Every 5s afterwards: compute 5s sliding avg density and adjust remaining green time:
+        * density < 0.3  -> reduce remaining by 40%
+        * 0.4 <= d <= 0.6 -> reduce remaining by 25%
+        * d >= 0.7 -> no reduction
+      Values in (0.3-0.4) or (0.6-0.7) -> no change (unspecified)
+    - Bounds: 30s <= green <= 90s
+    - Track total time saved across cycles
+
+    `clock` defaults to wall time; replays pass a simulated clock.
+    """
+
+    def __init__(self, yellow_seconds: float = 5, red_seconds: float = 60,
+                 rules: Optional[TimingRules] = None, clock: Callable[[], float] = time.time):
+        self.rules = rules if rules is not None else TimingRules()
+        self.clock = clock
+        self.worst_case = self.rules.worst_case
+        self.best_case = self.rules.best_case
+        self.green_total = float(self.worst_case)
+        # Kept as floats like green_total; senders round when they format
+        self.yellow_total = float(yellow_seconds)
+        self.red_total = float(red_seconds)
+        self.phase = 'GREEN'  # GREEN -> YELLOW -> RED
+        self.phase_start_time = self.clock()
+        self.last_rule_time = self.phase_start_time
+        self.total_saved = 0.0
+
+    def reset_for_new_green(self):
+        # When a new green phase begins, reset timers and green duration
+        now = self.clock()
+        self.phase = 'GREEN'
+        self.phase_start_time = now
+        self.last_rule_time = now
+        self.green_total = float(self.worst_case)
+
+    def get_elapsed(self) -> float:
+        return self.clock() - self.phase_start_time
+
+    def get_remaining_green(self) -> float:
+        return max(0.0, self.green_total - self.get_elapsed())
+
+    def maybe_apply_rules(self, five_sec_avg_density: float):
+        if self.phase != 'GREEN':
+            return False
+        elapsed = self.get_elapsed()
+        # Wait for the warmup; then apply every rule interval
+        if elapsed < self.rules.warmup_s:
+            return False
+        if (self.clock() - self.last_rule_time) < self.rules.rule_interval_s:
+            return False
+
+        remaining = self.get_remaining_green()
+        if remaining <= 0:
+            return False
+
+        old_green_total = self.green_total
+        reduction_factor = self.rules.reduction_for(five_sec_avg_density)
+
+        if reduction_factor > 0.0:
+            # Reduce remaining time by factor, keeping elapsed the same
+            reduced_remaining = remaining * (1.0 - reduction_factor)
+            new_total = elapsed + reduced_remaining
+            # Enforce bounds
+            bounded_total = max(self.best_case, min(new_total, self.worst_case))
+            self.green_total = bounded_total
+            self.last_rule_time = self.clock()
+            return abs(old_green_total - self.green_total) > 1e-6
+        else:
+            self.last_rule_time = self.clock()
+            return False
+
+    def advance_phase_if_due(self):
+        now = self.clock()
+        if self.phase == 'GREEN':
+            if now - self.phase_start_time >= self.green_total:
+                self.phase = 'YELLOW'
+                self.phase_start_time = now
+        elif self.phase == 'YELLOW':
+            if now - self.phase_start_time >= self.yellow_total:
+                self.phase = 'RED'
+                self.phase_start_time = now
+        elif self.phase == 'RED':
+            if now - self.phase_start_time >= self.red_total:
+                # End of cycle; compute saved time for the last green
+                saved = max(0.0, self.worst_case - self.green_total)
+                self.total_saved += saved
+                self.reset_for_new_green()
+
+    def next_event_time(self) -> float:
+        """Earliest clock time at which maybe_apply_rules/advance_phase_if_due can change state.
+
+        Lets event-driven callers sleep until then instead of polling every frame.
+        """
+        if self.phase == 'GREEN':
+            phase_end = self.phase_start_time + self.green_total
+            next_rule = max(self.phase_start_time + self.rules.warmup_s, self.last_rule_time + self.rules.rule_interval_s)
+            return min(phase_end, next_rule)
+        if self.phase == 'YELLOW':
+            return self.phase_start_time + self.yellow_total
+        return self.phase_start_time + self.red_total
+
+    def shift_phase_end(self, delta_s: float):
+        """Move the end of the current phase by delta_s (used to line up RED with a neighbour)."""
+        self.phase_start_time += delta_s
+
+    def get_phase_and_times(self):
+        # Return current phase and integer seconds for countdowns
+        if self.phase == 'GREEN':
+            remaining_green = int(round(self.get_remaining_green()))
+        else:
+            remaining_green = int(round(self.green_total))
+        return {
+            'phase': self.phase,
+            'green_total': int(round(self.green_total)),
+            'yellow_total': int(round(self.yellow_total)),
+            'red_total': int(round(self.red_total)),
+            'remaining_green': remaining_green,
+            'total_saved': int(round(self.total_saved))
+        }
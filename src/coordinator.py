@@ -0,0 +1,455 @@
+"""District coordinator: many intersection controllers on one asyncio loop.
+
+Camera workers push per-frame density for their intersection over a local
+socket (one JSON object per line, see DensityPublisher). The coordinator
+keeps a 5 s sliding average per intersection and drives one
+DynamicTimingController each. Controllers are not polled per frame: every
+controller sits in a hashed timer wheel under the time of its next event.
+That is a rule check, a phase end or the next countdown second, so an idle
+district costs one wakeup per wheel tick.
+
+Green wave: when an intersection turns GREEN at T, each downstream
+neighbour that is in RED has its red end moved towards T + offset_s. The
+move is limited to max_red_adjust_s, so its red never exceeds its
+configured length by more than that.
+
+ESP32 fan-out uses one sender task per endpoint with a latest-wins slot, so
+a slow or offline display only ever has its newest command pending.
+
+Usage:
+  python src/coordinator.py district.json [--dry-run]
+
+district.json:
+  {
+    "listen": "127.0.0.1:9200",          # or "unix:/tmp/traffic.sock"
+    "tick_s": 0.1,
+    "max_red_adjust_s": 10,
+    "intersections": [
+      {"id": "A", "esp32": "10.0.0.11:80", "yellow_seconds": 5, "red_seconds": 60,
+       "controller": {"worst_case": 90, "best_case": 30}},
+      {"id": "B", "esp32": "10.0.0.12:80"}
+    ],
+    "green_wave": [{"from": "A", "to": "B", "offset_s": 12}]
+  }
+"""
+import argparse
+import asyncio
+import json
+import math
+import socket
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from controller import DynamicTimingController, TimingRules
+
+DENSITY_WINDOW_S = 5.0
+DEFAULT_LISTEN = "127.0.0.1:9200"
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """'host:port' -> ('tcp', (host, port)); 'unix:/path' -> ('unix', '/path')."""
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class TimerWheel:
+    """Hashed timer wheel with fixed tick resolution.
+
+    schedule() and advancing by one tick are O(1) amortised regardless of how
+    far ahead a timer is; timers beyond one revolution wait in their slot
+    until their tick comes round.
+    """
+
+    def __init__(self, tick_s: float, slots: int = 512, start: float = 0.0):
+        self.tick_s = tick_s
+        self.slots: List[List[Tuple[int, Any]]] = [[] for _ in range(slots)]
+        self.start = start
+        self.current = 0
+        self.size = 0
+
+    def _tick_of(self, when: float) -> int:
+        return math.ceil((when - self.start) / self.tick_s - 1e-9)
+
+    def schedule(self, when: float, item: Any):
+        tick = max(self._tick_of(when), self.current + 1)
+        self.slots[tick % len(self.slots)].append((tick, item))
+        self.size += 1
+
+    def advance(self, now: float) -> List[Any]:
+        """Pop every item due at or before `now`."""
+        target = int((now - self.start) / self.tick_s)
+        due = []
+        n = len(self.slots)
+        # An empty wheel (or a long stall) does not need to walk every tick
+        if self.size == 0:
+            self.current = max(self.current, target)
+            return due
+        steps = min(target - self.current, n)
+        for _ in range(steps):
+            self.current += 1
+            bucket = self.slots[self.current % n]
+            if not bucket:
+                continue
+            keep = []
+            for tick, item in bucket:
+                if tick <= target:
+                    due.append(item)
+                else:
+                    keep.append((tick, item))
+            self.slots[self.current % n] = keep
+        self.current = max(self.current, target)
+        self.size -= len(due)
+        return due
+
+    def next_due(self) -> Optional[float]:
+        """Time of the next tick holding a timer (within one revolution), or None."""
+        if self.size == 0:
+            return None
+        n = len(self.slots)
+        for step in range(1, n + 1):
+            if self.slots[(self.current + step) % n]:
+                return self.start + (self.current + step) * self.tick_s
+        return None
+
+
+class EndpointSender:
+    """Sends commands to one ESP32 endpoint; only the newest unsent command is kept."""
+
+    def __init__(self, address: str, timeout: float = 1.5):
+        self.address = address
+        self.timeout = timeout
+        self.failures = 0
+        self._pending: Optional[str] = None
+        self._event = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def send(self, command: str):
+        self._pending = command
+        self._event.set()
+
+    async def _run(self):
+        kind, target = parse_address(self.address)
+        while True:
+            await self._event.wait()
+            self._event.clear()
+            command, self._pending = self._pending, None
+            if command is None:
+                continue
+            try:
+                if kind == "unix":
+                    conn = asyncio.open_unix_connection(target)
+                else:
+                    conn = asyncio.open_connection(*target)
+                _, writer = await asyncio.wait_for(conn, self.timeout)
+                writer.write((command + "\n").encode("utf-8"))
+                await asyncio.wait_for(writer.drain(), self.timeout)
+                writer.close()
+            except (OSError, asyncio.TimeoutError) as e:
+                self.failures += 1
+                if self.failures == 1 or self.failures % 100 == 0:
+                    print(f"TCP send failed to {self.address} -> {command} ({e}; {self.failures} failures)")
+
+    def close(self):
+        self._task.cancel()
+
+
+class _Intersection:
+    __slots__ = ("id", "controller", "samples", "density_sum", "sender", "downstream",
+                 "last_command", "timer_gen", "phase")
+
+    def __init__(self, node_id: str, controller: DynamicTimingController, sender):
+        self.id = node_id
+        self.controller = controller
+        self.samples: deque = deque()
+        self.density_sum = 0.0
+        self.sender = sender
+        self.downstream: List[Tuple["_Intersection", float]] = []
+        self.last_command: Optional[str] = None
+        self.timer_gen = 0
+        self.phase = controller.phase
+
+    def add_density(self, ts: float, density: float):
+        self.samples.append((ts, density))
+        self.density_sum += density
+        self._expire(ts)
+
+    def _expire(self, now: float):
+        cutoff = now - DENSITY_WINDOW_S
+        while self.samples and self.samples[0][0] < cutoff:
+            self.density_sum -= self.samples.popleft()[1]
+
+    def avg_density(self, now: float) -> Optional[float]:
+        """Sliding average, or None when the camera has been silent for a whole window."""
+        self._expire(now)
+        if not self.samples:
+            return None
+        return self.density_sum / len(self.samples)
+
+
+class Coordinator:
+    """Hosts many intersection controllers on a single event loop."""
+
+    def __init__(self, config: Dict[str, Any], clock: Callable[[], float] = time.monotonic,
+                 sender_factory: Optional[Callable[[str], Any]] = None):
+        self.clock = clock
+        self.tick_s = float(config.get("tick_s", 0.1))
+        self.max_red_adjust_s = float(config.get("max_red_adjust_s", 10.0))
+        self.listen = str(config.get("listen", DEFAULT_LISTEN))
+        self._sender_factory = sender_factory or EndpointSender
+        self._senders: Dict[str, Any] = {}
+        self.wheel = TimerWheel(self.tick_s, start=clock())
+        self.nodes: Dict[str, _Intersection] = {}
+        self.updates = 0
+        self.steps = 0
+
+        for item in config.get("intersections", []):
+            self.add_intersection(item)
+        for link in config.get("green_wave", []):
+            src, dst = self.nodes.get(link.get("from")), self.nodes.get(link.get("to"))
+            if src is None or dst is None:
+                print(f"Ignoring green-wave link with unknown intersection: {link}")
+                continue
+            src.downstream.append((dst, float(link.get("offset_s", 0.0))))
+
+    def add_intersection(self, item: Dict[str, Any]):
+        node_id = str(item["id"])
+        controller = DynamicTimingController(
+            yellow_seconds=float(item.get("yellow_seconds", 5)),
+            red_seconds=float(item.get("red_seconds", 60)),
+            rules=TimingRules.from_dict(item.get("controller")),
+            clock=self.clock,
+        )
+        sender = None
+        endpoint = item.get("esp32")
+        if endpoint:
+            sender = self._senders.get(endpoint)
+            if sender is None:
+                sender = self._senders[endpoint] = self._sender_factory(endpoint)
+        node = self.nodes[node_id] = _Intersection(node_id, controller, sender)
+        self._schedule(node)
+        return node
+
+    # ---- inputs -----------------------------------------------------------
+
+    def on_density(self, node_id: str, density: float, ts: Optional[float] = None):
+        node = self.nodes.get(node_id)
+        if node is None:
+            return
+        # Worker timestamps are wall time; the window runs on the coordinator clock
+        node.add_density(self.clock(), float(density))
+        self.updates += 1
+
+    def status(self) -> Dict[str, Any]:
+        now = self.clock()
+        out = {}
+        for node in self.nodes.values():
+            info = node.controller.get_phase_and_times()
+            info["avg_density"] = node.avg_density(now)
+            out[node.id] = info
+        return {"intersections": out, "updates": self.updates, "steps": self.steps, "timers": self.wheel.size}
+
+    # ---- timers -------------------------------------------------------------
+
+    def _schedule(self, node: _Intersection):
+        node.timer_gen += 1
+        ctrl = node.controller
+        # Wake for the next controller event or the next countdown second of this phase
+        elapsed = self.clock() - ctrl.phase_start_time
+        next_second = ctrl.phase_start_time + math.floor(elapsed + 1e-6) + 1.0
+        when = min(ctrl.next_event_time(), next_second)
+        self.wheel.schedule(when, (node, node.timer_gen))
+
+    def _step(self, node: _Intersection):
+        self.steps += 1
+        ctrl = node.controller
+        now = self.clock()
+        if ctrl.phase == 'GREEN':
+            avg = node.avg_density(now)
+            if avg is not None:
+                ctrl.maybe_apply_rules(avg)
+            elif now - ctrl.phase_start_time >= ctrl.rules.warmup_s and now - ctrl.last_rule_time >= ctrl.rules.rule_interval_s:
+                # No recent camera data: keep the planned green rather than cut it blind
+                ctrl.last_rule_time = now
+        ctrl.advance_phase_if_due()
+        if ctrl.phase != node.phase:
+            node.phase = ctrl.phase
+            node.last_command = None
+            if ctrl.phase == 'GREEN':
+                self._green_wave(node, now)
+        self._send_countdown(node, now)
+        self._schedule(node)
+
+    def _green_wave(self, node: _Intersection, green_start: float):
+        for target, offset in node.downstream:
+            tctrl = target.controller
+            if tctrl.phase != 'RED':
+                continue
+            red_end = tctrl.phase_start_time + tctrl.red_total
+            delta = (green_start + offset) - red_end
+            delta = max(-self.max_red_adjust_s, min(self.max_red_adjust_s, delta))
+            # Never end a red in the past
+            delta = max(delta, self.clock() - red_end)
+            if abs(delta) >= self.tick_s:
+                tctrl.shift_phase_end(delta)
+                self._schedule(target)
+
+    def _send_countdown(self, node: _Intersection, now: float):
+        if node.sender is None:
+            return
+        ctrl = node.controller
+        if ctrl.phase == 'GREEN':
+            command = f"C{int(round(ctrl.get_remaining_green()))}"
+        elif ctrl.phase == 'YELLOW':
+            command = f"B{int(round(max(0.0, ctrl.yellow_total - (now - ctrl.phase_start_time))))}"
+        else:
+            command = f"A{int(round(max(0.0, ctrl.red_total - (now - ctrl.phase_start_time))))}"
+        if command != node.last_command:
+            node.sender.send(command)
+            node.last_command = command
+
+    def run_due(self) -> int:
+        """Step every controller whose timer expired; returns how many ran."""
+        ran = 0
+        for node, gen in self.wheel.advance(self.clock()):
+            if gen != node.timer_gen:
+                continue  # superseded by a reschedule
+            self._step(node)
+            ran += 1
+        return ran
+
+    # ---- service ------------------------------------------------------------
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                if msg.get("cmd") == "status":
+                    writer.write((json.dumps(self.status()) + "\n").encode("utf-8"))
+                    await writer.drain()
+                elif "id" in msg and "density" in msg:
+                    self.on_density(str(msg["id"]), msg["density"], msg.get("ts"))
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        kind, target = parse_address(self.listen)
+        if kind == "unix":
+            server = await asyncio.start_unix_server(self._handle_client, path=target)
+        else:
+            server = await asyncio.start_server(self._handle_client, *target)
+        print(f"Coordinator: {len(self.nodes)} intersections, listening on {self.listen}")
+        async with server:
+            while True:
+                self.run_due()
+                next_due = self.wheel.next_due()
+                delay = self.tick_s if next_due is None else max(0.0, next_due - self.clock())
+                await asyncio.sleep(delay)
+
+    def close(self):
+        for sender in self._senders.values():
+            sender.close()
+
+
+class DensityPublisher:
+    """Blocking-free client used by camera workers to push density to the coordinator.
+
+    Sends are best effort: if the coordinator is down, updates are dropped
+    and the connection is retried at most every `retry_s` seconds. When the
+    socket takes only part of a line, the rest is kept and flushed before
+    anything new, so the coordinator never sees two lines glued together;
+    updates published while it is still pending are dropped.
+    """
+
+    def __init__(self, address: str, intersection_id: str, retry_s: float = 5.0):
+        self.kind, self.target = parse_address(address)
+        self.intersection_id = intersection_id
+        self.retry_s = retry_s
+        self._sock: Optional[socket.socket] = None
+        self._pending = b""
+        self._next_retry = 0.0
+
+    def _connect(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_retry:
+            return False
+        self._next_retry = now + self.retry_s
+        try:
+            family = socket.AF_UNIX if self.kind == "unix" else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(0.5)
+            sock.connect(self.target)
+            sock.setblocking(False)
+            self._sock = sock
+            self._pending = b""
+            return True
+        except OSError:
+            return False
+
+    def publish(self, density: float, ts: Optional[float] = None):
+        if self._sock is None and not self._connect():
+            return
+        try:
+            if self._pending:
+                self._pending = self._pending[self._sock.send(self._pending):]
+                if self._pending:
+                    return  # coordinator is behind; drop this update
+            msg = json.dumps({"id": self.intersection_id, "density": round(float(density), 5),
+                              "ts": ts if ts is not None else time.time()}) + "\n"
+            data = msg.encode("utf-8")
+            self._pending = data[self._sock.send(data):]
+        except BlockingIOError:
+            pass  # coordinator is behind; drop this update
+        except OSError:
+            self.close()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._pending = b""
+
+
+class _PrintSender:
+    def __init__(self, address: str):
+        self.address = address
+
+    def send(self, command: str):
+        print(f"-> {self.address} {command}")
+
+    def close(self):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Multi-intersection signal coordinator")
+    parser.add_argument("config", help="District JSON (intersections, green_wave, listen)")
+    parser.add_argument("--dry-run", action="store_true", help="Print ESP32 commands instead of sending")
+    return parser.parse_args()
+
+
+async def _main(args):
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    coordinator = Coordinator(config, sender_factory=_PrintSender if args.dry_run else None)
+    try:
+        await coordinator.serve()
+    finally:
+        coordinator.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main(parse_args()))
+    except KeyboardInterrupt:
+        pass
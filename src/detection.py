@@ -0,0 +1,103 @@
+import math
+from typing import Any, Iterable
+
+import numpy as np
+
+# Complete YOLO class names (COCO dataset)
+classNames = ["person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+              "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
+              "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella",
+              "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite", "baseball bat",
+              "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle", "wine glass", "cup",
+              "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange", "broccoli",
+              "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant", "bed",
+              "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+              "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+              "teddy bear", "hair drier", "toothbrush"]
+
+vehicle_classes = ["car", "bus", "truck", "motorcycle"]
+
+# Detections below this confidence are not handed to the tracker
+DEFAULT_CONF_THRESHOLD = 0.3
+
+
+def extract_vehicle_detections(results: Iterable[Any], conf_threshold: float = DEFAULT_CONF_THRESHOLD) -> np.ndarray:
+    """Convert YOLO results into an (N,5) [x1,y1,x2,y2,conf] array of vehicles."""
+    rows = []
+    for r in results:
+        boxes = r.boxes
+        for box in boxes:
+            x1, y1, x2, y2 = box.xyxy[0]
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+
+            conf = math.ceil((box.conf[0] * 100)) / 100
+
+            cls = int(box.cls[0])
+            currentClass = classNames[cls]
+
+            if currentClass in vehicle_classes and conf > conf_threshold:
+                rows.append([x1, y1, x2, y2, conf])
+    if not rows:
+        return np.empty((0, 5))
+    return np.array(rows, dtype=float)
+
+
+# Class ids of vehicle_classes, so filtering needs no name lookups
+VEHICLE_CLASS_IDS = frozenset(classNames.index(name) for name in vehicle_classes)
+
+
+class DetectionBuffer:
+    """Fixed-capacity (N,5) detection array refilled in place every frame.
+
+    fill() yields the same rows as extract_vehicle_detections, but writes
+    them into one preallocated array and returns a view of its first N rows.
+    The view is overwritten by the next fill(), so a consumer that keeps
+    detections across frames must copy them. Detections beyond `capacity`
+    are dropped and counted in `overflow`.
+    """
+
+    def __init__(self, capacity: int = 512):
+        self.data = np.empty((int(capacity), 5))
+        self.overflow = 0
+
+    def fill(self, results: Iterable[Any], conf_threshold: float = DEFAULT_CONF_THRESHOLD) -> np.ndarray:
+        n = 0
+        capacity = len(self.data)
+        for r in results:
+            boxes = r.boxes
+            raw = getattr(boxes, "data", None)
+            if raw is not None and hasattr(raw, "cpu"):
+                # ultralytics Boxes: one (N,6) [x1,y1,x2,y2,conf,cls] tensor
+                n = self._fill_array(raw.cpu().numpy(), n, conf_threshold)
+                continue
+            for box in boxes:
+                cls = int(box.cls[0])
+                if cls not in VEHICLE_CLASS_IDS:
+                    continue
+                conf = math.ceil((box.conf[0] * 100)) / 100
+                if conf <= conf_threshold:
+                    continue
+                if n == capacity:
+                    self.overflow += 1
+                    continue
+                x1, y1, x2, y2 = box.xyxy[0]
+                row = self.data[n]
+                row[0], row[1], row[2], row[3], row[4] = int(x1), int(y1), int(x2), int(y2), conf
+                n += 1
+        return self.data[:n]
+
+    def _fill_array(self, raw: np.ndarray, n: int, conf_threshold: float) -> int:
+        for x1, y1, x2, y2, score, cls in raw:
+            if int(cls) not in VEHICLE_CLASS_IDS:
+                continue
+            # Same float32 rounding as extract_vehicle_detections does on the tensor
+            conf = math.ceil(score * np.float32(100)) / 100
+            if conf <= conf_threshold:
+                continue
+            if n == len(self.data):
+                self.overflow += 1
+                continue
+            row = self.data[n]
+            row[0], row[1], row[2], row[3], row[4] = int(x1), int(y1), int(x2), int(y2), conf
+            n += 1
+        return n
@@ -0,0 +1,177 @@
+"""Persistent per-frame detection cache.
+
+Filtered (N,5) detection arrays are stored per frame in two flat binary
+columns inside a cache entry directory:
+
+  dets.f32     float32 rows [x1, y1, x2, y2, conf], all frames back to back
+  offsets.i64  int64 end offset (in rows) of each frame inside dets.f32
+  meta.json    cache key inputs and a "complete" flag
+
+Both files are append-only, so an interrupted run keeps every frame it
+finished and the next run resumes from there. Reads memory-map the files,
+which gives random access by frame index without loading the whole cache.
+"""
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+DET_COLUMNS = 5
+_DETS_FILE = "dets.f32"
+_OFFSETS_FILE = "offsets.i64"
+_META_FILE = "meta.json"
+
+
+def fingerprint_file(path: str, chunk_size: int = 1 << 20, samples: int = 16) -> str:
+    """Hash a file by its size plus evenly spaced chunks.
+
+    Small files are hashed completely; large videos are sampled so the key can
+    be computed in milliseconds instead of reading gigabytes on every start.
+    """
+    h = hashlib.sha1()
+    size = os.path.getsize(path)
+    h.update(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        if size <= chunk_size * samples:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+        else:
+            step = (size - chunk_size) // (samples - 1)
+            for i in range(samples):
+                f.seek(i * step)
+                h.update(f.read(chunk_size))
+    return h.hexdigest()
+
+
+def make_cache_key(video_path: str, model_path: str, settings: Dict[str, Any],
+                   mask_path: Optional[str] = None) -> str:
+    """Combine video, model weights, mask and inference settings into one key."""
+    parts = {
+        "video": fingerprint_file(video_path),
+        "model": fingerprint_file(model_path),
+        "mask": fingerprint_file(mask_path) if mask_path and os.path.exists(mask_path) else None,
+        "settings": settings,
+    }
+    blob = json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(blob).hexdigest()
+
+
+class DetectionCache:
+    """Append-only, memory-mapped store of per-frame detections for one key."""
+
+    def __init__(self, cache_dir: str, key: str, meta: Optional[Dict[str, Any]] = None):
+        self.path = os.path.join(cache_dir, key)
+        os.makedirs(self.path, exist_ok=True)
+        self._dets_path = os.path.join(self.path, _DETS_FILE)
+        self._offsets_path = os.path.join(self.path, _OFFSETS_FILE)
+        self._meta_path = os.path.join(self.path, _META_FILE)
+
+        self.meta: Dict[str, Any] = {"key": key, "complete": False}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.meta.update(json.load(f))
+        elif meta:
+            self.meta.update(meta)
+
+        self._offsets = self._load_offsets()
+        end = int(self._offsets[-1]) if len(self._offsets) else 0
+        self._truncate_dets(end)
+        self._dets = self._map_dets(end)
+
+        self._dets_f = None
+        self._offsets_f = None
+        self._write_meta()
+
+    def _load_offsets(self) -> np.ndarray:
+        if not os.path.exists(self._offsets_path):
+            return np.empty(0, dtype=np.int64)
+        size = os.path.getsize(self._offsets_path)
+        n = size // 8
+        if size != n * 8:
+            # Drop a torn trailing write from an interrupted run
+            with open(self._offsets_path, "r+b") as f:
+                f.truncate(n * 8)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.array(np.memmap(self._offsets_path, dtype=np.int64, mode="r", shape=(n,)))
+
+    def _truncate_dets(self, rows: int):
+        want = rows * DET_COLUMNS * 4
+        if os.path.exists(self._dets_path) and os.path.getsize(self._dets_path) != want:
+            with open(self._dets_path, "r+b") as f:
+                f.truncate(want)
+
+    def _map_dets(self, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty((0, DET_COLUMNS), dtype=np.float32)
+        return np.memmap(self._dets_path, dtype=np.float32, mode="r", shape=(rows, DET_COLUMNS))
+
+    def _write_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2, sort_keys=True, default=str)
+        os.replace(tmp, self._meta_path)
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.meta.get("complete", False))
+
+    def __len__(self) -> int:
+        """Number of frames with stored detections."""
+        return len(self._offsets)
+
+    def __contains__(self, frame_idx: int) -> bool:
+        return 0 <= frame_idx < len(self._offsets)
+
+    def get(self, frame_idx: int) -> np.ndarray:
+        """Return the (N,5) detections of a frame, ready for Sort.update."""
+        if frame_idx not in self:
+            raise IndexError(f"frame {frame_idx} not cached ({len(self)} frames available)")
+        start = int(self._offsets[frame_idx - 1]) if frame_idx > 0 else 0
+        end = int(self._offsets[frame_idx])
+        return np.asarray(self._dets[start:end], dtype=float)
+
+    def append(self, detections: np.ndarray):
+        """Store detections for the next frame (frame index == len(self))."""
+        if self._dets_f is None:
+            self._dets_f = open(self._dets_path, "ab")
+            self._offsets_f = open(self._offsets_path, "ab")
+            self._pending = []
+        rows = np.ascontiguousarray(detections, dtype=np.float32).reshape(-1, DET_COLUMNS)
+        self._dets_f.write(rows.tobytes())
+        end = (int(self._offsets[-1]) if len(self._offsets) else 0) + sum(self._pending) + len(rows)
+        self._offsets_f.write(np.int64(end).tobytes())
+        self._pending.append(len(rows))
+
+    def flush(self):
+        """Flush appended frames to disk and make them readable."""
+        if self._dets_f is None:
+            return
+        # Detections first, so a visible offset always points at written rows
+        self._dets_f.flush()
+        self._offsets_f.flush()
+        if self._pending:
+            self._offsets = np.concatenate(
+                [self._offsets, (int(self._offsets[-1]) if len(self._offsets) else 0) + np.cumsum(self._pending)]
+            ).astype(np.int64)
+            self._pending = []
+            self._dets = self._map_dets(int(self._offsets[-1]))
+
+    def mark_complete(self, frame_count: Optional[int] = None):
+        """Flag the cache as covering the whole video."""
+        self.flush()
+        self.meta["complete"] = True
+        self.meta["frames"] = len(self) if frame_count is None else int(frame_count)
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+        if self._dets_f is not None:
+            self._dets_f.close()
+            self._offsets_f.close()
+            self._dets_f = None
+            self._offsets_f = None
+        self.meta["frames_cached"] = len(self)
+        self._write_meta()
@@ -0,0 +1,89 @@
+"""Message senders for the ESP32 signal display (serial and Wi-Fi TCP)."""
+import socket
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+from metrics import NullMetrics
+
+_NULL_METRICS = NullMetrics()
+
+
+def format_status(green_s: int, red_s: int, yellow_s: int, saved_s: int) -> str:
+    return f"GREEN:{green_s},RED:{red_s},YELLOW:{yellow_s},SAVED:{saved_s}\n"
+
+
+def send_status(ser, green_s: int, red_s: int, yellow_s: int, saved_s: int, metrics=_NULL_METRICS,
+                verbose: bool = True) -> str:
+    """Write one status line to an open serial port (if any) and return it."""
+    payload = format_status(green_s, red_s, yellow_s, saved_s)
+    if ser is not None and ser.writable():
+        try:
+            with metrics.stage("serial_io"):
+                ser.write(payload.encode('utf-8'))
+        except Exception as e:
+            metrics.inc("serial_write_failures_total")
+            print(f"Serial write error: {e}")
+    if verbose:
+        # Also print for debugging/visibility
+        print(f"-> ESP32 {payload.strip()}")
+    return payload
+
+
+def send_command(ip: str, port: int, command: str, metrics=_NULL_METRICS, timeout: float = 1.5) -> bool:
+    """Send one newline-terminated command over a short-lived TCP connection."""
+    message = command + "\n"
+    try:
+        with metrics.stage("tcp_io"), socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect((ip, port))
+            s.sendall(message.encode('utf-8'))
+            return True
+    except Exception as e:
+        metrics.inc("tcp_send_failures_total")
+        print(f"TCP send failed to {ip}:{port} -> {command} ({e})")
+        return False
+
+
+class LatestSender:
+    """Runs `send(*args)` on its own thread; only the newest unsent message is kept.
+
+    A TCP connect to an unreachable ESP32 blocks for the full timeout, so the
+    control loop hands its sends to one of these instead of calling them
+    inline. Messages replaced before they went out are counted in `replaced`.
+    """
+
+    def __init__(self, send: Callable[..., Any], name: str = "esp32-sender"):
+        self._send = send
+        self._pending: Optional[Tuple] = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self.replaced = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, *args):
+        with self._cond:
+            if self._pending is not None:
+                self.replaced += 1
+            self._pending = args
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                args, self._pending = self._pending, None
+            try:
+                self._send(*args)
+            except Exception as e:
+                print(f"ESP32 send error: {e}")
+
+    def close(self, timeout: float = 2.0):
+        """Send what is still pending, then stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
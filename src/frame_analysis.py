@@ -0,0 +1,125 @@
+"""Per-frame masking, detection, tracking and density of the single-process loop.
+
+FrameAnalyzer owns the buffers these steps write into: the masked frame, the
+detection array and the tracked-box table that the overlay and telemetry
+read. They are allocated once and refilled every frame. main.py runs every
+analysed frame through it, and multi_camera.py keeps one per stream.
+`benchmarks/run.py alloc` traces the same calls
+with a stub model, so an allocation added here shows up in the check.
+"""
+import time
+from typing import Any, Callable, Optional
+
+import cv2
+import numpy as np
+
+from detection import DEFAULT_CONF_THRESHOLD, DetectionBuffer
+from metrics import NullMetrics
+
+# Columns of the tracked-box table, one row per SORT track (see overlay.TrackedBox)
+BOX_X1, BOX_Y1, BOX_W, BOX_H, BOX_ID, BOX_IN_POLYGON = range(6)
+
+
+class FrameAnalyzer:
+    """Detections -> tracks -> polygon density for one camera, into reused buffers.
+
+    `tracked_boxes`, `in_polygon` and `tracks` are views that the next frame
+    overwrites; a consumer that keeps them (e.g. the recorder) must copy.
+    """
+
+    def __init__(self, scene, frame_shape, density_window, tracker_factory: Callable[[], Any],
+                 conf_threshold: float = DEFAULT_CONF_THRESHOLD, metrics=None, max_tracks: int = 256):
+        self.scene = scene
+        self.window = density_window
+        self.conf_threshold = float(conf_threshold)
+        self.metrics = metrics if metrics is not None else NullMetrics()
+        self._tracker_factory = tracker_factory
+        self.tracker = tracker_factory()
+        self.masked = np.empty(frame_shape, dtype=np.uint8)
+        self.detections = DetectionBuffer()
+        self._boxes = np.zeros((int(max_tracks), 6), dtype=np.int32)
+        self._n = 0
+        self.tracks = np.empty((0, 5))
+        self.density = 0.0
+        self.avg_density = 0.0
+        self.vehicles_in_polygon = 0
+        self.infer_s = 0.0
+
+    @property
+    def tracked_boxes(self) -> np.ndarray:
+        """(N,6) int32 rows of x1, y1, w, h, track_id, in_polygon."""
+        return self._boxes[:self._n]
+
+    @property
+    def in_polygon(self) -> np.ndarray:
+        return self._boxes[:self._n, BOX_IN_POLYGON]
+
+    def reset_tracker(self):
+        """Start a fresh tracker, e.g. after frames that ran no detector."""
+        self.tracker = self._tracker_factory()
+
+    def mask(self, img: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """Black out everything outside the scene mask, into `dst` (default: the reused buffer)."""
+        with self.metrics.stage("masking"):
+            return cv2.bitwise_and(img, self.scene.mask, dst=self.masked if dst is None else dst)
+
+    def detect(self, model, img: np.ndarray, imgsz: int) -> np.ndarray:
+        """Mask, run the model and extract vehicle detections; sets `infer_s`."""
+        region = self.mask(img)
+        with self.metrics.stage("inference"):
+            start = time.perf_counter()
+            results = model(region, imgsz=imgsz)
+            self.infer_s = time.perf_counter() - start
+        return self.extract(results)
+
+    def extract(self, results) -> np.ndarray:
+        """Vehicle detections of one frame's model results (e.g. its slice of a batch)."""
+        with self.metrics.stage("extraction"):
+            return self.detections.fill(results, self.conf_threshold)
+
+    def track(self, detections: np.ndarray, position: int) -> float:
+        """Track one frame's detections and measure density; returns the window average."""
+        with self.metrics.stage("tracking"):
+            tracks = self.tracker.update(detections)
+        self.tracks = tracks
+        self.metrics.set_gauge("detections", len(detections))
+        self.metrics.set_gauge("tracks", len(tracks))
+
+        with self.metrics.stage("density"):
+            scene = self.scene
+            n = len(tracks)
+            if n > len(self._boxes):
+                self._boxes = np.zeros((2 * n, 6), dtype=np.int32)
+            boxes = self._boxes
+            area = 0
+            inside = 0
+            for i in range(n):
+                row = boxes[i]
+                # Same truncation as int() on each coordinate
+                row[:5] = tracks[i]
+                x1, y1, x2, y2 = int(row[0]), int(row[1]), int(row[2]), int(row[3])
+                w, h = x2 - x1, y2 - y1
+                in_polygon = scene.contains_point((x1 + w // 2, y1 + h // 2))
+                if in_polygon:
+                    inside += 1
+                    area += scene.bbox_area_in_polygon(x1, y1, x2, y2)
+                row[BOX_W] = w
+                row[BOX_H] = h
+                row[BOX_IN_POLYGON] = in_polygon
+            self._n = n
+            self.vehicles_in_polygon = inside
+            self.density = area / scene.polygon_area if scene.polygon_area > 0 else 0
+            self.avg_density = self.window.add(position, self.density)
+        return self.avg_density
+
+    def hold(self, position: int, density: float) -> float:
+        """Record a density measured without a detector; boxes are cleared, the count is kept."""
+        with self.metrics.stage("density"):
+            self._n = 0
+            self.density = density
+            self.avg_density = self.window.add(position, density)
+        return self.avg_density
+
+    def clear(self):
+        """Drop the boxes of a frame that is not analysed at all."""
+        self._n = 0
@@ -26,6 +26,13 @@ def load_runtime_config(config_path: str) -> Dict[str, Any]:
     Expected schema (all fields optional, validated when used):
       {
         "video_path": "path/to/video.mp4",
+        "capture": {
+          "backend": "opencv",
+          "width": 0, "height": 0, "scale": 1.0,
+          "stride": 1,
+          "ffmpeg_threads": 0,
+          "hwaccel": null
+        },
         "mask_path": "path/to/mask.png",
         "polygon_points": [[x1,y1], [x2,y2], [x3,y3], [x4,y4]],
         "serial": {
@@ -36,15 +43,122 @@ def load_runtime_config(config_path: str) -> Dict[str, Any]:
         "esp32": {
           "ip": "192.168.1.50",
           "port": 80
+        },
+        "inference": {
+          "imgsz": 640,
+          "conf": 0.3
+        },
+        "scheduler": {
+          "enabled": false,
+          "target_hz": 5,
+          "models": ["assets/yolov8n.pt", "assets/yolov8l.pt"],
+          "tier_costs": [0.1, 1.0],
+          "imgsz_levels": [640, 512, 416, 320],
+          "max_stride": 30,
+          "alpha": 0.2, "headroom": 0.8, "min_dwell": 10,
+          "log_path": "logs/scheduler.jsonl"
+        },
+        "controller": {
+          "yellow_seconds": 5,
+          "red_seconds": 60,
+          "worst_case": 90, "best_case": 30,
+          "warmup_s": 10, "rule_interval_s": 5,
+          "low_density": 0.3, "low_reduction": 0.4,
+          "medium_density_min": 0.4, "medium_density_max": 0.6, "medium_reduction": 0.25,
+          "high_density": 0.7, "high_reduction": 0.0
+        },
+        "control": {
+          "tick_hz": 10,
+          "stale_after_s": 2.0,
+          "stale_policy": "hold"
+        },
+        "metrics": {
+          "enabled": false,
+          "host": "127.0.0.1",
+          "port": 9108,
+          "file": "logs/metrics.jsonl",
+          "file_interval_s": 10
+        },
+        "telemetry": {
+          "enabled": false,
+          "dir": "logs/telemetry",
+          "camera_id": "cam0",
+          "batch_rows": 4096,
+          "flush_interval_s": 5,
+          "rotate_rows": 500000,
+          "rotate_s": 600
+        },
+        "recorder": {
+          "enabled": false,
+          "dir": "recordings",
+          "camera_id": "cam0",
+          "fps": 0,
+          "segment_s": 300,
+          "queue_size": 16,
+          "codec": "mp4v",
+          "max_segments": 0
+        },
+        "detection_cache": {
+          "enabled": false,
+          "dir": ".cache/detections"
+        },
+        "profiling": {
+          "enabled": false,
+          "dir": "logs/profiles",
+          "mode": "sampling",
+          "duration_s": 30,
+          "top_n": 25,
+          "signal": true,
+          "control_port": 9109
+        },
+        "coordinator": {
+          "address": "127.0.0.1:9200",
+          "intersection_id": "cam0"
+        },
+        "scene_cache": {
+          "enabled": true,
+          "dir": ".cache/scenes"
+        },
+        "hot_reload": {
+          "enabled": true,
+          "interval_s": 1.0
+        },
+        "pipeline": {
+          "workers": 0,
+          "slots": 0,
+          "drop_policy": "block",
+          "threads_per_worker": 0
+        },
+        "phase_scheduler": {
+          "enabled": false,
+          "idle_hz": 1.0,
+          "lead_s": 1.0,
+          "edge_s": 1.0
+        },
+        "density_engine": {
+          "engine": "dnn",
+          "method": "mog2", "scale": 0.25,
+          "history": 500, "var_threshold": 16,
+          "calibrate_every_s": 5, "calib_points": 24, "warmup_s": 3
+        },
+        "inference_server": {
+          "address": "unix:/tmp/traffic-infer.sock",
+          "model_path": "assets/yolov8l.pt",
+          "max_batch": 8, "max_wait_s": 0.01,
+          "max_dets": 512, "timeout_s": 10, "connect_timeout_s": 5
+        },
+        "multi_camera": {
+          "imgsz": 640, "conf": 0.3, "max_wait_s": 0.05,
+          "sources": [
+            {"id": "north", "video_path": "rtsp://...", "mask_path": "assets/north_mask.png",
+             "polygon_points": [[589, 206], [417, 539], [1275, 539], [874, 209]],
+             "esp32": {"ip": "10.0.0.11", "port": 80}}
+          ]
         }
       }
     """
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if not isinstance(data, dict):
-                return {}
-            return data
+        return read_runtime_config(config_path)
     except FileNotFoundError:
         return {}
     except Exception:
@@ -52,6 +166,35 @@ def load_runtime_config(config_path: str) -> Dict[str, Any]:
         return {}
 
 
+def read_runtime_config(config_path: str) -> Dict[str, Any]:
+    """Strict variant of load_runtime_config: raises on missing or malformed files."""
+    with open(config_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("config root must be a JSON object")
+    return data
+
+
+def validate_runtime_config(cfg: Dict[str, Any]) -> List[str]:
+    """Return a list of problems with fields that are present (empty if valid)."""
+    errors: List[str] = []
+    if "polygon_points" in cfg and _validate_polygon(cfg["polygon_points"]) is None:
+        errors.append("polygon_points must be a list of at least 3 [x, y] pairs")
+    if "mask_path" in cfg and not (isinstance(cfg["mask_path"], str) and os.path.exists(cfg["mask_path"])):
+        errors.append(f"mask_path does not exist: {cfg['mask_path']}")
+    for key_path in (["esp32", "port"], ["serial", "baud"]):
+        value = get_config_value(cfg, key_path, None)
+        if value is not None:
+            try:
+                int(value)
+            except (TypeError, ValueError):
+                errors.append(f"{'.'.join(key_path)} must be an integer")
+    ip = get_config_value(cfg, ["esp32", "ip"], None)
+    if ip is not None and not isinstance(ip, str):
+        errors.append("esp32.ip must be a string")
+    return errors
+
+
 def get_config_value(cfg: Dict[str, Any], key_path: List[str], default: Any) -> Any:
     node: Any = cfg
     for key in key_path:
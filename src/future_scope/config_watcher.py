@@ -0,0 +1,66 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from future_scope.config_loader import read_runtime_config, validate_runtime_config
+
+
+class ConfigWatcher:
+    """Polls the runtime config file and prepares reloads off the frame loop.
+
+    When the file changes, the new config is parsed and validated on the
+    watcher thread, then `prepare(cfg)` builds whatever derived artifacts the
+    caller needs (e.g. a compiled Scene). The result is published as a single
+    reference; the frame loop picks it up with `poll()` between frames, so a
+    swap never happens mid-frame and never blocks on file or image I/O.
+    Invalid configs are reported and ignored, keeping the running setup.
+    """
+
+    def __init__(self, config_path: str, prepare: Callable[[Dict[str, Any]], Any], interval_s: float = 1.0):
+        self.config_path = config_path
+        self.prepare = prepare
+        self.interval_s = interval_s
+        self._stamp = self._file_stamp()
+        self._pending: Optional[Tuple[Dict[str, Any], Any]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.config_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            stamp = self._file_stamp()
+            if stamp is None or stamp == self._stamp:
+                continue
+            self._stamp = stamp
+            try:
+                cfg = read_runtime_config(self.config_path)
+                errors = validate_runtime_config(cfg)
+                if errors:
+                    print("Config reload rejected: " + "; ".join(errors))
+                    continue
+                prepared = self.prepare(cfg)
+            except Exception as e:
+                # Editors often write files in several steps; the next change retries
+                print(f"Config reload failed: {e}")
+                continue
+            with self._lock:
+                self._pending = (cfg, prepared)
+
+    def poll(self) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """Return (config, prepared) once per successful reload, else None."""
+        if self._pending is None:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        return pending
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,432 @@
+"""Local inference server: one YOLO model shared by several camera processes.
+
+Loading yolov8l.pt takes seconds and hundreds of MB in every process that
+does it. The server loads it once. Camera processes (main.py with
+`inference_server.address` set, or InferenceClient directly) send frames to
+it, and detections come back.
+
+Frames never go through the socket. Each client creates one shared-memory
+block that holds a frame followed by room for `max_dets` detections. It
+writes the masked frame into the block and sends a one-line JSON request.
+The server runs the model on a view of the block, writes the (N,5)
+[x1,y1,x2,y2,conf] vehicle detections after the frame, and replies with N.
+
+Micro-batching: the first pending request opens a batch. Requests from
+other clients that arrive within `max_wait_s` join it, up to `max_batch`.
+The batch then goes through one model call per distinct imgsz. A lone
+client pays at most `max_wait_s` of extra latency.
+
+Protocol (one JSON object per line, over a Unix or TCP socket on this host):
+  -> {"op": "hello", "shm": "<name>", "shape": [h, w, 3], "max_dets": 512}
+  <- {"ok": true, "model": "<path>", "pid": 1234}
+  -> {"op": "infer", "id": 7, "imgsz": 640, "conf": 0.3}
+  <- {"id": 7, "n": 5, "infer_ms": 41.2, "batch": 3}     or {"id": 7, "error": "..."}
+
+Usage:
+  python src/inference_server.py [--listen unix:/tmp/traffic-infer.sock] [--model assets/yolov8l.pt]
+                                 [--max-batch 8] [--max-wait-ms 10] [--config src/future_scope/config.json]
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from coordinator import parse_address
+from detection import DEFAULT_CONF_THRESHOLD, extract_vehicle_detections
+from future_scope.config_loader import get_config_value, load_runtime_config
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "future_scope", "config.json")
+DEFAULT_ADDRESS = "unix:/tmp/traffic-infer.sock"
+DEFAULT_MAX_DETS = 512
+DET_DTYPE = np.float64
+
+
+def _block_size(shape: Tuple[int, ...], max_dets: int) -> int:
+    return int(np.prod(shape)) + max_dets * 5 * np.dtype(DET_DTYPE).itemsize
+
+
+def _views(buf, shape: Tuple[int, ...], max_dets: int) -> Tuple[np.ndarray, np.ndarray]:
+    frame_bytes = int(np.prod(shape))
+    frame = np.ndarray(shape, dtype=np.uint8, buffer=buf)
+    dets = np.ndarray((max_dets, 5), dtype=DET_DTYPE, buffer=buf, offset=frame_bytes)
+    return frame, dets
+
+
+def _send_line(sock: socket.socket, msg: Dict[str, Any]):
+    sock.sendall((json.dumps(msg) + "\n").encode("utf-8"))
+
+
+class _Client:
+    """Server-side state of one connection."""
+
+    def __init__(self, sock: socket.socket, name: str):
+        self.sock = sock
+        self.name = name
+        self.shm: Optional[shared_memory.SharedMemory] = None
+        self.frame: Optional[np.ndarray] = None
+        self.dets: Optional[np.ndarray] = None
+        self.send_lock = threading.Lock()
+        # Requests queued or in a batch; the shared memory stays mapped until they finish
+        self.in_flight = 0
+        self.closed = False
+        self._state_lock = threading.Lock()
+
+    def attach(self, shm_name: str, shape: Tuple[int, ...], max_dets: int):
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        # The client owns the block; stop this process's tracker unlinking it on exit
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        if self.shm.size < _block_size(shape, max_dets):
+            raise ValueError(f"shared memory {shm_name} is smaller than frame + detections")
+        self.frame, self.dets = _views(self.shm.buf, shape, max_dets)
+
+    def reply(self, msg: Dict[str, Any]):
+        try:
+            with self.send_lock:
+                _send_line(self.sock, msg)
+        except OSError:
+            pass
+
+    def hold(self) -> bool:
+        """Count one request against the shared memory; False once the client is closed."""
+        with self._state_lock:
+            if self.closed or self.frame is None:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """A held request is done; unmap the block if the client closed meanwhile."""
+        with self._state_lock:
+            self.in_flight -= 1
+            if self.closed and self.in_flight == 0:
+                self._detach()
+
+    def close(self):
+        """Mark the client closed. The batch thread unmaps the block if a request still holds it."""
+        with self._state_lock:
+            self.closed = True
+            if self.in_flight == 0:
+                self._detach()
+        self.sock.close()
+
+    def _detach(self):
+        self.frame = self.dets = None
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass  # a view is still alive somewhere; the mapping goes when it is collected
+            self.shm = None
+
+
+class InferenceServer:
+    """Accepts clients, micro-batches their frames and runs them through one model."""
+
+    def __init__(self, address: str, model, model_name: str = "", max_batch: int = 8, max_wait_s: float = 0.01):
+        self.address = address
+        self.model = model
+        self.model_name = model_name
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = float(max_wait_s)
+        self.requests = 0
+        self.batches = 0
+        self._pending: "queue.Queue[Optional[Tuple[_Client, Dict[str, Any]]]]" = queue.Queue()
+        self._clients: List[_Client] = []
+        self._stop = threading.Event()
+        self._listener: Optional[socket.socket] = None
+
+    # ---- connections --------------------------------------------------------
+
+    def _listen(self) -> socket.socket:
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            if os.path.exists(target):
+                os.unlink(target)  # left behind by a previous run
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(target)
+        sock.listen(16)
+        return sock
+
+    def _handle_client(self, client: _Client):
+        reader = client.sock.makefile("rb")
+        try:
+            for line in reader:
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                op = msg.get("op")
+                if op == "hello":
+                    try:
+                        client.attach(str(msg["shm"]), tuple(int(v) for v in msg["shape"]),
+                                      int(msg.get("max_dets", DEFAULT_MAX_DETS)))
+                        client.reply({"ok": True, "model": self.model_name, "pid": os.getpid()})
+                        print(f"Inference server: client {client.name} attached {msg['shape']}")
+                    except (KeyError, ValueError, OSError) as e:
+                        client.reply({"ok": False, "error": str(e)})
+                elif op == "infer":
+                    if client.hold():
+                        self._pending.put((client, msg))
+                    else:
+                        client.reply({"id": msg.get("id"), "error": "no shared memory attached"})
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            self._clients.remove(client)
+            client.close()
+            print(f"Inference server: client {client.name} disconnected")
+
+    def _accept_loop(self):
+        count = 0
+        while not self._stop.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                break
+            count += 1
+            client = _Client(sock, f"#{count}")
+            self._clients.append(client)
+            threading.Thread(target=self._handle_client, args=(client,), name=f"infer-client-{count}",
+                             daemon=True).start()
+
+    # ---- batching -------------------------------------------------------------
+
+    def _collect(self) -> Optional[List[Tuple[_Client, Dict[str, Any]]]]:
+        first = self._pending.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def run_batch(self, batch: List[Tuple[_Client, Dict[str, Any]]]):
+        """Run one micro-batch: a model call per distinct imgsz, then reply to every client.
+
+        Every request in `batch` holds its client (see _Client.hold); each is
+        released here, so a client that disconnected mid-batch is unmapped only
+        after the model is done with its frame.
+        """
+        try:
+            by_imgsz: Dict[int, List[Tuple[_Client, Dict[str, Any]]]] = {}
+            for client, msg in batch:
+                if not client.closed:
+                    by_imgsz.setdefault(int(msg.get("imgsz", 640)), []).append((client, msg))
+            for imgsz, group in by_imgsz.items():
+                start = time.perf_counter()
+                try:
+                    results = self.model([client.frame for client, _ in group], imgsz=imgsz, verbose=False)
+                except Exception as e:
+                    for client, msg in group:
+                        client.reply({"id": msg.get("id"), "error": f"inference failed: {e!r}"})
+                    continue
+                infer_ms = round((time.perf_counter() - start) * 1000, 2)
+                self.batches += 1
+                for (client, msg), result in zip(group, results):
+                    try:
+                        self._reply_detections(client, msg, result, infer_ms, len(group))
+                    except Exception as e:
+                        print(f"Inference server: reply to client {client.name} failed: {e!r}")
+                results = None  # results keep views of the frames; drop them before releasing
+        finally:
+            for client, _ in batch:
+                client.release()
+
+    def _reply_detections(self, client: _Client, msg: Dict[str, Any], result, infer_ms: float, batch_size: int):
+        if client.closed:
+            return
+        detections = extract_vehicle_detections([result], float(msg.get("conf", DEFAULT_CONF_THRESHOLD)))
+        n = min(len(detections), len(client.dets))
+        client.dets[:n] = detections[:n]
+        reply = {"id": msg.get("id"), "n": n, "infer_ms": infer_ms, "batch": batch_size}
+        if n < len(detections):
+            reply["truncated"] = len(detections)
+        client.reply(reply)
+        self.requests += 1
+
+    def serve(self):
+        self._listener = self._listen()
+        threading.Thread(target=self._accept_loop, name="infer-accept", daemon=True).start()
+        print(f"Inference server: {self.model_name or 'model'} on {self.address} "
+              f"(max_batch {self.max_batch}, max_wait {self.max_wait_s * 1000:g} ms)")
+        while True:
+            batch = self._collect()
+            if batch is None:
+                break
+            self.run_batch(batch)
+
+    def stop(self):
+        self._stop.set()
+        self._pending.put(None)
+        if self._listener is not None:
+            self._listener.close()
+            kind, target = parse_address(self.address)
+            if kind == "unix" and os.path.exists(target):
+                os.unlink(target)
+        for client in list(self._clients):
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.batches:
+            print(f"Inference server: {self.requests} frames in {self.batches} batches "
+                  f"({self.requests / self.batches:.2f} per batch)")
+
+
+class InferenceClient:
+    """Client side: owns the shared-memory block and waits for each reply.
+
+    Write or mask the frame into `frame`, then call infer(). Raises
+    ConnectionError when the server is unreachable or fails the request.
+    """
+
+    def __init__(self, address: str, frame_shape: Tuple[int, int, int], max_dets: int = DEFAULT_MAX_DETS,
+                 timeout_s: float = 10.0, connect_timeout_s: float = 5.0):
+        self.address = address
+        self.frame_shape = tuple(int(v) for v in frame_shape)
+        self.max_dets = int(max_dets)
+        self.timeout_s = float(timeout_s)
+        self._shm = shared_memory.SharedMemory(create=True, size=_block_size(self.frame_shape, self.max_dets))
+        self.frame, self._dets = _views(self._shm.buf, self.frame_shape, self.max_dets)
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._next_id = 0
+        self.server_info: Dict[str, Any] = {}
+        self.last_infer_ms = 0.0
+        self.last_batch = 0
+        deadline = time.monotonic() + float(connect_timeout_s)
+        while True:
+            try:
+                self._connect()
+                break
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    self.close()
+                    raise ConnectionError(f"inference server {address} unavailable: {e}") from e
+                time.sleep(0.2)
+
+    def _connect(self):
+        kind, target = parse_address(self.address)
+        sock = socket.socket(socket.AF_UNIX if kind == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout_s)
+            sock.connect(target)
+            reader = sock.makefile("rb")
+            _send_line(sock, {"op": "hello", "shm": self._shm.name, "shape": list(self.frame_shape),
+                              "max_dets": self.max_dets})
+            info = json.loads(reader.readline() or b"{}")
+        except (OSError, ValueError):
+            sock.close()
+            raise
+        if not info.get("ok"):
+            sock.close()
+            raise OSError(info.get("error", "handshake failed"))
+        self._sock, self._reader, self.server_info = sock, reader, info
+
+    def infer(self, imgsz: int = 640, conf: float = DEFAULT_CONF_THRESHOLD) -> np.ndarray:
+        """Detections for the image currently in `frame`, as an (N,5) array."""
+        try:
+            if self._sock is None:
+                self._connect()
+            self._next_id += 1
+            _send_line(self._sock, {"op": "infer", "id": self._next_id, "imgsz": int(imgsz), "conf": float(conf)})
+            line = self._reader.readline()
+            if not line:
+                raise OSError("server closed the connection")
+            reply = json.loads(line)
+        except (OSError, ValueError) as e:
+            self._disconnect()
+            raise ConnectionError(f"inference server {self.address}: {e}") from e
+        if "error" in reply:
+            raise ConnectionError(f"inference server {self.address}: {reply['error']}")
+        self.last_infer_ms = reply.get("infer_ms", 0.0)
+        self.last_batch = reply.get("batch", 1)
+        n = int(reply["n"])
+        if n == 0:
+            return np.empty((0, 5))
+        return self._dets[:n].copy()
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = self._reader = None
+
+    def close(self):
+        self._disconnect()
+        self.frame = self._dets = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+def create_inference_client(cfg: Optional[Dict], frame_shape: Tuple[int, int, int]) -> Optional[InferenceClient]:
+    """Connect to the server named by the "inference_server" config section (None when unset)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    address = cfg.get("address")
+    if not address:
+        return None
+    try:
+        client = InferenceClient(address, frame_shape, max_dets=int(cfg.get("max_dets", DEFAULT_MAX_DETS)),
+                                 timeout_s=float(cfg.get("timeout_s", 10.0)),
+                                 connect_timeout_s=float(cfg.get("connect_timeout_s", 5.0)))
+    except ConnectionError as e:
+        print(f"{e}; loading the model locally")
+        return None
+    print(f"Using inference server {address} (model {client.server_info.get('model')}, "
+          f"pid {client.server_info.get('pid')})")
+    return client
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve one YOLO model to local camera processes")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Runtime config with an inference_server section")
+    parser.add_argument("--listen", help=f"unix:/path or host:port (default {DEFAULT_ADDRESS})")
+    parser.add_argument("--model", help="Model weights (default assets/yolov8l.pt)")
+    parser.add_argument("--max-batch", type=int, help="Largest micro-batch (default 8)")
+    parser.add_argument("--max-wait-ms", type=float, help="How long a batch waits for more clients (default 10)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    _cfg = load_runtime_config(args.config)
+    _server_cfg = get_config_value(_cfg, ["inference_server"], {})
+    _model_path = args.model or _server_cfg.get("model_path", os.path.join(BASE_DIR, "assets", "yolov8l.pt"))
+    if not os.path.isabs(_model_path):
+        _model_path = os.path.join(BASE_DIR, _model_path)
+    from ultralytics import YOLO
+    server = InferenceServer(
+        args.listen or _server_cfg.get("address", DEFAULT_ADDRESS),
+        YOLO(_model_path),
+        model_name=_model_path,
+        max_batch=args.max_batch or int(_server_cfg.get("max_batch", 8)),
+        max_wait_s=(args.max_wait_ms / 1000.0) if args.max_wait_ms is not None
+        else float(_server_cfg.get("max_wait_s", 0.01)),
+    )
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
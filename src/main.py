@@ -1,14 +1,30 @@
 import numpy as np
-from ultralytics import YOLO
 import cv2 
-import cvzone
-import math
 from sort import*
 import time
 import threading
-import socket
 import os
+import functools
 from future_scope.config_loader import load_runtime_config, get_config_value, get_polygon_from_config
+from detection import vehicle_classes, DEFAULT_CONF_THRESHOLD
+from detection_cache import DetectionCache, make_cache_key
+import esp32
+from controller import DynamicTimingController, TimingRules
+from metrics import create_metrics
+from profiling import create_profiler
+from telemetry import create_telemetry
+from coordinator import DensityPublisher
+from scene import load_scene
+from mp_pipeline import create_pipeline, load_yolo
+from capture import open_capture, scale_points, capture_settings
+from overlay import draw_overlay
+from recorder import create_recorder
+from scheduler import create_scheduler, create_phase_scheduler, DensityWindow
+from control_loop import ControlLoop, DensityBoard
+from inference_server import create_inference_client
+from bgsub_density import create_density_engine
+from frame_analysis import FrameAnalyzer
+from future_scope.config_watcher import ConfigWatcher
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -23,28 +39,36 @@ except ImportError:
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "future_scope", "config.json")
 _cfg = load_runtime_config(CONFIG_PATH)
 
-# Video source
+# Per-stage latency metrics (optional; no-op when disabled)
+metrics = create_metrics(get_config_value(_cfg, ["metrics"], {}))
+
 _base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# On-demand profiler (SIGUSR1 / control socket); idle cost is one check per frame
+profiler = create_profiler(get_config_value(_cfg, ["profiling"], {}), _base_dir)
+
+# Video source
 _video_path_default = os.path.join(_base_dir, "assets", "video.mp4")
 video_path = get_config_value(_cfg, ["video_path"], _video_path_default)
-cap = cv2.VideoCapture(video_path)
+# The "capture" section can decode at a reduced resolution and pass over
+# frames between analysed ones without decoding them (see src/capture.py)
+CAPTURE_CFG = get_config_value(_cfg, ["capture"], {})
+cap = open_capture(video_path, CAPTURE_CFG)
 
 model_path = os.path.join(_base_dir, "assets", "yolov8l.pt")
-model = YOLO(model_path)
-
-# Complete YOLO class names (COCO dataset)
-classNames = ["person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
-              "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat",
-              "dog", "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella",
-              "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite", "baseball bat",
-              "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle", "wine glass", "cup",
-              "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange", "broccoli",
-              "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant", "bed",
-              "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
-              "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
-              "teddy bear", "hair drier", "toothbrush"]
-
-vehicle_classes = ["car", "bus", "truck", "motorcycle"]
+models = {}
+
+# Inference settings; part of the detection cache key
+INFER_IMGSZ = int(get_config_value(_cfg, ["inference", "imgsz"], 640))
+CONF_THRESHOLD = float(get_config_value(_cfg, ["inference", "conf"], DEFAULT_CONF_THRESHOLD))
+
+def get_model(path=None):
+    # Loaded on first use so cached replays never pay the YOLO startup cost
+    path = path or model_path
+    if path not in models:
+        from ultralytics import YOLO
+        models[path] = YOLO(path)
+    return models[path]
 
 # -----------------------------
 # Serial configuration (ESP32)
@@ -68,14 +92,7 @@ def open_serial() -> "serial.Serial | None":
         return None
 
 def send_to_esp32(ser, green_s: int, red_s: int, yellow_s: int, saved_s: int):
-    payload = f"GREEN:{green_s},RED:{red_s},YELLOW:{yellow_s},SAVED:{saved_s}\n"
-    if ser is not None and ser.writable():
-        try:
-            ser.write(payload.encode('utf-8'))
-        except Exception as e:
-            print(f"Serial write error: {e}")
-    # Also print for debugging/visibility
-    print(f"-> ESP32 {payload.strip()}")
+    esp32.send_status(ser, green_s, red_s, yellow_s, saved_s, metrics)
 
 # -----------------------------
 # Wi-Fi TCP configuration (ESP32)
@@ -89,186 +106,153 @@ WIFI_SSID = os.getenv("WIFI_SSID", "")
 WIFI_PASSWORD = os.getenv("WIFI_PASSWORD", "")
 
 def send_command_to_esp32(command: str) -> bool:
-    message = command + "\n"
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(1.5)
-            s.connect((ESP32_IP, ESP32_PORT))
-            s.sendall(message.encode('utf-8'))
-            return True
-    except Exception as e:
-        print(f"TCP send failed to {ESP32_IP}:{ESP32_PORT} -> {command} ({e})")
-        return False
+    return esp32.send_command(ESP32_IP, ESP32_PORT, command, metrics)
 
 _mask_path_default = os.path.join(_base_dir, "assets", "mask.png")
 mask_path = get_config_value(_cfg, ["mask_path"], _mask_path_default)
-mask = cv2.imread(mask_path)
 
-success, img = cap.read()
-if not success:
+frame_size = cap.frame_size
+if not cap.isOpened() or frame_size[0] <= 0 or frame_size[1] <= 0:
     print("No video or input")
     exit()
 
-mask = cv2.resize(mask, (img.shape[1], img.shape[0]))
-if len(mask.shape) == 2:
-    mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+_default_polygon = [(589, 206), (417, 539), (1275, 539), (874, 209)]
 
-cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+def scene_polygon(cfg):
+    # Polygon points are configured in native video pixels
+    return scale_points(get_polygon_from_config(cfg, _default_polygon), cap.native_size, frame_size)
 
-tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
+# Mask, polygon raster/integral, area and crop, compiled once per config and
+# kept on disk so later runs and per-camera workers just map them
+SCENE_CACHE_DIR = None
+if get_config_value(_cfg, ["scene_cache", "enabled"], True):
+    SCENE_CACHE_DIR = get_config_value(_cfg, ["scene_cache", "dir"], os.path.join(_base_dir, ".cache", "scenes"))
+scene = load_scene(mask_path, scene_polygon(_cfg), frame_size, SCENE_CACHE_DIR)
 
-_default_polygon = [(589, 206), (417, 539), (1275, 539), (874, 209)]
-_poly = get_polygon_from_config(_cfg, _default_polygon)
-polygon_points = np.array(_poly, np.int32)
+# -----------------------------
+# Inference server (optional)
+# -----------------------------
+# With inference_server.address set, frames are masked straight into shared
+# memory and detected by a server process that holds the one loaded model
+# (see src/inference_server.py); this process never loads YOLO.
+inference_client = create_inference_client(get_config_value(_cfg, ["inference_server"], {}),
+                                           (frame_size[1], frame_size[0], 3))
+if inference_client is not None:
+    # Detections come from the server's weights
+    model_path = inference_client.server_info.get("model") or model_path
+
+# -----------------------------
+# Detection cache (optional)
+# -----------------------------
+# Stores the filtered detections of every frame so re-runs on the same footage
+# (e.g. to tune the polygon or controller) skip YOLO entirely.
+DETECTION_CACHE_ENABLED = bool(get_config_value(_cfg, ["detection_cache", "enabled"], False))
+DETECTION_CACHE_DIR = get_config_value(_cfg, ["detection_cache", "dir"], os.path.join(_base_dir, ".cache", "detections"))
+
+det_cache = None
+if DETECTION_CACHE_ENABLED:
+    _cache_settings = {
+        "imgsz": INFER_IMGSZ,
+        "conf": CONF_THRESHOLD,
+        "classes": vehicle_classes,
+        "frame_size": list(frame_size),
+    }
+    if frame_size != cap.native_size or cap.stride > 1:
+        # Detections are in scaled pixels and indexed by analysed frame
+        _cache_settings["capture"] = capture_settings(cap)
+    try:
+        _cache_key = make_cache_key(video_path, model_path, _cache_settings, mask_path)
+        det_cache = DetectionCache(DETECTION_CACHE_DIR, _cache_key, meta={"video_path": video_path, "settings": _cache_settings})
+        print(f"Detection cache {_cache_key[:12]}: {len(det_cache)} frames cached"
+              f"{' (complete)' if det_cache.complete else ''}")
+    except Exception as e:
+        print(f"Detection cache disabled: {e}")
+        det_cache = None
+
+# -----------------------------
+# Multiprocess pipeline (optional)
+# -----------------------------
+# A capture process and N YOLO worker processes hand frames over through a
+# shared-memory slot pool; this process keeps tracking, density, control and
+# display, and gets results back in frame order.
+_pipeline_cfg = get_config_value(_cfg, ["pipeline"], {})
+if det_cache is not None and det_cache.complete:
+    # Every frame replays from the cache; there is no inference to spread out
+    _pipeline_cfg = {}
+elif inference_client is not None and _pipeline_cfg.get("workers", 0):
+    print("Multiprocess pipeline is not used with the inference server.")
+    _pipeline_cfg = {}
+pipeline = create_pipeline(_pipeline_cfg, video_path, (frame_size[1], frame_size[0], 3), scene.mask,
+                           functools.partial(load_yolo, model_path), INFER_IMGSZ, CONF_THRESHOLD,
+                           replay_below=len(det_cache) if det_cache is not None else 0, capture_cfg=CAPTURE_CFG)
+if pipeline is not None:
+    pipeline.start()
 
-density_history = []
 fps_estimate = 30 
-frames_per_5_seconds = fps_estimate * 5
+# 5 s of video, counted in source frames so skipped frames keep the span
+density_window = DensityWindow(fps_estimate * 5)
+source_pos = 0
+
+# Masking, detection, tracking and density of each analysed frame, written
+# into buffers reused every frame (see src/frame_analysis.py)
+analyzer = FrameAnalyzer(scene, (frame_size[1], frame_size[0], 3), density_window,
+                         lambda: Sort(max_age=20, min_hits=3, iou_threshold=0.3),
+                         conf_threshold=CONF_THRESHOLD, metrics=metrics)
 
 # -----------------------------
-# Dynamic timing controller
+# Inference scheduler (optional)
 # -----------------------------
-class DynamicTimingController:
-    """Controls green/yellow/red durations based on ROI density.
-
-    Rules:
-    - Start with green = 90s
-    - First 10s: no change
-    - Every 5s afterwards: compute 5s sliding avg density and adjust remaining green time:
-        * density < 0.3  -> reduce remaining by 40%
-        * 0.4 <= d <= 0.6 -> reduce remaining by 25%
-        * d >= 0.7 -> no reduction
-      Values in (0.3-0.4) or (0.6-0.7) -> no change (unspecified)
-    - Bounds: 30s <= green <= 90s
-    - Track total time saved across cycles
-    """
-
-    def __init__(self, yellow_seconds: int = 5, red_seconds: int = 60):
-        self.worst_case = 90
-        self.best_case = 30
-        self.green_total = float(self.worst_case)
-        self.yellow_total = int(yellow_seconds)
-        self.red_total = int(red_seconds)
-        self.phase = 'GREEN'  # GREEN -> YELLOW -> RED
-        self.phase_start_time = time.time()
-        self.last_rule_time = self.phase_start_time
-        self.total_saved = 0.0
-
-    def reset_for_new_green(self):
-        # When a new green phase begins, reset timers and green duration
-        now = time.time()
-        self.phase = 'GREEN'
-        self.phase_start_time = now
-        self.last_rule_time = now
-        self.green_total = float(self.worst_case)
-
-    def get_elapsed(self) -> float:
-        return time.time() - self.phase_start_time
-
-    def get_remaining_green(self) -> float:
-        return max(0.0, self.green_total - self.get_elapsed())
-
-    def maybe_apply_rules(self, five_sec_avg_density: float):
-        if self.phase != 'GREEN':
-            return False
-        elapsed = self.get_elapsed()
-        # Wait first 10s; apply every 5s
-        if elapsed < 10:
-            return False
-        if (time.time() - self.last_rule_time) < 5:
-            return False
-
-        remaining = self.get_remaining_green()
-        if remaining <= 0:
-            return False
-
-        old_green_total = self.green_total
-        reduction_factor = 0.0
-        if five_sec_avg_density < 0.3:
-            reduction_factor = 0.40
-        elif 0.4 <= five_sec_avg_density <= 0.6:
-            reduction_factor = 0.25
-        elif five_sec_avg_density >= 0.7:
-            reduction_factor = 0.0
-        else:
-            reduction_factor = 0.0
-
-        if reduction_factor > 0.0:
-            # Reduce remaining time by factor, keeping elapsed the same
-            reduced_remaining = remaining * (1.0 - reduction_factor)
-            new_total = elapsed + reduced_remaining
-            # Enforce bounds
-            bounded_total = max(self.best_case, min(new_total, self.worst_case))
-            self.green_total = bounded_total
-            self.last_rule_time = time.time()
-            return abs(old_green_total - self.green_total) > 1e-6
-        else:
-            self.last_rule_time = time.time()
-            return False
-
-    def advance_phase_if_due(self):
-        now = time.time()
-        if self.phase == 'GREEN':
-            if now - self.phase_start_time >= self.green_total:
-                self.phase = 'YELLOW'
-                self.phase_start_time = now
-        elif self.phase == 'YELLOW':
-            if now - self.phase_start_time >= self.yellow_total:
-                self.phase = 'RED'
-                self.phase_start_time = now
-        elif self.phase == 'RED':
-            if now - self.phase_start_time >= self.red_total:
-                # End of cycle; compute saved time for the last green
-                saved = max(0.0, self.worst_case - self.green_total)
-                self.total_saved += saved
-                self.reset_for_new_green()
-
-    def get_phase_and_times(self):
-        # Return current phase and integer seconds for countdowns
-        if self.phase == 'GREEN':
-            remaining_green = int(round(self.get_remaining_green()))
-        else:
-            remaining_green = int(round(self.green_total))
-        return {
-            'phase': self.phase,
-            'green_total': int(round(self.green_total)),
-            'yellow_total': int(round(self.yellow_total)),
-            'red_total': int(round(self.red_total)),
-            'remaining_green': remaining_green,
-            'total_saved': int(round(self.total_saved))
-        }
-
-def calculate_polygon_area(points):
-    """Calculate area of polygon using Shoelace formula"""
-    x = points[:, 0]
-    y = points[:, 1]
-    return 0.5 * np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
-
-def is_point_in_polygon(point, polygon):
-    """Check if point is inside polygon"""
-    return cv2.pointPolygonTest(polygon, point, False) >= 0
-
-def calculate_bbox_polygon_intersection_area(bbox, polygon):
-    """Calculate intersection area between bounding box and polygon"""
-    x1, y1, x2, y2 = bbox
-    
-    mask_poly = np.zeros((img.shape[0], img.shape[1]), dtype=np.uint8)
-    cv2.fillPoly(mask_poly, [polygon], 255)
-    
-    mask_bbox = np.zeros((img.shape[0], img.shape[1]), dtype=np.uint8)
-    cv2.rectangle(mask_bbox, (int(x1), int(y1)), (int(x2), int(y2)), 255, -1)
-    
-    intersection = cv2.bitwise_and(mask_poly, mask_bbox)
-    intersection_area = np.sum(intersection > 0)
-    
-    return intersection_area
+# Picks imgsz, frame stride and model tier per frame from recent latency so
+# density updates arrive at scheduler.target_hz; single-process loop only.
+scheduler = None
+_scheduler_cfg = get_config_value(_cfg, ["scheduler"], {})
+if inference_client is not None and isinstance(_scheduler_cfg, dict) and _scheduler_cfg.get("models"):
+    # The server has one model; only imgsz and stride can adapt
+    _scheduler_cfg = dict(_scheduler_cfg, models=[])
+if pipeline is None:
+    scheduler = create_scheduler(_scheduler_cfg, model_path,
+                                 (cap.fps or fps_estimate) / cap.stride, _base_dir)
+elif get_config_value(_cfg, ["scheduler", "enabled"], False):
+    print("Scheduler is not used with the multiprocess pipeline.")
+if scheduler is not None:
+    if det_cache is not None:
+        print("Detection cache disabled: the scheduler varies imgsz, stride and model.")
+        det_cache.close()
+        det_cache = None
+    # Load every tier now; loading one mid-run would blow the frame budget
+    if inference_client is None:
+        for _path in scheduler.model_paths:
+            get_model(_path)
 
-total_polygon_area = calculate_polygon_area(polygon_points)
+# -----------------------------
+# Background-subtraction density (optional)
+# -----------------------------
+# With density_engine.engine "bgsub", most frames get their density from a
+# background subtractor on the downscaled ROI; YOLO + SORT run on one frame
+# every calibrate_every_s to keep the occupancy -> density mapping fitted
+# (see src/bgsub_density.py). Single-process loop only.
+density_engine = None
+_engine_cfg = get_config_value(_cfg, ["density_engine"], {})
+if pipeline is not None or scheduler is not None:
+    if isinstance(_engine_cfg, dict) and _engine_cfg.get("engine") == "bgsub":
+        print("Background-subtraction density is not used with the multiprocess pipeline or the scheduler.")
+else:
+    density_engine = create_density_engine(_engine_cfg, scene, cap.fps or fps_estimate)
+if density_engine is not None and det_cache is not None:
+    print("Detection cache disabled: most frames run no detector.")
+    det_cache.close()
+    det_cache = None
+engine_density = 0.0
+dnn_gap = False
 
 ser = open_serial()
 
 # Initialize controller and inform ESP32 about the first cycle
-controller = DynamicTimingController(yellow_seconds=5, red_seconds=60)
+controller = DynamicTimingController(
+    yellow_seconds=float(get_config_value(_cfg, ["controller", "yellow_seconds"], 5)),
+    red_seconds=float(get_config_value(_cfg, ["controller", "red_seconds"], 60)),
+    rules=TimingRules.from_dict(get_config_value(_cfg, ["controller"], {})),
+)
 send_to_esp32(
     ser,
     green_s=int(round(controller.green_total)),
@@ -277,189 +261,317 @@ send_to_esp32(
     saved_s=int(round(controller.total_saved))
 )
 
-last_sent_phase = None
-last_sent_second = None
+# -----------------------------
+# Phase-aware inference (optional)
+# -----------------------------
+# The rules read density only in GREEN, after the warmup and every rule
+# interval; frames no evaluation will read run at phase_scheduler.idle_hz,
+# clamped so the density they publish never goes stale.
+phase_scheduler = None
+_stale_after_s = float(get_config_value(_cfg, ["control", "stale_after_s"], 2.0))
+_phase_cfg = get_config_value(_cfg, ["phase_scheduler"], {})
+if pipeline is not None or density_engine is not None:
+    if isinstance(_phase_cfg, dict) and _phase_cfg.get("enabled", False):
+        print("Phase-aware scheduling is not used with the multiprocess pipeline or background-subtraction density.")
+else:
+    phase_scheduler = create_phase_scheduler(_phase_cfg, controller, density_window.span, cap.fps or fps_estimate,
+                                             stale_after_s=_stale_after_s)
+if phase_scheduler is not None and det_cache is not None:
+    print("Detection cache disabled: throttled frames run no detector.")
+    det_cache.close()
+    det_cache = None
+
+# Columnar telemetry of density, tracks and phases (optional)
+telemetry = create_telemetry(get_config_value(_cfg, ["telemetry"], {}), _base_dir)
+if telemetry is not None:
+    telemetry.log_phase(time.time(), controller.phase, controller.green_total, controller.worst_case, controller.total_saved)
 
-while True:
-    success, img = cap.read()
-    if not success:
-        break
-    
-    imgRegion = cv2.bitwise_and(img, mask)
-    
-    results = model(imgRegion, stream=True)
-    
-    detections = np.empty((0, 5))
-    
-    for r in results:
-        boxes = r.boxes
-        for box in boxes:
-          
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            w, h = x2 - x1, y2 - y1
-            
-            conf = math.ceil((box.conf[0] * 100)) / 100
-
-            cls = int(box.cls[0])
-            currentClass = classNames[cls]
-            
-            if currentClass in vehicle_classes and conf > 0.3:
-                currentArray = np.array([x1, y1, x2, y2, conf])
-                detections = np.vstack((detections, currentArray))
-    
-    resultsTracker = tracker.update(detections)
-    
+# -----------------------------
+# Control loop
+# -----------------------------
+# The controller and ESP32 senders tick at a fixed rate on their own thread
+# and read the latest density the frame loop publishes, so phase changes and
+# countdowns do not wait for inference. See src/control_loop.py for the
+# fallback when density goes stale.
+def log_phase_change(c):
+    if telemetry is not None:
+        telemetry.log_phase(time.time(), c.phase, c.green_total, c.worst_case, c.total_saved)
+
+density_board = DensityBoard()
+control_loop = ControlLoop(
+    controller, density_board,
+    send_status=lambda green_s, red_s, yellow_s, saved_s: send_to_esp32(ser, green_s, red_s, yellow_s, saved_s),
+    send_command=send_command_to_esp32,
+    tick_hz=float(get_config_value(_cfg, ["control", "tick_hz"], 10.0)),
+    stale_after_s=_stale_after_s,
+    stale_policy=str(get_config_value(_cfg, ["control", "stale_policy"], "hold")),
+    on_phase=log_phase_change,
+    metrics=metrics,
+)
 
-    cv2.polylines(img, [polygon_points], True, (0, 255, 0), 3)
-    
+# Annotated-video recorder; drawing and encoding run off the loop (optional)
+recorder = create_recorder(get_config_value(_cfg, ["recorder"], {}), _base_dir, frame_size,
+                           fps=(cap.fps or fps_estimate) / cap.stride)
 
-    total_vehicle_area_in_polygon = 0
-    vehicles_in_polygon = 0
-    
-    for result in resultsTracker:
-        x1, y1, x2, y2, id = result
-        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-        w, h = x2 - x1, y2 - y1
-        
-        cvzone.cornerRect(img, (x1, y1, w, h), l=9, rt=2, colorR=(255, 0, 255))
-        cvzone.putTextRect(img, f' {int(id)}', (max(0, x1), max(35, y1)),
-                          scale=2, thickness=3, offset=10)
-        
-        cx, cy = x1 + w // 2, y1 + h // 2
-        cv2.circle(img, (cx, cy), 5, (255, 0, 255), cv2.FILLED)
-        
-    
-        if is_point_in_polygon((cx, cy), polygon_points):
-            vehicles_in_polygon += 1
-        
-            intersection_area = calculate_bbox_polygon_intersection_area([x1, y1, x2, y2], polygon_points)
-            total_vehicle_area_in_polygon += intersection_area
-            
-    
-            cvzone.cornerRect(img, (x1, y1, w, h), l=9, rt=2, colorR=(0, 255, 0))
-    
+# Density feed for a district coordinator (optional; see src/coordinator.py)
+density_publisher = None
+_coordinator_address = get_config_value(_cfg, ["coordinator", "address"], None)
+if _coordinator_address:
+    density_publisher = DensityPublisher(
+        _coordinator_address, str(get_config_value(_cfg, ["coordinator", "intersection_id"], "cam0")))
 
-    if total_polygon_area > 0:
-        density = total_vehicle_area_in_polygon / total_polygon_area
-    else:
-        density = 0
-    
-    density_history.append(density)
-    if len(density_history) > frames_per_5_seconds:
-        density_history.pop(0)  
-    
+# -----------------------------
+# Hot config reload
+# -----------------------------
+# The watcher thread parses/validates config.json and compiles the new Scene;
+# the loop swaps it in between frames without touching the model or tracker.
+HOT_RELOAD_ENABLED = bool(get_config_value(_cfg, ["hot_reload", "enabled"], True))
+
+def prepare_reload(cfg):
+    new_mask_path = get_config_value(cfg, ["mask_path"], _mask_path_default)
+    return load_scene(new_mask_path, scene_polygon(cfg), frame_size, SCENE_CACHE_DIR)
+
+def apply_reload(cfg, new_scene):
+    global _cfg, scene, det_cache, ESP32_IP, ESP32_PORT
+    if density_engine is not None and not np.array_equal(new_scene.polygon, scene.polygon):
+        # Occupancy is measured over the polygon; the old calibration no longer applies
+        density_engine.set_scene(new_scene)
+    if new_scene.mask_fingerprint != scene.mask_fingerprint and det_cache is not None:
+        # Cached detections were produced with the old mask
+        print("Mask changed; detection cache disabled for this run.")
+        det_cache.close()
+        det_cache = None
+        if pipeline is not None:
+            pipeline.stop_replay()
+    if pipeline is not None:
+        pipeline.set_mask(new_scene.mask)
+    scene = new_scene
+    analyzer.scene = new_scene
+
+    ESP32_IP = get_config_value(cfg, ["esp32", "ip"], os.getenv("ESP32_IP", "10.84.30.1"))
+    ESP32_PORT = int(get_config_value(cfg, ["esp32", "port"], int(os.getenv("ESP32_PORT", "80"))))
+
+    def update_controller():
+        controller.rules = TimingRules.from_dict(get_config_value(cfg, ["controller"], {}))
+        controller.worst_case = controller.rules.worst_case
+        controller.best_case = controller.rules.best_case
+        controller.yellow_total = float(get_config_value(cfg, ["controller", "yellow_seconds"], 5))
+        controller.red_total = float(get_config_value(cfg, ["controller", "red_seconds"], 60))
+    # The controller belongs to the control thread
+    control_loop.call_soon(update_controller)
+
+    for key in ("video_path", "serial", "capture", "control"):
+        if cfg.get(key) != _cfg.get(key):
+            print(f"Config '{key}' changed; restart to apply.")
+    _cfg = cfg
+    print(f"Config reloaded: polygon {scene.polygon.tolist()}, ESP32 {ESP32_IP}:{ESP32_PORT}")
+
+config_watcher = None
+if HOT_RELOAD_ENABLED:
+    config_watcher = ConfigWatcher(CONFIG_PATH, prepare_reload,
+                                   interval_s=float(get_config_value(_cfg, ["hot_reload", "interval_s"], 1.0)))
+
+# Frames are decoded in place; the overlay inputs are refilled rather than rebuilt
+frame_buf = np.empty((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+overlay = {}
+
+frame_idx = 0
+video_finished = False
+control_loop.start()
 
-    avg_density = sum(density_history) / len(density_history) if density_history else 0
-
-    # -----------------------------
-    # Dynamic timing + Serial sync
-    # -----------------------------
-    # Apply rules only during GREEN phase
-    if controller.phase == 'GREEN':
-        changed = controller.maybe_apply_rules(avg_density)
-        if changed:
-            # Send updated remaining durations to ESP32 so it can adjust countdown
-            send_to_esp32(
-                ser,
-                green_s=int(round(controller.get_remaining_green())),
-                red_s=int(round(controller.red_total)),
-                yellow_s=int(round(controller.yellow_total)),
-                saved_s=int(round(controller.total_saved))
-            )
-
-    # Advance phases as time elapses
-    prev_phase = controller.phase
-    controller.advance_phase_if_due()
-    if controller.phase != prev_phase:
-        # On phase changes, notify ESP32 of the upcoming durations
-        info = controller.get_phase_and_times()
-        # Force next display update send
-        last_sent_phase = None
-        last_sent_second = None
-        if controller.phase == 'GREEN':
-            # New cycle begins; include accumulated saved time
-            send_to_esp32(
-                ser,
-                green_s=int(round(controller.green_total)),
-                red_s=int(round(controller.red_total)),
-                yellow_s=int(round(controller.yellow_total)),
-                saved_s=int(round(controller.total_saved))
-            )
-        elif controller.phase == 'YELLOW':
-            send_to_esp32(
-                ser,
-                green_s=int(round(controller.get_remaining_green())),
-                red_s=int(round(controller.red_total)),
-                yellow_s=int(round(controller.yellow_total)),
-                saved_s=int(round(controller.total_saved))
-            )
-        elif controller.phase == 'RED':
-            send_to_esp32(
-                ser,
-                green_s=0,
-                red_s=int(round(controller.red_total)),
-                yellow_s=0,
-                saved_s=int(round(controller.total_saved))
-            )
+while True:
+    frame_start = time.perf_counter()
+    infer_s = 0.0
+    if config_watcher is not None:
+        reload = config_watcher.poll()
+        if reload is not None:
+            apply_reload(*reload)
+
+    if pipeline is not None:
+        with metrics.stage("pipeline_wait"):
+            item = pipeline.next()
+        if item is None:
+            video_finished = True
+            break
+        seq, img, detections, infer_s = item
+        metrics.set_gauge("frames_dropped", pipeline.dropped)
+        metrics.set_gauge("pipeline_reorder", pipeline.reorder_depth)
+        _slots_busy = pipeline.slots_in_use()
+        if _slots_busy is not None:
+            metrics.set_gauge("pipeline_slots_busy", _slots_busy)
+        if det_cache is not None and pipeline.dropped:
+            # The cache stores every frame in order; a dropped one breaks that
+            print("Pipeline dropped frames; detection cache disabled for this run.")
+            det_cache.close()
+            det_cache = None
+        if detections is None:
+            # Below the cached frame count; frames still in flight after a
+            # mask change (cache disabled) go through with no detections
+            detections = det_cache.get(seq) if det_cache is not None else np.empty((0, 5))
+        else:
+            metrics.observe("inference", infer_s)
+            if det_cache is not None:
+                det_cache.append(detections)
+        frame_idx = seq + 1
+        source_pos = frame_idx * cap.stride
+    else:
+        plan = scheduler.plan() if scheduler is not None else None
+        with metrics.stage("decode"):
+            if plan is not None:
+                # Frames the scheduler skips are grabbed, not decoded
+                for _ in range(plan.stride - 1):
+                    cap.skip()
+                    source_pos += cap.stride
+            success, img = cap.read(frame_buf)
+        if not success:
+            video_finished = True
+            break
+        source_pos += cap.stride
+
+        if density_engine is not None:
+            with metrics.stage("bgsub"):
+                engine_density = density_engine.update(img)
+        if density_engine is not None and not density_engine.due(source_pos):
+            # No detector this frame; density comes from the background model
+            detections = None
+        elif phase_scheduler is not None and not phase_scheduler.should_run(time.time(), source_pos):
+            # No rule evaluation will read this frame's density
+            detections = None
+        elif det_cache is not None and frame_idx in det_cache:
+            # Replay: cached detections go straight to the tracker
+            detections = det_cache.get(frame_idx)
+        elif inference_client is not None:
+            # Masked straight into the block the server reads
+            analyzer.mask(img, dst=inference_client.frame)
+            with metrics.stage("inference"):
+                infer_start = time.perf_counter()
+                try:
+                    detections = inference_client.infer(plan.imgsz if plan is not None else INFER_IMGSZ,
+                                                        CONF_THRESHOLD)
+                except ConnectionError as e:
+                    print(f"{e}; loading the model locally")
+                    inference_client.close()
+                    inference_client = None
+                    detections = analyzer.detect(get_model(), img, INFER_IMGSZ)
+                infer_s = time.perf_counter() - infer_start
+            metrics.set_gauge("server_batch", inference_client.last_batch if inference_client is not None else 0)
+            if det_cache is not None:
+                det_cache.append(detections)
+        else:
+            if plan is not None:
+                detections = analyzer.detect(get_model(plan.model_path), img, plan.imgsz)
+            else:
+                detections = analyzer.detect(get_model(), img, INFER_IMGSZ)
+            infer_s = analyzer.infer_s
+            if det_cache is not None:
+                det_cache.append(detections)
+        frame_idx += 1
     
-    # -----------------------------
-    # Per-second display updates over Wi-Fi (A/C/B format)
-    # -----------------------------
+    fresh = True
+    if detections is None and density_engine is not None:
+        # Boxes, IDs and the vehicle count stay as of the last detector frame
+        analyzer.hold(source_pos, engine_density)
+        dnn_gap = True
+        metrics.set_gauge("bgsub_occupancy", density_engine.occupancy)
+    elif detections is None:
+        # Throttled frame: nothing new is measured or published
+        analyzer.clear()
+        dnn_gap = True
+        fresh = False
+    else:
+        if dnn_gap:
+            # Tracks from before frames without a detector are stale; start afresh
+            # so this frame's detections are reported rather than held back by min_hits
+            analyzer.reset_tracker()
+            dnn_gap = False
+        analyzer.track(detections, source_pos)
+        if density_engine is not None:
+            density_engine.calibrate(source_pos, analyzer.density)
+            if density_engine.error is not None:
+                metrics.set_gauge("bgsub_error", density_engine.error)
+
+    density, avg_density = analyzer.density, analyzer.avg_density
+    vehicles_in_polygon = analyzer.vehicles_in_polygon
+    if fresh:
+        density_board.publish(frame_idx, density, avg_density, vehicles_in_polygon)
+    status = control_loop.status
     now_ts = time.time()
-    phase = controller.phase
-    code = None
-    seconds_left = 0
-    if phase == 'GREEN':
-        code = 'C'
-        seconds_left = int(round(controller.get_remaining_green()))
-    elif phase == 'YELLOW':
-        code = 'B'
-        elapsed = now_ts - controller.phase_start_time
-        seconds_left = int(round(max(0.0, controller.yellow_total - elapsed)))
-    elif phase == 'RED':
-        code = 'A'
-        elapsed = now_ts - controller.phase_start_time
-        seconds_left = int(round(max(0.0, controller.red_total - elapsed)))
-
-    if code is not None:
-        if phase != last_sent_phase or seconds_left != last_sent_second:
-            cmd = f"{code}{seconds_left}"
-            ok = send_command_to_esp32(cmd)
-            if ok:
-                last_sent_phase = phase
-                last_sent_second = seconds_left
-
-    y_offset = 30
-    line_height = 35
-    
-    cars_text = f"Cars in Region: {vehicles_in_polygon}"
-    text_size = cv2.getTextSize(cars_text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
-    cv2.putText(img, cars_text, (img.shape[1] - text_size[0] - 20, y_offset), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
-    
-    density_text = f"Density: {density:.2f}"
-    text_size = cv2.getTextSize(density_text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
-    cv2.putText(img, density_text, (img.shape[1] - text_size[0] - 20, y_offset + line_height), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-    
-
-    avg_density_text = f"Avg Density (5s): {avg_density:.2f}"
-    text_size = cv2.getTextSize(avg_density_text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
-    cv2.putText(img, avg_density_text, (img.shape[1] - text_size[0] - 20, y_offset + 2*line_height), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 0, 0), 2)
-
-    # Overlay current phase and remaining time (per current phase)
-    current_left = max(0, int(seconds_left)) if 'seconds_left' in locals() else 0
-    phase_text = f"Phase: {phase} | Left: {current_left}s | Saved: {int(round(controller.total_saved))}s"
-    text_size = cv2.getTextSize(phase_text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
-    cv2.putText(img, phase_text, (img.shape[1] - text_size[0] - 20, y_offset + 3*line_height), 
-                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 165, 255), 2)
-    
-    cv2.imshow("Image", img)
+    if phase_scheduler is not None:
+        metrics.set_gauge("phase_full_rate", 1 if phase_scheduler.full else 0)
+
+    if density_publisher is not None and fresh:
+        density_publisher.publish(density)
+
+    if telemetry is not None and fresh:
+        telemetry.log_frame(now_ts, frame_idx, density, avg_density, vehicles_in_polygon, status.phase,
+                            status.green_total, status.remaining_green, status.total_saved)
+        if detections is not None:
+            telemetry.log_tracks(now_ts, frame_idx, analyzer.tracks, analyzer.in_polygon)
+        metrics.set_gauge("telemetry_queue", telemetry.queue_depth)
+
+    # Overlay inputs shared by the display and the recorder (the recorder copies them)
+    overlay["polygon"] = scene.polygon
+    overlay["tracked_boxes"] = analyzer.tracked_boxes
+    overlay["vehicles_in_polygon"] = vehicles_in_polygon
+    overlay["density"] = density
+    overlay["avg_density"] = avg_density
+    overlay["phase"] = status.phase
+    overlay["seconds_left"] = status.seconds_left
+    overlay["total_saved"] = status.total_saved
+    if recorder is not None:
+        with metrics.stage("record"):
+            recorder.submit(img, overlay, now_ts, frame_idx)
+        metrics.set_gauge("recorder_dropped", recorder.dropped)
+        metrics.set_gauge("recorder_queue", recorder.queue_depth)
+
+    with metrics.stage("render"):
+        draw_overlay(img, **overlay)
+        cv2.imshow("Image", img)
+
+    metrics.frame_done()
+    profiler.tick()
     
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+    if scheduler is not None and detections is not None:
+        # Throttled frames ran no inference and would skew the latency estimate
+        next_plan = scheduler.observe(infer_s, time.perf_counter() - frame_start, now_ts, frame_idx)
+        metrics.set_gauge("sched_tier", next_plan.tier)
+        metrics.set_gauge("sched_imgsz", next_plan.imgsz)
+        metrics.set_gauge("sched_stride", next_plan.stride)
+
+control_loop.stop()
+
+if det_cache is not None:
+    if video_finished and not (pipeline is not None and pipeline.dropped):
+        det_cache.mark_complete(frame_idx)
+    det_cache.close()
+
+if pipeline is not None:
+    pipeline.close()
+if inference_client is not None:
+    inference_client.close()
+if density_engine is not None:
+    _engine_error = f"{density_engine.error:.3f}" if density_engine.error is not None else "n/a"
+    print(f"Background-subtraction density: {density_engine.frames} frames, "
+          f"{density_engine.calibrations} calibrations, estimated error {_engine_error}")
+if scheduler is not None:
+    scheduler.close()
+if phase_scheduler is not None:
+    phase_scheduler.close()
+
+if config_watcher is not None:
+    config_watcher.stop()
+
+if telemetry is not None:
+    telemetry.close()
+if recorder is not None:
+    recorder.close()
+if density_publisher is not None:
+    density_publisher.close()
+
+profiler.close()
+metrics.close()
 cap.release()
 cv2.destroyAllWindows()
\ No newline at end of file
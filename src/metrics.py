@@ -0,0 +1,269 @@
+"""Lightweight runtime metrics for the frame loop.
+
+Stage timings go into fixed-size log-bucket histograms (constant memory,
+O(1) record), alongside counters and gauges. A snapshot can be served in the
+Prometheus text format from a local HTTP endpoint and/or appended as JSON
+lines to a size-rotated file. When metrics are disabled, NullMetrics keeps the
+same interface with no-op methods.
+"""
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Histogram buckets: 10 us .. ~100 s, ~10% apart
+_HIST_MIN = 1e-5
+_HIST_GROWTH = 1.1
+_HIST_BUCKETS = 170
+_LOG_GROWTH = math.log(_HIST_GROWTH)
+
+
+class Histogram:
+    """Log-bucketed latency histogram with approximate quantiles."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * _HIST_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        if seconds <= _HIST_MIN:
+            idx = 0
+        else:
+            idx = min(_HIST_BUCKETS - 1, int(math.log(seconds / _HIST_MIN) / _LOG_GROWTH) + 1)
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th sample (within ~10%)."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                return min(self.max, _HIST_MIN * (_HIST_GROWTH ** idx))
+        return self.max
+
+
+class _StageTimer:
+    """One timing of one stage; a fresh one per stage() call, so threads never share a start time."""
+
+    __slots__ = ("hist", "start")
+
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.record(time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Per-stage histograms, counters and gauges for one process."""
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, prefix: str = "traffic"):
+        self.prefix = prefix
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.frames = 0
+        self.fps = 0.0
+        self._last_frame_ts: Optional[float] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._file_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def stage(self, name: str) -> _StageTimer:
+        """Context manager timing one stage: `with metrics.stage("decode"): ...`"""
+        hist = self.stages.get(name)
+        if hist is None:
+            hist = self.stages.setdefault(name, Histogram())
+        return _StageTimer(hist)
+
+    def observe(self, name: str, seconds: float):
+        hist = self.stages.get(name)
+        if hist is None:
+            hist = self.stages.setdefault(name, Histogram())
+        hist.record(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def frame_done(self):
+        """Mark the end of a frame; maintains an exponentially smoothed FPS."""
+        now = time.perf_counter()
+        self.frames += 1
+        if self._last_frame_ts is not None:
+            dt = now - self._last_frame_ts
+            if dt > 0:
+                inst = 1.0 / dt
+                self.fps = inst if self.fps == 0.0 else 0.9 * self.fps + 0.1 * inst
+        self._last_frame_ts = now
+
+    def snapshot(self) -> Dict:
+        stages = {}
+        for name, h in list(self.stages.items()):
+            stages[name] = {
+                "count": h.count,
+                "sum": h.total,
+                "max": h.max,
+                **{f"p{int(q * 100)}": h.quantile(q) for q in self.QUANTILES},
+            }
+        return {
+            "ts": time.time(),
+            "frames": self.frames,
+            "fps": self.fps,
+            "stages": stages,
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+        }
+
+    def render_prometheus(self) -> str:
+        p = self.prefix
+        snap = self.snapshot()
+        lines: List[str] = [
+            f"# TYPE {p}_frames_total counter",
+            f"{p}_frames_total {snap['frames']}",
+            f"# TYPE {p}_fps gauge",
+            f"{p}_fps {snap['fps']:.3f}",
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for name, s in snap["stages"].items():
+            for q in self.QUANTILES:
+                lines.append(f'{p}_stage_seconds{{stage="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        for name, value in snap["counters"].items():
+            lines.append(f"# TYPE {p}_{name} counter")
+            lines.append(f"{p}_{name} {value}")
+        for name, value in snap["gauges"].items():
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9108):
+        """Expose /metrics on a daemon thread."""
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"Metrics endpoint on http://{host}:{port}/metrics")
+
+    def write_to_file(self, path: str, interval_s: float = 10.0, max_bytes: int = 5_000_000, backups: int = 3):
+        """Append a JSON snapshot every interval, rotating path -> path.1 -> ... by size."""
+        def _loop():
+            while not self._stop.wait(interval_s):
+                try:
+                    if os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+                        for i in range(backups - 1, 0, -1):
+                            if os.path.exists(f"{path}.{i}"):
+                                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+                        os.replace(path, f"{path}.1")
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(self.snapshot()) + "\n")
+                except Exception as e:
+                    print(f"Metrics file write failed: {e}")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file_thread = threading.Thread(target=_loop, name="metrics-file", daemon=True)
+        self._file_thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """Drop-in replacement used when metrics are disabled."""
+
+    def stage(self, name: str):
+        return _NULL_TIMER
+
+    def observe(self, name: str, seconds: float):
+        pass
+
+    def inc(self, name: str, value: float = 1):
+        pass
+
+    def set_gauge(self, name: str, value: float):
+        pass
+
+    def frame_done(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_metrics(cfg: Optional[Dict]) -> "Metrics | NullMetrics":
+    """Build metrics from the "metrics" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return NullMetrics()
+    metrics = Metrics(prefix=str(cfg.get("prefix", "traffic")))
+    if cfg.get("port"):
+        try:
+            metrics.serve(str(cfg.get("host", "127.0.0.1")), int(cfg["port"]))
+        except OSError as e:
+            print(f"Could not start metrics endpoint: {e}")
+    if cfg.get("file"):
+        metrics.write_to_file(
+            str(cfg["file"]),
+            interval_s=float(cfg.get("file_interval_s", 10.0)),
+            max_bytes=int(cfg.get("file_max_bytes", 5_000_000)),
+            backups=int(cfg.get("file_backups", 3)),
+        )
+    return metrics
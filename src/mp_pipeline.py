@@ -0,0 +1,335 @@
+"""Staged multiprocess frame pipeline over a shared-memory slot pool.
+
+  capture ──(seq, slot)──> N inference workers ──(seq, slot, dets)──> main
+     ^                                                                 │
+     └────────────────────────── free slots ───────────────────────────┘
+
+Frames live in one `multiprocessing.shared_memory` block holding `slots`
+fixed-size BGR buffers. The capture process decodes straight into a free
+slot (with main.py's "capture" settings, see src/capture.py), workers mask
+and run YOLO on it in place, and the main process (the track/density/control
+stage) gets the slot back together with its (N,5) detections. Only slot indices and detection arrays are pickled. Results are
+put back in frame order by a ReorderBuffer, and a slot returns to the free
+pool once the main loop has drawn the frame.
+
+When every slot is in use the capture stage applies the drop policy:
+
+  block        wait for a free slot; no frame is lost (recorded video)
+  drop_newest  skip the next frame without decoding it (live camera)
+  drop_oldest  take back the oldest frame no worker has started yet
+
+Dropped frames are reported to the main process so the reorder buffer never
+waits for them. Workers and capture are forked from main.py, which is a
+plain script and cannot be re-imported by spawn; the pipeline is therefore
+unavailable where fork is (Windows), and main.py falls back to one process.
+"""
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from capture import open_capture
+from detection import extract_vehicle_detections
+
+DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+_DROPPED = object()
+
+
+class ReorderBuffer:
+    """Hands out items in sequence order; skipped sequence numbers are passed over."""
+
+    def __init__(self, start: int = 0):
+        self.next_seq = start
+        self._pending: Dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def push(self, seq: int, item: Any):
+        self._pending[seq] = item
+
+    def skip(self, seq: int):
+        self._pending[seq] = _DROPPED
+
+    def pop(self) -> Optional[Tuple[int, Any]]:
+        """Next (seq, item) in order, or None while it has not arrived."""
+        while self.next_seq in self._pending:
+            seq = self.next_seq
+            item = self._pending.pop(seq)
+            self.next_seq += 1
+            if item is not _DROPPED:
+                return seq, item
+        return None
+
+
+def _attach(name: str, shape: Tuple[int, ...]) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+
+def load_yolo(model_path: str):
+    """Default model factory; runs inside each worker so the weights load once per process."""
+    from ultralytics import YOLO
+    return YOLO(model_path)
+
+
+def _acquire_slot(policy: str, free_q, work_q, result_q, stop_event) -> Optional[int]:
+    try:
+        return free_q.get_nowait()
+    except queue.Empty:
+        pass
+    if policy == "drop_newest":
+        return None
+    if policy == "drop_oldest":
+        try:
+            item = work_q.get_nowait()
+        except queue.Empty:
+            item = None
+        if item is not None:
+            old_seq, slot = item
+            result_q.put(("drop", old_seq))
+            return slot
+    # Every slot is in a worker or the main loop: wait for one to come back
+    while not stop_event.is_set():
+        try:
+            return free_q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _capture_main(video_path: str, capture_cfg: Optional[Dict], shm_name: str, shape: Tuple[int, int, int],
+                  workers: int, policy: str, free_q, work_q, result_q, stop_event):
+    shm, frames = _attach(shm_name, shape)
+    source = open_capture(video_path, capture_cfg)
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            slot = _acquire_slot(policy, free_q, work_q, result_q, stop_event)
+            if slot is None:
+                if stop_event.is_set() or not source.skip():
+                    break
+                result_q.put(("drop", seq))
+                seq += 1
+                continue
+            ok, _ = source.read(frames[slot])
+            if not ok:
+                free_q.put(slot)
+                break
+            work_q.put((seq, slot))
+            seq += 1
+    except Exception as e:
+        result_q.put(("error", f"capture: {e!r}"))
+    finally:
+        for _ in range(workers):
+            work_q.put(None)
+        result_q.put(("end", seq))
+        source.release()
+        del frames
+        shm.close()
+
+
+def _inference_main(shm_name: str, mask_name: str, shape: Tuple[int, int, int], model_factory: Callable[[], Any],
+                    imgsz: int, conf: float, threads: int, replay_below, work_q, result_q):
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    shm, frames = _attach(shm_name, shape)
+    mask_shm, mask = _attach(mask_name, shape[1:])
+    masked = np.empty(shape[1:], dtype=np.uint8)
+    try:
+        model = model_factory()
+        while True:
+            item = work_q.get()
+            if item is None:
+                break
+            seq, slot = item
+            if seq < replay_below.value:
+                # The main process replays this frame from the detection cache
+                result_q.put(("frame", seq, slot, None, 0.0))
+                continue
+            start = time.perf_counter()
+            cv2.bitwise_and(frames[slot], mask, dst=masked)
+            results = list(model(masked, stream=True, imgsz=imgsz))
+            detections = extract_vehicle_detections(results, conf)
+            result_q.put(("frame", seq, slot, detections, time.perf_counter() - start))
+    except Exception as e:
+        result_q.put(("error", f"inference worker {os.getpid()}: {e!r}"))
+    finally:
+        del frames, mask
+        shm.close()
+        mask_shm.close()
+
+
+class FramePipeline:
+    """Capture and inference processes feeding frames back to the caller in order.
+
+    `next()` returns (frame_idx, frame, detections); the frame is a view of a
+    shared slot and stays valid until the following `next()` call.
+    """
+
+    def __init__(self, video_path: str, frame_shape: Tuple[int, int, int], mask: np.ndarray,
+                 model_factory: Callable[[], Any], workers: int = 2, slots: int = 0, drop_policy: str = "block",
+                 imgsz: int = 640, conf: float = 0.3, threads_per_worker: int = 0, replay_below: int = 0,
+                 capture_cfg: Optional[Dict] = None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {', '.join(DROP_POLICIES)}")
+        self.workers = max(1, int(workers))
+        # A frame in every worker, one queued behind each, and one held by the main loop
+        self.slots = int(slots) if slots and slots > 1 else 2 * self.workers + 2
+        self.drop_policy = drop_policy
+        self.frame_shape = tuple(frame_shape)
+        self.dropped = 0
+        self.frames_total: Optional[int] = None
+
+        ctx = mp.get_context("fork")
+        frame_bytes = int(np.prod(self.frame_shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=frame_bytes * self.slots)
+        self._frames = np.ndarray((self.slots,) + self.frame_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._mask_shm = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self._mask = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._mask_shm.buf)
+        self._mask[...] = mask
+
+        self._free_q = ctx.Queue()
+        self._work_q = ctx.Queue()
+        self._result_q = ctx.Queue()
+        for slot in range(self.slots):
+            self._free_q.put(slot)
+        self._stop = ctx.Event()
+        self._replay_below = ctx.Value("q", int(replay_below), lock=False)
+        self._reorder = ReorderBuffer()
+        self._held: Optional[int] = None
+
+        threads = int(threads_per_worker) or max(1, (os.cpu_count() or 1) // self.workers)
+        shape = (self.slots,) + self.frame_shape
+        self._procs = [ctx.Process(target=_capture_main, name="pipeline-capture", daemon=True,
+                                   args=(video_path, capture_cfg, self._shm.name, shape, self.workers, drop_policy,
+                                         self._free_q, self._work_q, self._result_q, self._stop))]
+        for i in range(self.workers):
+            self._procs.append(ctx.Process(
+                target=_inference_main, name=f"pipeline-infer-{i}", daemon=True,
+                args=(self._shm.name, self._mask_shm.name, shape, model_factory, imgsz, conf, threads,
+                      self._replay_below, self._work_q, self._result_q)))
+
+    def start(self):
+        for p in self._procs:
+            p.start()
+        print(f"Pipeline started: {self.workers} inference workers, {self.slots} frame slots, "
+              f"drop policy '{self.drop_policy}'")
+
+    def set_mask(self, mask: np.ndarray):
+        """Swap the ROI mask; frames already in a worker keep the old one."""
+        self._mask[...] = mask
+
+    def stop_replay(self):
+        """Run inference on every later frame instead of leaving it to the detection cache."""
+        self._replay_below.value = 0
+
+    @property
+    def reorder_depth(self) -> int:
+        """Results waiting for an earlier frame before they can be handed out."""
+        return len(self._reorder)
+
+    def slots_in_use(self) -> Optional[int]:
+        """Frame slots not on the free list (being decoded, queued, in a worker or held), if countable.
+
+        multiprocessing queues cannot report their size on macOS; None there.
+        """
+        try:
+            return self.slots - self._free_q.qsize()
+        except NotImplementedError:
+            return None
+
+    def _release_held(self):
+        if self._held is not None:
+            self._free_q.put(self._held)
+            self._held = None
+
+    def next(self, timeout: float = 30.0) -> Optional[Tuple[int, np.ndarray, Optional[np.ndarray], float]]:
+        """Next frame in order as (frame_idx, frame, detections, inference_s), or None at end of video.
+
+        detections is None for frames below `replay_below` (cached by the caller).
+        """
+        self._release_held()
+        while True:
+            ready = self._reorder.pop()
+            if ready is not None:
+                seq, (slot, detections, infer_s) = ready
+                self._held = slot
+                return seq, self._frames[slot], detections, infer_s
+            if self.frames_total is not None and self._reorder.next_seq >= self.frames_total:
+                return None
+            try:
+                msg = self._result_q.get(timeout=timeout)
+            except queue.Empty:
+                raise RuntimeError(f"pipeline stalled: no result for frame {self._reorder.next_seq} in {timeout}s")
+            kind = msg[0]
+            if kind == "frame":
+                _, seq, slot, detections, infer_s = msg
+                self._reorder.push(seq, (slot, detections, infer_s))
+            elif kind == "drop":
+                self._reorder.skip(msg[1])
+                self.dropped += 1
+            elif kind == "end":
+                self.frames_total = msg[1]
+            else:
+                raise RuntimeError(msg[1])
+
+    def close(self, timeout: float = 5.0):
+        self._stop.set()
+        self._release_held()
+        for _ in range(self.workers):
+            self._work_q.put(None)
+        deadline = time.monotonic() + timeout
+        for p in self._procs:
+            while p.is_alive() and time.monotonic() < deadline:
+                # Keep draining so exiting workers can flush their queue feeders
+                try:
+                    while True:
+                        self._result_q.get_nowait()
+                except queue.Empty:
+                    pass
+                p.join(0.05)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        for q in (self._free_q, self._work_q, self._result_q):
+            q.cancel_join_thread()
+            q.close()
+        del self._frames, self._mask
+        for shm in (self._shm, self._mask_shm):
+            shm.close()
+            shm.unlink()
+
+
+def create_pipeline(cfg: Optional[Dict], video_path: str, frame_shape: Tuple[int, int, int], mask: np.ndarray,
+                    model_factory: Callable[[], Any], imgsz: int, conf: float,
+                    replay_below: int = 0, capture_cfg: Optional[Dict] = None) -> Optional[FramePipeline]:
+    """Build a pipeline from the "pipeline" config section (None when `workers` is 0, the default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    workers = int(cfg.get("workers", 0))
+    if workers <= 0:
+        return None
+    if "fork" not in mp.get_all_start_methods():
+        print("Multiprocess pipeline needs the fork start method; running single-process.")
+        return None
+    return FramePipeline(
+        video_path, frame_shape, mask, model_factory,
+        workers=workers,
+        slots=int(cfg.get("slots", 0)),
+        drop_policy=str(cfg.get("drop_policy", "block")),
+        imgsz=imgsz,
+        conf=conf,
+        threads_per_worker=int(cfg.get("threads_per_worker", 0)),
+        replay_below=replay_below,
+        capture_cfg=capture_cfg,
+    )
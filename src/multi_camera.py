@@ -0,0 +1,320 @@
+"""Several camera streams sharing one YOLO model and batched inference.
+
+Each source in the "multi_camera" section of config.json gets its own
+capture, scene (mask + polygon), SORT tracker, 5 s density window and
+controller running on its own ControlLoop and ESP32 endpoint. The model is
+loaded once. Every step takes the newest frame of each source, masks it,
+and runs all of them through a single batched model call. Each stream's
+detections then go back to its own tracker and controller.
+
+Every source is decoded on a reader thread. A live source (camera, RTSP
+URL) keeps only its newest frame, and older ones are dropped. A file is
+read in order, one frame per step. A step waits at most `max_wait_s` for
+sources that have no new frame yet, and then runs without them.
+
+Usage:
+  python src/multi_camera.py [--config src/future_scope/config.json] [--show]
+
+config.json:
+  "multi_camera": {
+    "imgsz": 640, "conf": 0.3, "max_wait_s": 0.05,
+    "sources": [
+      {"id": "north", "video_path": "rtsp://10.0.0.21/stream", "mask_path": "assets/north_mask.png",
+       "polygon_points": [[589, 206], [417, 539], [1275, 539], [874, 209]],
+       "esp32": {"ip": "10.0.0.11", "port": 80}, "controller": {"worst_case": 90}},
+      {"id": "south", "video_path": "assets/south.mp4", "mask_path": "assets/south_mask.png",
+       "polygon_points": [...], "capture": {"scale": 0.5}}
+    ]
+  }
+
+Sections a source does not set ("capture", "controller", "control",
+"esp32", "serial") fall back to the top-level ones.
+"""
+import argparse
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import esp32
+from capture import open_capture, scale_points
+from control_loop import ControlLoop, DensityBoard
+from controller import DynamicTimingController, TimingRules
+from coordinator import DensityPublisher
+from detection import DEFAULT_CONF_THRESHOLD
+from frame_analysis import FrameAnalyzer
+from future_scope.config_loader import get_config_value, get_polygon_from_config, load_runtime_config
+from metrics import create_metrics
+from overlay import draw_overlay
+from scene import load_scene
+from scheduler import DensityWindow
+from sort import Sort
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "future_scope", "config.json")
+MODEL_PATH = os.path.join(BASE_DIR, "assets", "yolov8l.pt")
+FPS_ESTIMATE = 30
+
+
+class FrameReader:
+    """Decodes one source on its own thread into a single-frame handoff slot."""
+
+    def __init__(self, source, drop_stale: bool):
+        self.source = source
+        self.drop_stale = drop_stale
+        self.dropped = 0
+        self.ended = False
+        self._frame: Optional[np.ndarray] = None
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="frame-reader", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop:
+            ok, frame = self.source.read()
+            with self._cond:
+                if not ok:
+                    self.ended = True
+                    self._cond.notify_all()
+                    return
+                if self._frame is not None:
+                    if self.drop_stale:
+                        self.dropped += 1
+                    else:
+                        # Recorded video: wait until the batch loop took the last frame
+                        while self._frame is not None and not self._stop:
+                            self._cond.wait(0.1)
+                self._frame = frame
+                self._cond.notify_all()
+
+    def take(self) -> Optional[np.ndarray]:
+        """The newest frame not handed out yet, or None."""
+        with self._cond:
+            frame, self._frame = self._frame, None
+            self._cond.notify_all()
+            return frame
+
+    @property
+    def has_frame(self) -> bool:
+        return self._frame is not None
+
+    def wait(self, timeout: float):
+        with self._cond:
+            if self._frame is None and not self.ended:
+                self._cond.wait(timeout)
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+        self.source.release()
+
+
+def _section(src: Dict[str, Any], cfg: Dict[str, Any], key: str) -> Dict[str, Any]:
+    value = src.get(key, cfg.get(key, {}))
+    return value if isinstance(value, dict) else {}
+
+
+def _resolve(path: str) -> str:
+    return path if os.path.isabs(path) or "://" in path else os.path.join(BASE_DIR, path)
+
+
+class Stream:
+    """Per-camera state: capture, scene, tracker, density window and controller."""
+
+    def __init__(self, src: Dict[str, Any], cfg: Dict[str, Any], scene_cache_dir: Optional[str], metrics,
+                 conf_threshold: float = DEFAULT_CONF_THRESHOLD):
+        self.id = str(src["id"])
+        video_path = src["video_path"]
+        if not (isinstance(video_path, str) and "://" in video_path):
+            video_path = _resolve(str(video_path)) if isinstance(video_path, str) else video_path
+        self.source = open_capture(video_path, _section(src, cfg, "capture"))
+        if not self.source.isOpened() or self.source.frame_size[0] <= 0:
+            raise ValueError(f"source '{self.id}': cannot open {video_path}")
+        self.frame_size = self.source.frame_size
+        polygon = scale_points(get_polygon_from_config(src, []), self.source.native_size, self.frame_size)
+        if not polygon:
+            raise ValueError(f"source '{self.id}': polygon_points missing or invalid")
+        self.scene = load_scene(_resolve(src["mask_path"]), polygon, self.frame_size, scene_cache_dir)
+        self.analyzer = FrameAnalyzer(self.scene, (self.frame_size[1], self.frame_size[0], 3),
+                                      DensityWindow(FPS_ESTIMATE * 5),
+                                      lambda: Sort(max_age=20, min_hits=3, iou_threshold=0.3),
+                                      conf_threshold=conf_threshold, metrics=metrics)
+        live = not (isinstance(video_path, str) and os.path.isfile(video_path))
+        self.reader = FrameReader(self.source, drop_stale=bool(src.get("live", live)))
+
+        self.source_pos = 0
+        self.frame_idx = 0
+        self.frame: Optional[np.ndarray] = None
+
+        esp = _section(src, cfg, "esp32")
+        self.esp32_ip = esp.get("ip")
+        self.esp32_port = int(esp.get("port", 80))
+        self.ser = self._open_serial(_section(src, cfg, "serial"))
+        ctrl = _section(src, cfg, "controller")
+        self.controller = DynamicTimingController(
+            yellow_seconds=float(ctrl.get("yellow_seconds", 5)),
+            red_seconds=float(ctrl.get("red_seconds", 60)),
+            rules=TimingRules.from_dict(ctrl),
+        )
+        self.board = DensityBoard()
+        control = _section(src, cfg, "control")
+        self.metrics = metrics
+        self.control_loop = ControlLoop(
+            self.controller, self.board, self.send_status, self.send_command,
+            tick_hz=float(control.get("tick_hz", 10.0)),
+            stale_after_s=float(control.get("stale_after_s", 2.0)),
+            stale_policy=str(control.get("stale_policy", "hold")),
+        )
+        self.publisher = None
+        address = get_config_value(cfg, ["coordinator", "address"], None)
+        if address:
+            self.publisher = DensityPublisher(address, self.id)
+
+    def _open_serial(self, serial_cfg: Dict[str, Any]):
+        port = serial_cfg.get("port")
+        if not port or serial is None:
+            return None
+        try:
+            ser = serial.Serial(port, int(serial_cfg.get("baud", 115200)), timeout=float(serial_cfg.get("timeout", 0.1)))
+            print(f"[{self.id}] Connected to ESP32 on {port}")
+            return ser
+        except Exception as e:
+            print(f"[{self.id}] Could not open serial port {port}: {e}")
+            return None
+
+    def send_status(self, green_s: int, red_s: int, yellow_s: int, saved_s: int):
+        esp32.send_status(self.ser, green_s, red_s, yellow_s, saved_s, self.metrics, verbose=False)
+
+    def send_command(self, command: str) -> bool:
+        if not self.esp32_ip:
+            return True
+        return esp32.send_command(self.esp32_ip, self.esp32_port, command, self.metrics)
+
+    def start(self):
+        c = self.controller
+        self.send_status(int(round(c.green_total)), int(round(c.red_total)),
+                         int(round(c.yellow_total)), int(round(c.total_saved)))
+        self.control_loop.start()
+
+    def update(self, detections: np.ndarray) -> float:
+        """Track one frame's detections and publish its density to the controller; returns the window average."""
+        self.frame_idx += 1
+        self.source_pos += self.source.stride
+        a = self.analyzer
+        avg_density = a.track(detections, self.source_pos)
+        self.board.publish(self.frame_idx, a.density, avg_density, a.vehicles_in_polygon)
+        if self.publisher is not None:
+            self.publisher.publish(a.density)
+        return avg_density
+
+    def close(self):
+        self.control_loop.stop()
+        self.reader.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.ser is not None:
+            self.ser.close()
+
+
+def collect_batch(streams: List[Stream], max_wait_s: float) -> List[Stream]:
+    """Streams with a new frame, waiting up to max_wait_s for the rest after the first arrives."""
+    deadline = None
+    while True:
+        ready = [s for s in streams if s.reader.has_frame]
+        pending = [s for s in streams if not s.reader.has_frame and not s.reader.ended]
+        if not pending:
+            break
+        if ready:
+            if deadline is None:
+                deadline = time.monotonic() + max_wait_s
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            pending[0].reader.wait(min(remaining, 0.01))
+        else:
+            pending[0].reader.wait(0.01)
+    batch = []
+    for s in ready:
+        s.frame = s.reader.take()
+        if s.frame is not None:
+            batch.append(s)
+    return batch
+
+
+def run(cfg: Dict[str, Any], show: bool = False):
+    mc = get_config_value(cfg, ["multi_camera"], {})
+    sources = mc.get("sources", []) if isinstance(mc, dict) else []
+    if not sources:
+        raise SystemExit("config has no multi_camera.sources")
+    metrics = create_metrics(get_config_value(cfg, ["metrics"], {}))
+    scene_cache_dir = None
+    if get_config_value(cfg, ["scene_cache", "enabled"], True):
+        scene_cache_dir = get_config_value(cfg, ["scene_cache", "dir"], os.path.join(BASE_DIR, ".cache", "scenes"))
+    imgsz = int(mc.get("imgsz", get_config_value(cfg, ["inference", "imgsz"], 640)))
+    conf = float(mc.get("conf", get_config_value(cfg, ["inference", "conf"], DEFAULT_CONF_THRESHOLD)))
+    max_wait_s = float(mc.get("max_wait_s", 0.05))
+
+    streams = [Stream(src, cfg, scene_cache_dir, metrics, conf) for src in sources]
+    from ultralytics import YOLO
+    model = YOLO(_resolve(mc.get("model_path", MODEL_PATH)))
+    print(f"{len(streams)} streams sharing one model: {', '.join(s.id for s in streams)}")
+    for s in streams:
+        s.start()
+
+    try:
+        while True:
+            batch = collect_batch(streams, max_wait_s)
+            if not batch:
+                if all(s.reader.ended for s in streams):
+                    break
+                continue
+            images = [s.analyzer.mask(s.frame) for s in batch]
+            with metrics.stage("inference"):
+                # One call for every stream; results come back in input order
+                results = model(images, imgsz=imgsz, verbose=False)
+            metrics.set_gauge("batch_size", len(batch))
+            for s, result in zip(batch, results):
+                avg_density = s.update(s.analyzer.extract([result]))
+                if show:
+                    a = s.analyzer
+                    status = s.control_loop.status
+                    draw_overlay(s.frame, s.scene.polygon, a.tracked_boxes, a.vehicles_in_polygon, a.density,
+                                 avg_density, status.phase, status.seconds_left, status.total_saved)
+                    cv2.imshow(s.id, s.frame)
+            metrics.frame_done()
+            if show and cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for s in streams:
+            s.close()
+        metrics.close()
+        if show:
+            cv2.destroyAllWindows()
+    for s in streams:
+        c = s.controller
+        print(f"[{s.id}] {s.frame_idx} frames ({s.reader.dropped} stale dropped), saved {c.total_saved:.0f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Several camera streams with batched inference on one model")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Runtime config with a multi_camera section")
+    parser.add_argument("--show", action="store_true", help="Show one annotated window per stream")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(load_runtime_config(args.config), show=args.show)
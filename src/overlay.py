@@ -0,0 +1,38 @@
+"""Annotated view drawn by main.py's display and by the recorder."""
+from typing import Sequence, Tuple
+
+import cv2
+import cvzone
+import numpy as np
+
+# (x1, y1, w, h, track_id, in_polygon) per tracked vehicle; main.py passes the
+# rows of FrameAnalyzer's (N,6) int table
+TrackedBox = Tuple[int, int, int, int, int, bool]
+
+
+def draw_overlay(img: np.ndarray, polygon: np.ndarray, tracked_boxes: Sequence[TrackedBox],
+                 vehicles_in_polygon: int, density: float, avg_density: float, phase: str,
+                 seconds_left: int, total_saved: float):
+    """Draw the ROI, tracked boxes with IDs, and the density/phase text onto img in place."""
+    cv2.polylines(img, [polygon], True, (0, 255, 0), 3)
+
+    for x1, y1, w, h, id, in_polygon in tracked_boxes:
+        cvzone.cornerRect(img, (x1, y1, w, h), l=9, rt=2, colorR=(255, 0, 255))
+        cvzone.putTextRect(img, f' {id}', (max(0, x1), max(35, y1)),
+                           scale=2, thickness=3, offset=10)
+        cv2.circle(img, (x1 + w // 2, y1 + h // 2), 5, (255, 0, 255), cv2.FILLED)
+        if in_polygon:
+            cvzone.cornerRect(img, (x1, y1, w, h), l=9, rt=2, colorR=(0, 255, 0))
+
+    y_offset = 30
+    line_height = 35
+    lines = [
+        (f"Cars in Region: {vehicles_in_polygon}", (0, 255, 255)),
+        (f"Density: {density:.2f}", (0, 255, 0)),
+        (f"Avg Density (5s): {avg_density:.2f}", (255, 0, 0)),
+        (f"Phase: {phase} | Left: {seconds_left}s | Saved: {int(round(total_saved))}s", (0, 165, 255)),
+    ]
+    for i, (text, color) in enumerate(lines):
+        text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)[0]
+        cv2.putText(img, text, (img.shape[1] - text_size[0] - 20, y_offset + i * line_height),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
@@ -0,0 +1,272 @@
+"""On-demand profiling of the running frame loop.
+
+A capture is requested from outside the process, either by sending SIGUSR1
+(POSIX only) or by connecting to the local control socket:
+
+  $ kill -USR1 <pid>
+  $ printf 'profile sampling 20\\n' | nc 127.0.0.1 9109
+
+The frame loop calls `profiler.tick()` once per frame. While idle that is a
+single attribute check; the capture itself starts and stops inside tick(),
+on the loop thread, so cProfile sees the frame loop rather than the thread
+that received the request. Each capture writes timestamped files to the
+output directory:
+
+  <stamp>-cprofile.prof / <stamp>-sampling.folded   raw profile
+  <stamp>-<mode>-summary.txt                       top-N hot functions
+  <stamp>-<mode>-alloc.txt                         tracemalloc diff
+"""
+import cProfile
+import io
+import os
+import pstats
+import signal
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+MODES = ("cprofile", "sampling")
+
+
+class _Sampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def summary(self, top_n: int) -> str:
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, n in self.stacks.items():
+            self_counts[stack[-1]] += n
+            for func in set(stack):
+                total_counts[func] += n
+        total = max(1, self.samples)
+        out = [f"{self.samples} samples every {self.interval_s * 1000:.1f} ms", "",
+               f"{'self%':>7} {'total%':>7}  function"]
+        for func, n in self_counts.most_common(top_n):
+            out.append(f"{100.0 * n / total:7.2f} {100.0 * total_counts[func] / total:7.2f}  {func}")
+        out += ["", f"{'total%':>7}  function (inclusive)"]
+        for func, n in total_counts.most_common(top_n):
+            out.append(f"{100.0 * n / total:7.2f}  {func}")
+        return "\n".join(out) + "\n"
+
+    def write_folded(self, path: str):
+        """Collapsed stacks, the input format of flamegraph.pl / speedscope."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(";".join(stack) + f" {n}\n")
+
+
+class Profiler:
+    """Time-boxed cProfile or sampling capture of the loop thread, plus tracemalloc."""
+
+    def __init__(self, out_dir: str, mode: str = "sampling", duration_s: float = 30.0, top_n: int = 25,
+                 sample_interval_s: float = 0.005, trace_memory: bool = True):
+        self.out_dir = out_dir
+        self.mode = mode
+        self.duration_s = duration_s
+        self.top_n = top_n
+        self.sample_interval_s = sample_interval_s
+        self.trace_memory = trace_memory
+        self.last_result: Optional[str] = None
+        # Written by the signal handler / control thread, read by tick()
+        self._requested: Optional[Dict] = None
+        self._active: Optional[Dict] = None
+        self._server: Optional[socket.socket] = None
+
+    # ---- triggers ---------------------------------------------------------
+
+    def request(self, mode: Optional[str] = None, duration_s: Optional[float] = None) -> str:
+        mode = mode or self.mode
+        if mode not in MODES:
+            return f"unknown mode {mode!r}; use one of {', '.join(MODES)}"
+        if self._active is not None or self._requested is not None:
+            return "busy: a capture is already running"
+        self._requested = {"mode": mode, "duration_s": float(duration_s or self.duration_s)}
+        return f"ok: {mode} capture for {self._requested['duration_s']:g}s queued"
+
+    def install_signal(self, signum: Optional[int] = None) -> bool:
+        """Start a default capture on SIGUSR1; returns False where unsupported."""
+        signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.request())
+        return True
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9109):
+        """Line-based control socket: `profile [mode] [seconds]`, `status`, `stop`."""
+        self._server = socket.create_server((host, port))
+        threading.Thread(target=self._serve_loop, name="profiler-control", daemon=True).start()
+        print(f"Profiler control on {host}:{port}")
+
+    def _serve_loop(self):
+        while self._server is not None:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    conn.settimeout(5.0)
+                    line = conn.makefile("r", encoding="utf-8").readline().split()
+                    conn.sendall((self._command(line) + "\n").encode("utf-8"))
+                except (OSError, ValueError) as e:
+                    print(f"Profiler control error: {e}")
+
+    def _command(self, args) -> str:
+        if not args or args[0] == "status":
+            if self._active is not None:
+                left = self._active["end"] - time.perf_counter()
+                return f"running: {self._active['mode']}, {max(0.0, left):.1f}s left"
+            return f"idle; last result: {self.last_result or 'none'}"
+        if args[0] == "profile":
+            mode = args[1] if len(args) > 1 else None
+            duration = float(args[2]) if len(args) > 2 else None
+            return self.request(mode, duration)
+        if args[0] == "stop":
+            if self._active is None:
+                return "idle"
+            self._active["end"] = 0.0
+            return "ok: stopping after the current frame"
+        return "commands: profile [cprofile|sampling] [seconds], status, stop"
+
+    # ---- frame loop -----------------------------------------------------
+
+    def tick(self):
+        """Call once per frame from the loop thread."""
+        if self._requested is None and self._active is None:
+            return
+        if self._active is None:
+            self._start(self._requested)
+            self._requested = None
+        elif time.perf_counter() >= self._active["end"]:
+            self._finish()
+
+    def _start(self, req: Dict):
+        active = {"mode": req["mode"], "stamp": datetime.now().strftime("%Y%m%d-%H%M%S"),
+                  "end": time.perf_counter() + req["duration_s"], "started": time.perf_counter()}
+        if self.trace_memory:
+            active["own_tracemalloc"] = not tracemalloc.is_tracing()
+            if active["own_tracemalloc"]:
+                tracemalloc.start(10)
+            active["snap"] = tracemalloc.take_snapshot()
+        if req["mode"] == "cprofile":
+            active["prof"] = cProfile.Profile()
+            active["prof"].enable()
+        else:
+            active["sampler"] = _Sampler(threading.get_ident(), self.sample_interval_s)
+            active["sampler"].start()
+        self._active = active
+        print(f"Profiling started: {req['mode']} for {req['duration_s']:g}s")
+
+    def _finish(self):
+        active, self._active = self._active, None
+        elapsed = time.perf_counter() - active["started"]
+        if "prof" in active:
+            active["prof"].disable()
+        else:
+            active["sampler"].stop()
+        alloc = None
+        if "snap" in active:
+            alloc = tracemalloc.take_snapshot().compare_to(active["snap"], "lineno")
+            if active["own_tracemalloc"]:
+                tracemalloc.stop()
+        try:
+            self.last_result = self._write(active, elapsed, alloc)
+            print(f"Profile written: {self.last_result}")
+        except OSError as e:
+            print(f"Profile write failed: {e}")
+
+    def _write(self, active: Dict, elapsed: float, alloc) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, f"{active['stamp']}-{active['mode']}")
+        header = f"{active['mode']} profile, {elapsed:.1f}s, pid {os.getpid()}\n\n"
+        if "prof" in active:
+            active["prof"].dump_stats(f"{base}.prof")
+            buf = io.StringIO()
+            stats = pstats.Stats(active["prof"], stream=buf).strip_dirs()
+            stats.sort_stats("tottime").print_stats(self.top_n)
+            stats.sort_stats("cumulative").print_stats(self.top_n)
+            summary = buf.getvalue()
+        else:
+            active["sampler"].write_folded(f"{base}.folded")
+            summary = active["sampler"].summary(self.top_n)
+        with open(f"{base}-summary.txt", "w", encoding="utf-8") as f:
+            f.write(header + summary)
+        if alloc is not None:
+            with open(f"{base}-alloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"tracemalloc growth over {elapsed:.1f}s (top {self.top_n} lines)\n\n")
+                for stat in alloc[:self.top_n]:
+                    f.write(f"{stat}\n")
+        return f"{base}-summary.txt"
+
+    def close(self):
+        if self._active is not None:
+            self._finish()
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.close()
+
+
+class NullProfiler:
+    """Drop-in replacement used when profiling is disabled."""
+
+    def tick(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_profiler(cfg: Optional[Dict], base_dir: str) -> "Profiler | NullProfiler":
+    """Build a profiler from the "profiling" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return NullProfiler()
+    profiler = Profiler(
+        cfg.get("dir", os.path.join(base_dir, "logs", "profiles")),
+        mode=str(cfg.get("mode", "sampling")),
+        duration_s=float(cfg.get("duration_s", 30.0)),
+        top_n=int(cfg.get("top_n", 25)),
+        sample_interval_s=float(cfg.get("sample_interval_s", 0.005)),
+        trace_memory=bool(cfg.get("tracemalloc", True)),
+    )
+    if cfg.get("signal", True) and profiler.install_signal():
+        print(f"Profiler: send SIGUSR1 to pid {os.getpid()} for a {profiler.duration_s:g}s capture")
+    if cfg.get("control_port"):
+        try:
+            profiler.serve(str(cfg.get("control_host", "127.0.0.1")), int(cfg["control_port"]))
+        except OSError as e:
+            print(f"Could not start profiler control socket: {e}")
+    return profiler
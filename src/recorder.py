@@ -0,0 +1,174 @@
+"""Background recorder for the annotated view.
+
+The frame loop copies the raw frame into one of `queue_size` preallocated
+buffers and queues it with its overlay data (boxes, IDs, density, phase).
+A worker thread draws the overlay, encodes with cv2.VideoWriter (which
+releases the GIL while encoding) and rotates segments. When every buffer
+is still waiting to be encoded, the frame is skipped and counted instead
+of stalling the loop.
+
+Each segment is a video plus a JSON-lines sidecar with the timestamp,
+frame index, density and phase of every recorded frame, so footage can be
+matched to telemetry and to the signal state shown at the time:
+
+  <dir>/<camera>-YYYYMMDD-HHMMSS.mp4
+  <dir>/<camera>-YYYYMMDD-HHMMSS.jsonl
+"""
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from overlay import draw_overlay
+
+CONTAINERS = {"mp4v": ".mp4", "avc1": ".mp4", "MJPG": ".avi", "XVID": ".avi"}
+
+
+class Recorder:
+    """Draws and encodes annotated frames on a worker thread, in rotated segments."""
+
+    def __init__(self, directory: str, frame_size: Tuple[int, int], fps: float = 30.0, camera_id: str = "cam0",
+                 segment_s: float = 300.0, queue_size: int = 16, codec: str = "mp4v", max_segments: int = 0):
+        self.directory = directory
+        self.frame_size = tuple(frame_size)
+        self.fps = float(fps)
+        self.camera_id = camera_id
+        self.segment_s = float(segment_s)
+        self.codec = codec
+        self.ext = CONTAINERS.get(codec, ".avi")
+        self.max_segments = int(max_segments)
+        os.makedirs(directory, exist_ok=True)
+
+        width, height = self.frame_size
+        self._buffers = np.empty((max(1, int(queue_size)), height, width, 3), dtype=np.uint8)
+        self._free: "queue.SimpleQueue[int]" = queue.SimpleQueue()
+        for i in range(len(self._buffers)):
+            self._free.put(i)
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        # Writer-thread state
+        self._writer: Optional[cv2.VideoWriter] = None
+        self._sidecar = None
+        self._segment_start = 0.0
+        self._segment_frames = 0
+        self._segment_dropped = 0
+        self.segments = 0
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray, overlay: Dict[str, Any], ts: float, frame_idx: int) -> bool:
+        """Queue a raw frame with its draw_overlay() arguments; False if it was skipped."""
+        self.submitted += 1
+        try:
+            idx = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        np.copyto(self._buffers[idx], frame)
+        # The caller refills its overlay dict and box table every frame
+        overlay = dict(overlay, tracked_boxes=np.array(overlay["tracked_boxes"]))
+        self._queue.put((idx, overlay, ts, frame_idx, self.dropped))
+        return True
+
+    def _segment_path(self, ts: float) -> str:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(ts))
+        return os.path.join(self.directory, f"{self.camera_id}-{stamp}")
+
+    def _close_segment(self, dropped_total: int):
+        if self._writer is None:
+            return
+        self._writer.release()
+        self._sidecar.close()
+        self._writer = None
+        print(f"Recorded segment {self._path}{self.ext}: {self._segment_frames} frames, "
+              f"{dropped_total - self._segment_dropped} skipped")
+
+    def _open_segment(self, ts: float, dropped_total: int):
+        self._path = self._segment_path(ts)
+        fourcc = cv2.VideoWriter_fourcc(*self.codec)
+        self._writer = cv2.VideoWriter(self._path + self.ext, fourcc, self.fps, self.frame_size)
+        if not self._writer.isOpened():
+            print(f"Recorder could not open {self._path + self.ext} with codec {self.codec}")
+        self._sidecar = open(self._path + ".jsonl", "w", encoding="utf-8")
+        self._segment_start = ts
+        self._segment_frames = 0
+        self._segment_dropped = dropped_total
+        self.segments += 1
+        self._prune()
+
+    def _prune(self):
+        if self.max_segments <= 0:
+            return
+        videos = sorted(glob.glob(os.path.join(self.directory, f"{self.camera_id}-*{self.ext}")))
+        for path in videos[:-self.max_segments]:
+            for old in (path, os.path.splitext(path)[0] + ".jsonl"):
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def _run(self):
+        dropped_total = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            idx, overlay, ts, frame_idx, dropped_total = item
+            img = self._buffers[idx]
+            try:
+                draw_overlay(img, **overlay)
+                if self._writer is None or ts - self._segment_start >= self.segment_s:
+                    self._close_segment(dropped_total)
+                    self._open_segment(ts, dropped_total)
+                self._writer.write(img)
+                self._sidecar.write(json.dumps({
+                    "ts": round(ts, 3), "frame": frame_idx, "density": round(overlay["density"], 4),
+                    "avg_density": round(overlay["avg_density"], 4), "phase": overlay["phase"],
+                    "seconds_left": overlay["seconds_left"], "vehicles": overlay["vehicles_in_polygon"],
+                }) + "\n")
+                self._segment_frames += 1
+                self.written += 1
+            except Exception as e:
+                print(f"Recorder error: {e}")
+            finally:
+                self._free.put(idx)
+        self._close_segment(dropped_total)
+
+    @property
+    def queue_depth(self) -> int:
+        """Buffers holding a frame that is not encoded yet."""
+        return len(self._buffers) - self._free.qsize()
+
+    def close(self):
+        """Encode the frames still queued, then finish the open segment."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            print(f"Recorder skipped {self.dropped} of {self.submitted} frames (encoder could not keep up)")
+
+
+def create_recorder(cfg: Optional[Dict], base_dir: str, frame_size: Tuple[int, int],
+                    fps: float) -> Optional[Recorder]:
+    """Build a recorder from the "recorder" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return None
+    return Recorder(
+        cfg.get("dir", os.path.join(base_dir, "recordings")),
+        frame_size,
+        fps=float(cfg.get("fps", 0) or fps),
+        camera_id=str(cfg.get("camera_id", "cam0")),
+        segment_s=float(cfg.get("segment_s", 300.0)),
+        queue_size=int(cfg.get("queue_size", 16)),
+        codec=str(cfg.get("codec", "mp4v")),
+        max_segments=int(cfg.get("max_segments", 0)),
+    )
@@ -0,0 +1,286 @@
+"""Parameter sweep of the controller rules over recorded density traces.
+
+A trace is a per-frame density recording (timestamps + density). Each trace
+is replayed through the controller logic for many TimingRules combinations
+at once: the state of every parameter set lives in NumPy arrays, so one pass
+over the trace evaluates a whole block of combinations. Blocks are spread
+over a process pool.
+
+Usage:
+  python src/rule_sweep.py "logs/telemetry/frames/*/*.parquet" \
+      --grid low_density=0.2,0.25,0.3 --grid low_reduction=0.3,0.4,0.5 \
+      --grid rule_interval_s=3,5 --workers 8 --out sweep.csv
+"""
+import argparse
+import csv
+import glob
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from controller import DynamicTimingController, TimingRules
+
+GREEN, YELLOW, RED = 0, 1, 2
+
+# Sweepable parameters: every TimingRules field plus the fixed phase lengths
+PHASE_PARAMS = {"yellow_s": 5.0, "red_s": 60.0}
+PARAM_NAMES = [f.name for f in fields(TimingRules)] + list(PHASE_PARAMS)
+
+
+def load_density_trace(path: str, fps: float = 30.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Load a trace as (timestamps, density).
+
+    Supported formats:
+      .npy  shape (N,) densities sampled at `fps`, or (N,2) [t, density]
+      .csv  header with `t` (or `ts`) and `density` columns
+      .parquet  telemetry frame files (`ts`, `density` columns)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        data = np.load(path)
+        if data.ndim == 1:
+            return np.arange(len(data), dtype=float) / fps, data.astype(float)
+        return data[:, 0].astype(float), data[:, 1].astype(float)
+    if ext == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        t_key = "t" if rows and "t" in rows[0] else "ts"
+        t = np.array([float(r[t_key]) for r in rows])
+        d = np.array([float(r["density"]) for r in rows])
+        return t, d
+    if ext == ".parquet":
+        import polars as pl
+        df = pl.read_parquet(path, columns=["ts", "density"]).sort("ts")
+        return df["ts"].to_numpy().astype(float), df["density"].to_numpy().astype(float)
+    raise ValueError(f"Unsupported trace format: {path}")
+
+
+def sliding_average(t: np.ndarray, density: np.ndarray, window_s: float = 5.0) -> np.ndarray:
+    """Mean density over the trailing `window_s` seconds at every sample."""
+    csum = np.concatenate(([0.0], np.cumsum(density)))
+    start = np.searchsorted(t, t - window_s, side="right")
+    end = np.arange(1, len(t) + 1)
+    start = np.minimum(start, end - 1)
+    return (csum[end] - csum[start]) / (end - start)
+
+
+def replay_trace(t: np.ndarray, avg: np.ndarray, rules: TimingRules,
+                 yellow_s: float = 5.0, red_s: float = 60.0) -> Dict[str, float]:
+    """Reference replay of one parameter set through DynamicTimingController."""
+    now = [float(t[0]) if len(t) else 0.0]
+    ctrl = DynamicTimingController(yellow_seconds=yellow_s, red_seconds=red_s, rules=rules, clock=lambda: now[0])
+    counts = {'GREEN': 1, 'YELLOW': 0, 'RED': 0}
+    greens: List[float] = []
+    for ts, a in zip(t, avg):
+        now[0] = float(ts)
+        if ctrl.phase == 'GREEN':
+            ctrl.maybe_apply_rules(float(a))
+        prev = ctrl.phase
+        ctrl.advance_phase_if_due()
+        if ctrl.phase != prev:
+            counts[ctrl.phase] += 1
+            if prev == 'GREEN':
+                greens.append(ctrl.green_total)
+    return {
+        "total_saved": ctrl.total_saved,
+        "green_phases": counts['GREEN'],
+        "yellow_phases": counts['YELLOW'],
+        "red_phases": counts['RED'],
+        "worst_green": max(greens) if greens else 0.0,
+        "mean_green": float(np.mean(greens)) if greens else 0.0,
+        "completed_greens": len(greens),
+    }
+
+
+def simulate_batch(t: np.ndarray, avg: np.ndarray, params: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Replay one trace for P parameter sets at once.
+
+    `params` maps names from PARAM_NAMES to arrays of length P (missing names
+    use defaults). Step semantics match src/main.py: rules are applied during
+    GREEN, then at most one phase transition happens per frame.
+    """
+    p = len(next(iter(params.values()))) if params else 1
+    defaults = {**asdict(TimingRules()), **PHASE_PARAMS}
+    prm = {name: np.broadcast_to(np.asarray(params.get(name, defaults[name]), dtype=float), (p,))
+           for name in PARAM_NAMES}
+
+    t0 = float(t[0]) if len(t) else 0.0
+    phase = np.full(p, GREEN, dtype=np.int8)
+    phase_start = np.full(p, t0)
+    last_rule = np.full(p, t0)
+    green_total = prm["worst_case"].copy()
+    total_saved = np.zeros(p)
+    counts = np.zeros((3, p), dtype=np.int64)
+    counts[GREEN] = 1
+    worst_green = np.zeros(p)
+    green_sum = np.zeros(p)
+    greens = np.zeros(p, dtype=np.int64)
+
+    # Only visit samples where some parameter set can change state; between
+    # events every controller is idle, so skipping those samples is exact.
+    times = t.tolist()
+    values = avg.tolist()
+    i = 0
+    n = len(times)
+    while i < n:
+        now, a = times[i], values[i]
+        elapsed = now - phase_start
+        g = phase == GREEN
+
+        # Rule evaluation (maybe_apply_rules)
+        remaining = np.maximum(0.0, green_total - elapsed)
+        due = g & (elapsed >= prm["warmup_s"]) & ((now - last_rule) >= prm["rule_interval_s"]) & (remaining > 0)
+        if due.any():
+            factor = np.where(a < prm["low_density"], prm["low_reduction"],
+                     np.where((prm["medium_density_min"] <= a) & (a <= prm["medium_density_max"]), prm["medium_reduction"],
+                     np.where(a >= prm["high_density"], prm["high_reduction"], 0.0)))
+            cut = due & (factor > 0.0)
+            new_total = np.clip(elapsed + remaining * (1.0 - factor), prm["best_case"], prm["worst_case"])
+            green_total = np.where(cut, new_total, green_total)
+            last_rule = np.where(due, now, last_rule)
+
+        # Phase transitions (advance_phase_if_due)
+        to_yellow = g & (elapsed >= green_total)
+        to_red = (phase == YELLOW) & (elapsed >= prm["yellow_s"])
+        to_green = (phase == RED) & (elapsed >= prm["red_s"])
+        if to_yellow.any():
+            worst_green = np.where(to_yellow, np.maximum(worst_green, green_total), worst_green)
+            green_sum += np.where(to_yellow, green_total, 0.0)
+            greens += to_yellow
+            phase[to_yellow] = YELLOW
+            counts[YELLOW] += to_yellow
+        if to_red.any():
+            phase[to_red] = RED
+            counts[RED] += to_red
+        if to_green.any():
+            total_saved += np.where(to_green, np.maximum(0.0, prm["worst_case"] - green_total), 0.0)
+            phase[to_green] = GREEN
+            last_rule = np.where(to_green, now, last_rule)
+            green_total = np.where(to_green, prm["worst_case"], green_total)
+            counts[GREEN] += to_green
+        changed = to_yellow | to_red | to_green
+        if changed.any():
+            phase_start = np.where(changed, now, phase_start)
+
+        rule_due = np.maximum(phase_start + prm["warmup_s"], last_rule + prm["rule_interval_s"])
+        next_event = np.where(phase == GREEN, np.minimum(phase_start + green_total, rule_due),
+                     np.where(phase == YELLOW, phase_start + prm["yellow_s"], phase_start + prm["red_s"]))
+        i = max(i + 1, int(np.searchsorted(t, next_event.min() - 1e-6, side="left")))
+
+    return {
+        "total_saved": total_saved,
+        "green_phases": counts[GREEN],
+        "yellow_phases": counts[YELLOW],
+        "red_phases": counts[RED],
+        "worst_green": worst_green,
+        "mean_green": np.divide(green_sum, greens, out=np.zeros(p), where=greens > 0),
+        "completed_greens": greens,
+    }
+
+
+def build_grid(grid: Dict[str, Sequence[float]]) -> Dict[str, np.ndarray]:
+    """Cartesian product of the per-parameter value lists, as column arrays."""
+    for name in grid:
+        if name not in PARAM_NAMES:
+            raise ValueError(f"Unknown parameter '{name}' (expected one of {', '.join(PARAM_NAMES)})")
+    names = list(grid)
+    combos = list(itertools.product(*(grid[n] for n in names))) or [()]
+    return {n: np.array([c[i] for c in combos], dtype=float) for i, n in enumerate(names)}
+
+
+_worker_traces: List[Tuple[np.ndarray, np.ndarray]] = []
+
+
+def _init_worker(trace_paths: Sequence[str], fps: float, window_s: float):
+    global _worker_traces
+    _worker_traces = []
+    for path in trace_paths:
+        t, d = load_density_trace(path, fps)
+        _worker_traces.append((t, sliding_average(t, d, window_s)))
+
+
+def _run_block(block: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    total: Optional[Dict[str, np.ndarray]] = None
+    for t, avg in _worker_traces:
+        res = simulate_batch(t, avg, block)
+        if total is None:
+            total = res
+            continue
+        n_total, n_res = total["completed_greens"], res["completed_greens"]
+        green_sum = total["mean_green"] * n_total + res["mean_green"] * n_res
+        for key in ("total_saved", "green_phases", "yellow_phases", "red_phases", "completed_greens"):
+            total[key] = total[key] + res[key]
+        total["mean_green"] = np.divide(green_sum, total["completed_greens"],
+                                        out=np.zeros(len(green_sum)), where=total["completed_greens"] > 0)
+        total["worst_green"] = np.maximum(total["worst_green"], res["worst_green"])
+    return total
+
+
+def sweep(trace_paths: Sequence[str], grid: Dict[str, Sequence[float]], workers: Optional[int] = None,
+          block_size: int = 1024, fps: float = 30.0, window_s: float = 5.0) -> List[Dict[str, float]]:
+    """Evaluate every grid combination over all traces, summed across traces."""
+    columns = build_grid(grid)
+    n = len(next(iter(columns.values()))) if columns else 1
+    blocks = [{k: v[i:i + block_size] for k, v in columns.items()} for i in range(0, n, block_size)]
+    if not columns:
+        blocks = [{}]
+
+    if workers == 1 or len(blocks) == 1:
+        _init_worker(trace_paths, fps, window_s)
+        results = [_run_block(b) for b in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(list(trace_paths), fps, window_s)) as pool:
+            results = list(pool.map(_run_block, blocks))
+
+    rows = []
+    for block, res in zip(blocks, results):
+        size = len(res["total_saved"])
+        for i in range(size):
+            row = {k: float(v[i]) for k, v in block.items()}
+            row.update({k: float(v[i]) for k, v in res.items()})
+            rows.append(row)
+    rows.sort(key=lambda r: r["total_saved"], reverse=True)
+    return rows
+
+
+def _parse_grid(items: Sequence[str]) -> Dict[str, List[float]]:
+    grid: Dict[str, List[float]] = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        grid[name.strip()] = [float(v) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep controller rule parameters over density traces")
+    parser.add_argument("traces", nargs="+", help="Trace files or glob patterns (.npy/.csv)")
+    parser.add_argument("--grid", action="append", default=[],
+                        help="name=v1,v2,... (repeatable); names: " + ", ".join(PARAM_NAMES))
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size [cpu count]")
+    parser.add_argument("--block-size", type=int, default=1024, help="Parameter sets per vectorised block")
+    parser.add_argument("--fps", type=float, default=30.0, help="Sample rate for 1-D .npy traces")
+    parser.add_argument("--window", type=float, default=5.0, help="Sliding average window in seconds")
+    parser.add_argument("--top", type=int, default=10, help="Rows to print")
+    parser.add_argument("--out", help="Write all results to this CSV file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    paths = sorted({p for pattern in args.traces for p in (glob.glob(pattern) or [pattern])})
+    rows = sweep(paths, _parse_grid(args.grid), workers=args.workers, block_size=args.block_size,
+                 fps=args.fps, window_s=args.window)
+    print(f"{len(rows)} parameter sets over {len(paths)} trace(s)")
+    for row in rows[:args.top]:
+        print(", ".join(f"{k}={v:g}" for k, v in row.items()))
+    if args.out and rows:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Results written to {args.out}")
@@ -0,0 +1,196 @@
+"""Scene geometry derived from the mask image and ROI polygon.
+
+Everything that depends only on (mask, polygon, frame size) is computed once
+here instead of per frame: the resized BGR mask, the polygon area, a raster
+of the polygon and its integral image, and the polygon's bounding crop. The
+integral image turns the bbox/polygon overlap of every tracked vehicle into
+four table lookups instead of two full-frame rasterisations.
+
+load_scene() additionally keeps compiled scenes on disk as .npy files keyed by
+mask file hash, polygon and frame size:
+
+  <cache_dir>/<key>/mask.npy       resized BGR mask (uint8, H x W x 3)
+  <cache_dir>/<key>/raster.npy     polygon raster (uint8, H x W)
+  <cache_dir>/<key>/integral.npy   integral image of the raster (int32)
+  <cache_dir>/<key>/meta.json      polygon, area, crop and key inputs
+
+Later runs and worker processes memory-map these read-only instead of
+decoding, resizing and rasterising again, and share the pages through the
+OS page cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from detection_cache import fingerprint_file
+
+# Bump when the stored artifacts change meaning
+SCENE_CACHE_VERSION = 1
+_ARRAYS = ("mask", "raster", "integral")
+
+
+def calculate_polygon_area(points):
+    """Calculate area of polygon using Shoelace formula"""
+    x = points[:, 0]
+    y = points[:, 1]
+    return 0.5 * np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+
+def is_point_in_polygon(point, polygon):
+    """Check if point is inside polygon"""
+    return cv2.pointPolygonTest(polygon, point, False) >= 0
+
+
+def calculate_bbox_polygon_intersection_area(bbox, polygon, frame_shape):
+    """Calculate intersection area between bounding box and polygon (reference rasterisation)"""
+    x1, y1, x2, y2 = bbox
+
+    mask_poly = np.zeros((frame_shape[0], frame_shape[1]), dtype=np.uint8)
+    cv2.fillPoly(mask_poly, [polygon], 255)
+
+    mask_bbox = np.zeros((frame_shape[0], frame_shape[1]), dtype=np.uint8)
+    cv2.rectangle(mask_bbox, (int(x1), int(y1)), (int(x2), int(y2)), 255, -1)
+
+    intersection = cv2.bitwise_and(mask_poly, mask_bbox)
+    intersection_area = np.sum(intersection > 0)
+
+    return intersection_area
+
+
+def prepare_mask(mask: np.ndarray, frame_size: Tuple[int, int]) -> np.ndarray:
+    """Resize a mask image to (width, height) and make it 3-channel BGR."""
+    mask = cv2.resize(mask, frame_size)
+    if len(mask.shape) == 2:
+        mask = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+    elif mask.shape[2] == 4:
+        mask = cv2.cvtColor(mask, cv2.COLOR_BGRA2BGR)
+    return mask
+
+
+class Scene:
+    """Precompiled mask/polygon artifacts for one frame resolution."""
+
+    def __init__(self, mask: np.ndarray, polygon: np.ndarray, polygon_raster: np.ndarray,
+                 polygon_integral: np.ndarray, polygon_area: float, crop_rect: Tuple[int, int, int, int]):
+        self.mask = mask
+        self.polygon = polygon
+        self.polygon_raster = polygon_raster
+        self.polygon_integral = polygon_integral
+        self.polygon_area = polygon_area
+        self.crop_rect = crop_rect
+        self.height, self.width = polygon_raster.shape[:2]
+        # Set by load_scene(); used to tell whether the mask file changed
+        self.mask_fingerprint: Optional[str] = None
+
+    def contains_point(self, point) -> bool:
+        return cv2.pointPolygonTest(self.polygon, point, False) >= 0
+
+    def bbox_area_in_polygon(self, x1: int, y1: int, x2: int, y2: int) -> int:
+        """Pixels of the filled box (x1,y1)-(x2,y2), inclusive, that lie in the polygon.
+
+        Matches calculate_bbox_polygon_intersection_area exactly.
+        """
+        xa, xb = (x1, x2) if x1 <= x2 else (x2, x1)
+        ya, yb = (y1, y2) if y1 <= y2 else (y2, y1)
+        xa = max(0, xa)
+        ya = max(0, ya)
+        xb = min(self.width - 1, xb)
+        yb = min(self.height - 1, yb)
+        if xa > xb or ya > yb:
+            return 0
+        ii = self.polygon_integral
+        return int(ii[yb + 1, xb + 1] - ii[ya, xb + 1] - ii[yb + 1, xa] + ii[ya, xa])
+
+
+def build_scene(mask_image: np.ndarray, polygon_points: Sequence[Tuple[int, int]], frame_size: Tuple[int, int]) -> Scene:
+    """Compile the scene for frames of size (width, height)."""
+    width, height = frame_size
+    mask = prepare_mask(mask_image, (width, height))
+    polygon = np.array(polygon_points, np.int32)
+
+    raster = np.zeros((height, width), dtype=np.uint8)
+    cv2.fillPoly(raster, [polygon], 1)
+    integral = cv2.integral(raster, sdepth=cv2.CV_32S)
+
+    x, y, w, h = cv2.boundingRect(polygon)
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    crop_rect = (x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+    return Scene(mask, polygon, raster, integral, float(calculate_polygon_area(polygon)), crop_rect)
+
+
+def scene_cache_key(mask_fingerprint: str, polygon_points: Sequence[Tuple[int, int]], frame_size: Tuple[int, int]) -> str:
+    parts = {
+        "version": SCENE_CACHE_VERSION,
+        "mask": mask_fingerprint,
+        "polygon": [[int(x), int(y)] for x, y in polygon_points],
+        "frame_size": [int(frame_size[0]), int(frame_size[1])],
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _read_cached_scene(path: str) -> Optional[Scene]:
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+    except (OSError, ValueError, KeyError):
+        return None
+    polygon = np.array(meta["polygon"], np.int32)
+    return Scene(arrays["mask"], polygon, arrays["raster"], arrays["integral"],
+                 float(meta["polygon_area"]), tuple(meta["crop_rect"]))
+
+
+def _write_cached_scene(path: str, scene: Scene, meta: dict):
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    # Written to a private directory and renamed into place, so concurrent
+    # workers either see a complete entry or none at all
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        np.save(os.path.join(tmp, "mask.npy"), np.ascontiguousarray(scene.mask))
+        np.save(os.path.join(tmp, "raster.npy"), scene.polygon_raster)
+        np.save(os.path.join(tmp, "integral.npy"), scene.polygon_integral)
+        meta = dict(meta, polygon=scene.polygon.tolist(), polygon_area=scene.polygon_area,
+                    crop_rect=list(scene.crop_rect))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.rename(tmp, path)
+    except OSError:
+        # Another worker won the race (or the disk is read-only); ours is not needed
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_scene(mask_path: str, polygon_points: Sequence[Tuple[int, int]], frame_size: Tuple[int, int],
+               cache_dir: Optional[str] = None) -> Scene:
+    """Compile a scene from a mask file, reusing the on-disk cache when given.
+
+    Cached arrays are memory-mapped read-only; callers must not modify them.
+    """
+    fingerprint = fingerprint_file(mask_path)
+    path = None
+    if cache_dir:
+        key = scene_cache_key(fingerprint, polygon_points, frame_size)
+        path = os.path.join(cache_dir, key)
+        if os.path.isdir(path):
+            scene = _read_cached_scene(path)
+            if scene is not None:
+                scene.mask_fingerprint = fingerprint
+                return scene
+
+    mask_image = cv2.imread(mask_path)
+    if mask_image is None:
+        raise ValueError(f"cannot read mask {mask_path}")
+    scene = build_scene(mask_image, polygon_points, frame_size)
+    scene.mask_fingerprint = fingerprint
+    if path is not None:
+        _write_cached_scene(path, scene, {"mask_path": os.path.abspath(mask_path), "mask": fingerprint,
+                                          "frame_size": list(frame_size)})
+    return scene
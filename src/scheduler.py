@@ -0,0 +1,324 @@
+"""Deadline-aware choice of inference size, frame stride and model tier.
+
+The scheduler aims for one density update every 1 / `target_hz` seconds.
+It keeps an exponentially weighted estimate of inference cost per unit of
+work (seconds per 640x640 pass of the top tier, observed on whatever
+configuration ran last) and of the rest of the loop. A configuration's cost
+is that rate times its relative work: (imgsz / 640)^2 times the tier's cost.
+So a slowdown seen on one configuration updates the estimates of all of
+them. Each frame it:
+
+  - steps down the quality ladder (configurations by decreasing work) as
+    soon as the estimated frame time no longer fits the budget,
+  - steps up one rung when the better configuration would fit with
+    `headroom` to spare, at most once per `min_dwell` frames,
+  - sets the stride so analysed frames are one budget period apart in
+    video time, or further apart when even the cheapest rung is too slow
+    (raised at once, lowered again only after `min_dwell` frames).
+
+Every change is printed with its reason; `log_path` additionally writes one
+JSON line per frame with the plan and the measured latency.
+"""
+import json
+import math
+import os
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+REFERENCE_IMGSZ = 640
+
+
+class Plan:
+    """What to run for one frame."""
+
+    __slots__ = ("model_path", "tier", "imgsz", "stride")
+
+    def __init__(self, model_path: str, tier: int, imgsz: int, stride: int):
+        self.model_path = model_path
+        self.tier = tier
+        self.imgsz = imgsz
+        self.stride = stride
+
+    def __repr__(self) -> str:
+        return f"Plan(tier={self.tier}, imgsz={self.imgsz}, stride={self.stride})"
+
+
+class DensityWindow:
+    """Average of per-frame densities over the last `span` source frames.
+
+    Keyed by source frame position rather than by entry count, so skipped
+    frames and a changing stride keep the window at the same video duration.
+    """
+
+    def __init__(self, span: int):
+        self.span = max(1, int(span))
+        self._entries: "deque[Tuple[int, float]]" = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, position: int, density: float) -> float:
+        """Record the density of the frame at `position`; returns the window average."""
+        self._entries.append((position, density))
+        while self._entries[0][0] <= position - self.span:
+            self._entries.popleft()
+        return self.average
+
+    @property
+    def average(self) -> float:
+        if not self._entries:
+            return 0
+        return sum(d for _, d in self._entries) / len(self._entries)
+
+
+class InferenceScheduler:
+    """Picks (model tier, imgsz, stride) per frame from recent latency."""
+
+    def __init__(self, model_paths: Sequence[str], target_hz: float = 5.0, source_fps: float = 30.0,
+                 imgsz_levels: Sequence[int] = (640, 512, 416, 320), tier_costs: Optional[Sequence[float]] = None,
+                 max_stride: int = 30, alpha: float = 0.2, headroom: float = 0.8, min_dwell: int = 10,
+                 log_path: Optional[str] = None, verbose: bool = True):
+        if not model_paths:
+            raise ValueError("scheduler needs at least one model")
+        # Tiers are listed fastest first; the last is the most accurate
+        self.model_paths = list(model_paths)
+        if tier_costs is None:
+            # Each tier roughly doubles the work of the one below it
+            tier_costs = [0.5 ** (len(self.model_paths) - 1 - t) for t in range(len(self.model_paths))]
+        self.tier_costs = [float(c) for c in tier_costs]
+        self.budget_s = 1.0 / float(target_hz)
+        self.source_fps = float(source_fps)
+        self.max_stride = max(1, int(max_stride))
+        self.alpha = float(alpha)
+        self.headroom = float(headroom)
+        self.min_dwell = int(min_dwell)
+        self.verbose = verbose
+
+        levels = sorted({int(s) for s in imgsz_levels}, reverse=True)
+        # Quality ladder, most work first; on equal work the larger model wins
+        self.ladder: List[Tuple[int, int]] = sorted(
+            ((t, s) for t in range(len(self.model_paths)) for s in levels),
+            key=lambda ts: (-self.tier_costs[ts[0]] * ts[1] ** 2, -ts[0]))
+        self.rung = 0
+        self.stride = min(self.max_stride, max(1, int(math.ceil(self.budget_s * self.source_fps - 1e-9))))
+        self.rate: Optional[float] = None        # inference seconds per unit of work
+        self.overhead_s = 0.0                    # rest of the loop per analysed frame
+        self._since_change = 0
+        self.frames = 0
+        self.changes = 0
+        self._log = open(log_path, "a", encoding="utf-8") if log_path else None
+
+    def cost(self, rung: int) -> float:
+        tier, imgsz = self.ladder[rung]
+        return self.tier_costs[tier] * (imgsz / REFERENCE_IMGSZ) ** 2
+
+    def estimate(self, rung: int) -> float:
+        """Estimated seconds per analysed frame on a rung (0 until the first observation)."""
+        if self.rate is None:
+            return 0.0
+        return self.rate * self.cost(rung) + self.overhead_s
+
+    def _plan(self) -> Plan:
+        tier, imgsz = self.ladder[self.rung]
+        return Plan(self.model_paths[tier], tier, imgsz, self.stride)
+
+    def plan(self) -> Plan:
+        """Configuration for the next frame."""
+        return self._plan()
+
+    def observe(self, inference_s: float, frame_s: float, ts: Optional[float] = None,
+                frame_idx: Optional[int] = None) -> Plan:
+        """Feed the measured latency of the frame that just ran and re-plan."""
+        ran = self._plan()
+        work = self.cost(self.rung)
+        rate = inference_s / work if work > 0 else inference_s
+        other = max(0.0, frame_s - inference_s)
+        if self.rate is None:
+            self.rate, self.overhead_s = rate, other
+        else:
+            self.rate += self.alpha * (rate - self.rate)
+            self.overhead_s += self.alpha * (other - self.overhead_s)
+        self.frames += 1
+        self._since_change += 1
+
+        reason = None
+        rung = self.rung
+        if self.estimate(rung) > self.budget_s:
+            while rung < len(self.ladder) - 1 and self.estimate(rung) > self.budget_s:
+                rung += 1
+            reason = f"est {self.estimate(self.rung) * 1000:.0f} ms > budget {self.budget_s * 1000:.0f} ms"
+        elif rung > 0 and self._since_change >= self.min_dwell \
+                and self.estimate(rung - 1) <= self.headroom * self.budget_s:
+            rung -= 1
+            reason = (f"est {self.estimate(rung) * 1000:.0f} ms fits {self.headroom:.0%} "
+                      f"of budget {self.budget_s * 1000:.0f} ms")
+
+        period = max(self.budget_s, self.estimate(rung))
+        stride = min(self.max_stride, max(1, int(math.ceil(period * self.source_fps - 1e-9))))
+        if stride < self.stride and rung == self.rung and self._since_change < self.min_dwell:
+            stride = self.stride
+        if rung != self.rung or stride != self.stride:
+            old = ran
+            self.rung, self.stride = rung, stride
+            self._since_change = 0
+            self.changes += 1
+            new = self._plan()
+            if self.verbose:
+                print(f"Scheduler: tier {old.tier}->{new.tier}, imgsz {old.imgsz}->{new.imgsz}, "
+                      f"stride {old.stride}->{new.stride} ({reason or 'stride follows frame time'})")
+        if self._log is not None:
+            self._log.write(json.dumps({
+                "ts": ts, "frame": frame_idx, "tier": ran.tier, "imgsz": ran.imgsz, "stride": ran.stride,
+                "inference_ms": round(inference_s * 1000, 2), "frame_ms": round(frame_s * 1000, 2),
+                "est_ms": round(self.estimate(self.rung) * 1000, 2),
+                "next_tier": self.ladder[self.rung][0], "next_imgsz": self.ladder[self.rung][1],
+                "next_stride": self.stride,
+            }) + "\n")
+        return self._plan()
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self.verbose and self.frames:
+            print(f"Scheduler: {self.changes} plan changes over {self.frames} frames")
+
+
+class PhaseAwareScheduler:
+    """Runs inference at full rate only while the controller can read the result.
+
+    DynamicTimingController looks at density only in GREEN, first after
+    `warmup_s` and then every `rule_interval_s`, and each look reads the
+    density average over the window before it. So frames are analysed at
+    full rate from one window (plus `lead_s`) before the next rule
+    evaluation through to the last evaluation that can still change the
+    green. An evaluation can change the green only while the green is
+    above `best_case`. The window is measured in source frames, and
+    `window_frames` is converted to wall time with the observed seconds per
+    source frame at full rate, so a loop running slower than real time
+    ramps up earlier. Outside those spans (early GREEN, YELLOW, RED, and a
+    green already at its minimum) frames are analysed at `idle_hz`. The
+    first and last `edge_s` of YELLOW and RED are analysed at full rate, so
+    tracks and the display stay continuous across phase changes.
+
+    Idle frames still publish density, and the control loop treats density
+    older than `stale_after_s` as stale (with stale_policy "fixed" that
+    restores a reduced green to worst_case). So the idle period is clamped
+    to half of `stale_after_s`, leaving room for a slow frame.
+
+    The controller belongs to the control thread; this only reads its
+    fields, and a stale read costs at most one frame of the wrong rate.
+    """
+
+    def __init__(self, controller, window_frames: int = 150, source_fps: float = 30.0, lead_s: float = 1.0,
+                 idle_hz: float = 1.0, edge_s: float = 1.0, alpha: float = 0.1,
+                 stale_after_s: Optional[float] = None):
+        if idle_hz <= 0:
+            raise ValueError("idle_hz must be positive")
+        self.controller = controller
+        self.window_frames = max(1, int(window_frames))
+        self.lead_s = float(lead_s)
+        self.idle_period_s = 1.0 / float(idle_hz)
+        if stale_after_s is not None and self.idle_period_s > stale_after_s / 2:
+            print(f"Phase-aware scheduling: idle_hz {idle_hz:g} would let density go stale "
+                  f"(control.stale_after_s {stale_after_s:g}); using {2 / stale_after_s:g} Hz")
+            self.idle_period_s = stale_after_s / 2
+        self.edge_s = float(edge_s)
+        self.alpha = float(alpha)
+        self.s_per_frame = 1.0 / float(source_fps)   # wall seconds per source frame at full rate
+        self.full = True
+        self.run_frames = 0
+        self.skipped_frames = 0
+        self._last_run: Optional[float] = None
+        self._last_full: Optional[Tuple[float, int]] = None
+
+    def next_rule_time(self) -> Optional[float]:
+        """Clock time of the next rule evaluation that can change the green (None if none can)."""
+        c = self.controller
+        rules = c.rules
+        if c.phase == 'GREEN':
+            if c.green_total <= c.best_case + 1e-6:
+                return None  # reductions are bounded by best_case; nothing left to decide
+            when = max(c.phase_start_time + rules.warmup_s, c.last_rule_time + rules.rule_interval_s)
+            return when if when < c.phase_start_time + c.green_total else None
+        green_start = c.phase_start_time + (c.yellow_total + c.red_total if c.phase == 'YELLOW' else c.red_total)
+        return green_start + rules.warmup_s
+
+    def full_rate(self, now: float) -> bool:
+        c = self.controller
+        if c.phase != 'GREEN':
+            elapsed = now - c.phase_start_time
+            length = c.yellow_total if c.phase == 'YELLOW' else c.red_total
+            if elapsed < self.edge_s or elapsed > length - self.edge_s:
+                return True
+        next_rule = self.next_rule_time()
+        if next_rule is None:
+            return False
+        return now >= next_rule - self.window_frames * self.s_per_frame - self.lead_s
+
+    def should_run(self, now: float, position: int) -> bool:
+        """Whether to run inference on the frame at source position `position`."""
+        full = self.full_rate(now)
+        if full != self.full:
+            self.full = full
+            self._last_full = None
+        if full:
+            if self._last_full is not None:
+                last_now, last_pos = self._last_full
+                if position > last_pos:
+                    spf = (now - last_now) / (position - last_pos)
+                    self.s_per_frame += self.alpha * (spf - self.s_per_frame)
+            self._last_full = (now, position)
+            run = True
+        else:
+            run = self._last_run is None or now - self._last_run >= self.idle_period_s
+        if run:
+            self._last_run = now
+            self.run_frames += 1
+        else:
+            self.skipped_frames += 1
+        return run
+
+    def close(self):
+        total = self.run_frames + self.skipped_frames
+        if total:
+            print(f"Phase-aware scheduling: inference on {self.run_frames} of {total} frames "
+                  f"({self.run_frames / total:.0%})")
+
+
+def create_phase_scheduler(cfg: Optional[Dict], controller, window_frames: int, source_fps: float,
+                           stale_after_s: Optional[float] = None) -> Optional[PhaseAwareScheduler]:
+    """Build a phase-aware scheduler from the "phase_scheduler" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return None
+    return PhaseAwareScheduler(
+        controller,
+        window_frames=window_frames,
+        source_fps=source_fps,
+        lead_s=float(cfg.get("lead_s", 1.0)),
+        idle_hz=float(cfg.get("idle_hz", 1.0)),
+        edge_s=float(cfg.get("edge_s", 1.0)),
+        stale_after_s=stale_after_s,
+    )
+
+
+def create_scheduler(cfg: Optional[Dict], model_path: str, source_fps: float,
+                     base_dir: str) -> Optional[InferenceScheduler]:
+    """Build a scheduler from the "scheduler" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return None
+    models = [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in cfg.get("models", [])] or [model_path]
+    return InferenceScheduler(
+        models,
+        target_hz=float(cfg.get("target_hz", 5.0)),
+        source_fps=source_fps,
+        imgsz_levels=[int(s) for s in cfg.get("imgsz_levels", [640, 512, 416, 320])],
+        tier_costs=cfg.get("tier_costs"),
+        max_stride=int(cfg.get("max_stride", 30)),
+        alpha=float(cfg.get("alpha", 0.2)),
+        headroom=float(cfg.get("headroom", 0.8)),
+        min_dwell=int(cfg.get("min_dwell", 10)),
+        log_path=cfg.get("log_path"),
+    )
@@ -141,7 +141,8 @@ class KalmanBoxTracker(object):
     if(self.time_since_update>0):
       self.hit_streak = 0
     self.time_since_update += 1
-    self.history.append(convert_x_to_bbox(self.kf.x))
+    # Only the latest prediction is ever read; keep one instead of one per coasting frame
+    self.history = [convert_x_to_bbox(self.kf.x)]
     return self.history[-1]
 
   def get_state(self):
@@ -226,7 +227,7 @@ class Sort(object):
       trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
       if np.any(np.isnan(pos)):
         to_del.append(t)
-    trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
+    trks = trks[np.isfinite(trks).all(axis=1)]  # same rows as np.ma.compress_rows(masked_invalid), no masked arrays
     for t in reversed(to_del):
       self.trackers.pop(t)
     matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
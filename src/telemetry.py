@@ -0,0 +1,286 @@
+"""Buffered columnar telemetry for density, tracks and signal phases.
+
+The frame loop only writes scalars into preallocated NumPy column batches.
+Full (or stale) batches are handed to a background thread which converts
+them to Parquet files with polars and rotates files by row count and age;
+a file never spans a UTC midnight.
+
+Layout (one directory per table, partitioned by UTC day):
+
+  <dir>/frames/date=YYYY-MM-DD/<camera>-HHMMSS-<seq>.parquet
+  <dir>/tracks/date=YYYY-MM-DD/...
+  <dir>/phases/date=YYYY-MM-DD/...
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+SECONDS_PER_DAY = 86400
+
+PHASE_CODES = {'GREEN': 0, 'YELLOW': 1, 'RED': 2}
+PHASE_NAMES = {v: k for k, v in PHASE_CODES.items()}
+
+FRAME_SCHEMA = {
+    "ts": np.float64,
+    "frame": np.int64,
+    "density": np.float32,
+    "avg_density": np.float32,
+    "vehicles_in_polygon": np.int32,
+    "phase": np.int8,
+    "green_total": np.float32,
+    "remaining_green": np.float32,
+    "total_saved": np.float32,
+}
+
+TRACK_SCHEMA = {
+    "ts": np.float64,
+    "frame": np.int64,
+    "track_id": np.int64,
+    "x1": np.float32,
+    "y1": np.float32,
+    "x2": np.float32,
+    "y2": np.float32,
+    "in_polygon": np.bool_,
+}
+
+# Phase transitions: one row each time the controller enters a phase
+PHASE_SCHEMA = {
+    "ts": np.float64,
+    "phase": np.int8,
+    "green_total": np.float32,
+    "worst_case": np.float32,
+    "total_saved": np.float32,
+}
+
+
+class ColumnBatch:
+    """Fixed-capacity set of NumPy columns filled row by row."""
+
+    def __init__(self, table: str, schema: Dict[str, type], capacity: int):
+        self.table = table
+        self.capacity = capacity
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in schema.items()}
+        self._cols = list(self.columns.values())
+        self.n = 0
+        self.started = 0.0
+
+    def append(self, *values):
+        i = self.n
+        for col, v in zip(self._cols, values):
+            col[i] = v
+        self.n = i + 1
+
+    def free(self) -> int:
+        return self.capacity - self.n
+
+    def reset(self):
+        self.n = 0
+        self.started = time.monotonic()
+
+
+class _Table:
+    """Batch pool and pending file data for one telemetry table."""
+
+    def __init__(self, name: str, schema: Dict[str, type], capacity: int, pool_size: int, max_batches: int):
+        self.name = name
+        self.schema = schema
+        self.capacity = capacity
+        self.max_batches = max_batches
+        self.allocated = pool_size
+        self.pool: "queue.SimpleQueue[ColumnBatch]" = queue.SimpleQueue()
+        for _ in range(pool_size):
+            self.pool.put(ColumnBatch(name, schema, capacity))
+        self.current: Optional[ColumnBatch] = self._take()
+        # Writer-thread state
+        self.frames: List["pl.DataFrame"] = []
+        self.rows = 0
+        self.file_started = time.monotonic()
+
+    def _take(self) -> Optional[ColumnBatch]:
+        try:
+            batch = self.pool.get_nowait()
+        except queue.Empty:
+            # Writer is behind: grow the pool a little, then start dropping
+            if self.allocated >= self.max_batches:
+                return None
+            self.allocated += 1
+            batch = ColumnBatch(self.name, self.schema, self.capacity)
+        batch.reset()
+        return batch
+
+
+class TelemetryWriter:
+    """Collects per-frame telemetry and writes rotated Parquet files off-thread."""
+
+    def __init__(self, directory: str, camera_id: str = "cam0", batch_rows: int = 4096,
+                 flush_interval_s: float = 5.0, rotate_rows: int = 500_000, rotate_s: float = 600.0,
+                 pool_size: int = 4):
+        if pl is None:
+            raise RuntimeError("polars is not installed")
+        self.directory = directory
+        self.camera_id = camera_id
+        self.flush_interval_s = flush_interval_s
+        self.rotate_rows = rotate_rows
+        self.rotate_s = rotate_s
+        self.dropped_rows = 0
+        self._seq = 0
+        self._tables = {
+            "frames": _Table("frames", FRAME_SCHEMA, batch_rows, pool_size, pool_size * 4),
+            "tracks": _Table("tracks", TRACK_SCHEMA, batch_rows * 8, pool_size, pool_size * 4),
+            "phases": _Table("phases", PHASE_SCHEMA, 256, 2, 8),
+        }
+        self._frames = self._tables["frames"]
+        self._tracks = self._tables["tracks"]
+        self._phases = self._tables["phases"]
+        self._queue: "queue.Queue[Optional[ColumnBatch]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+
+    # ---- hot path -------------------------------------------------------
+
+    def _batch_for(self, table: _Table, rows: int) -> Optional[ColumnBatch]:
+        batch = table.current
+        if batch is not None and (batch.free() < rows or
+                                  (batch.n and time.monotonic() - batch.started >= self.flush_interval_s)):
+            self._queue.put(batch)
+            batch = table.current = table._take()
+        elif batch is None:
+            batch = table.current = table._take()
+        return batch
+
+    def log_frame(self, ts: float, frame: int, density: float, avg_density: float, vehicles_in_polygon: int,
+                  phase: str, green_total: float, remaining_green: float, total_saved: float):
+        batch = self._batch_for(self._frames, 1)
+        if batch is None:
+            self.dropped_rows += 1
+            return
+        batch.append(ts, frame, density, avg_density, vehicles_in_polygon,
+                     PHASE_CODES.get(phase, -1), green_total, remaining_green, total_saved)
+
+    def log_tracks(self, ts: float, frame: int, tracks: np.ndarray, in_polygon: Sequence[bool]):
+        """Record SORT output rows [x1,y1,x2,y2,id] with their in-polygon flags."""
+        k = len(tracks)
+        if k == 0:
+            return
+        batch = self._batch_for(self._tracks, k)
+        if batch is None or batch.free() < k:
+            self.dropped_rows += k
+            return
+        i, j = batch.n, batch.n + k
+        c = batch.columns
+        c["ts"][i:j] = ts
+        c["frame"][i:j] = frame
+        c["track_id"][i:j] = tracks[:, 4]
+        c["x1"][i:j] = tracks[:, 0]
+        c["y1"][i:j] = tracks[:, 1]
+        c["x2"][i:j] = tracks[:, 2]
+        c["y2"][i:j] = tracks[:, 3]
+        c["in_polygon"][i:j] = in_polygon
+        batch.n = j
+
+    def log_phase(self, ts: float, phase: str, green_total: float, worst_case: float, total_saved: float):
+        batch = self._batch_for(self._phases, 1)
+        if batch is None:
+            self.dropped_rows += 1
+            return
+        batch.append(ts, PHASE_CODES.get(phase, -1), green_total, worst_case, total_saved)
+
+    @property
+    def queue_depth(self) -> int:
+        """Full batches waiting for the writer thread."""
+        return self._queue.qsize()
+
+    # ---- writer thread --------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                batch = None
+            else:
+                if batch is None:
+                    break
+                self._absorb(batch)
+            self._rotate_due(force=False)
+        self._rotate_due(force=True)
+
+    def _absorb(self, batch: ColumnBatch):
+        table = self._tables[batch.table]
+        if batch.n:
+            df = pl.DataFrame({name: col[:batch.n].copy() for name, col in batch.columns.items()})
+            if not table.frames:
+                table.file_started = time.monotonic()
+            table.frames.append(df)
+            table.rows += batch.n
+        batch.reset()
+        table.pool.put(batch)
+
+    def _rotate_due(self, force: bool):
+        now = time.monotonic()
+        for table in self._tables.values():
+            if not table.frames:
+                continue
+            if force or table.rows >= self.rotate_rows or now - table.file_started >= self.rotate_s:
+                self._write_file(table)
+
+    def _write_file(self, table: _Table):
+        df = pl.concat(table.frames).with_columns(pl.lit(self.camera_id).cast(pl.Categorical).alias("camera"))
+        table.frames = []
+        table.rows = 0
+        # One file per UTC day, so rows after midnight go to the next day's partition
+        day = (pl.col("ts") // SECONDS_PER_DAY).cast(pl.Int64).alias("_day")
+        for part in df.with_columns(day).partition_by("_day", maintain_order=True, include_key=False):
+            self._write_part(table.name, part)
+
+    def _write_part(self, name: str, df: "pl.DataFrame"):
+        start = datetime.fromtimestamp(float(df["ts"][0]), tz=timezone.utc)
+        folder = os.path.join(self.directory, name, f"date={start:%Y-%m-%d}")
+        os.makedirs(folder, exist_ok=True)
+        self._seq += 1
+        path = os.path.join(folder, f"{self.camera_id}-{start:%H%M%S}-{self._seq:05d}.parquet")
+        try:
+            df.write_parquet(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"Telemetry write failed for {path}: {e}")
+
+    def close(self):
+        """Hand over partial batches and wait for the writer to finish."""
+        for table in self._tables.values():
+            if table.current is not None and table.current.n:
+                self._queue.put(table.current)
+                table.current = None
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped_rows:
+            print(f"Telemetry dropped {self.dropped_rows} rows (writer could not keep up)")
+
+
+def create_telemetry(cfg: Optional[Dict], base_dir: str) -> Optional[TelemetryWriter]:
+    """Build a writer from the "telemetry" config section (disabled by default)."""
+    cfg = cfg if isinstance(cfg, dict) else {}
+    if not cfg.get("enabled", False):
+        return None
+    if pl is None:
+        print("polars not installed; telemetry logging disabled.")
+        return None
+    directory = cfg.get("dir", os.path.join(base_dir, "logs", "telemetry"))
+    return TelemetryWriter(
+        directory,
+        camera_id=str(cfg.get("camera_id", "cam0")),
+        batch_rows=int(cfg.get("batch_rows", 4096)),
+        flush_interval_s=float(cfg.get("flush_interval_s", 5.0)),
+        rotate_rows=int(cfg.get("rotate_rows", 500_000)),
+        rotate_s=float(cfg.get("rotate_s", 600.0)),
+    )